@@ -0,0 +1,374 @@
+"""
+Recepción de archivos adjuntos de eventos clínicos.
+
+AdjuntoUploadHandler (configurado en FILE_UPLOAD_HANDLERS) procesa los campos de adjuntos
+mientras el archivo se recibe: rechaza la extensión apenas llega el nombre y deja de
+escribir en cuanto el archivo supera ArchivoAdjunto.TAMANO_MAXIMO, en vez de esperar a
+que Django lo reciba completo. Los bytes aceptados van directo a un archivo temporal (nunca
+a memoria) y se calcula su SHA-256 en el mismo recorrido; al guardar, el storage de
+archivos mueve el temporal a su ubicación final. Un archivo rechazado llega a la vista
+como ArchivoRechazado con el motivo.
+
+Las vistas usan adjuntos_validos() para obtener los archivos aceptados (y mostrar los
+errores) y guardar_adjuntos() para asociarlos al evento.
+
+El contenido se guarda una sola vez por hash (ContenidoArchivo, en adjuntos/<xx>/<hash>):
+subir el mismo PDF a varios eventos o mascotas crea varios ArchivoAdjunto que apuntan al
+mismo archivo. Cada contenido lleva la cuenta de sus referencias y desde cuándo no tiene
+ninguna; el comando recolectar_adjuntos elimina los que llevan un tiempo sin referencias (y
+migra los adjuntos anteriores). Una subida reserva los contenidos que reutiliza (les suma sus
+referencias) antes de leerlos, y la recolección vuelve a comprobar al eliminar que el
+contenido sigue sin referencias ni adjuntos. Los archivos que una subida guardó y cuya
+transacción se revirtió se eliminan al fallar, y el comando elimina además los archivos de
+adjuntos/ que llevan ese tiempo sin ningún registro que los use.
+"""
+
+import hashlib
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib import messages
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DateTimeField, Exists, F, IntegerField, OuterRef, ProtectedError, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import LessThanOrEqual
+from django.utils import timezone
+
+from .busqueda import indexar_evento_por_id
+from .models import ArchivoAdjunto, ContenidoArchivo
+from .vistas_mascota import invalidar_vistas_ficha
+
+
+# Campos de los formularios que reciben adjuntos de eventos
+CAMPOS_ADJUNTOS = ('archivos', 'archivos_ficha')
+
+CARPETA_CONTENIDOS = 'adjuntos'
+
+# Tiempo que un contenido debe llevar sin referencias antes de eliminarlo
+ANTIGUEDAD_MINIMA_RECOLECCION = timedelta(hours=1)
+
+
+def extension_archivo(nombre):
+    return nombre.split('.')[-1].lower() if '.' in nombre else ''
+
+
+def mensaje_formato_no_permitido(nombre):
+    formatos_str = ', '.join(ArchivoAdjunto.FORMATOS_PERMITIDOS)
+    return f'El archivo "{nombre}" tiene un formato no permitido. Formatos permitidos: {formatos_str}'
+
+
+def mensaje_tamano_excedido(nombre):
+    tamano_mb = ArchivoAdjunto.TAMANO_MAXIMO / (1024 * 1024)
+    return f'El archivo "{nombre}" excede el tamaño máximo permitido ({tamano_mb}MB)'
+
+
+def motivo_rechazo(nombre, tamano=None):
+    """Mensaje de error si el archivo no puede adjuntarse, o None si es válido"""
+    if extension_archivo(nombre) not in ArchivoAdjunto.FORMATOS_PERMITIDOS:
+        return mensaje_formato_no_permitido(nombre)
+    if tamano is not None and tamano > ArchivoAdjunto.TAMANO_MAXIMO:
+        return mensaje_tamano_excedido(nombre)
+    return None
+
+
+class ArchivoRechazado(UploadedFile):
+    """Adjunto descartado durante la subida; no tiene contenido, solo el tamaño recibido y el motivo"""
+
+    def __init__(self, name, motivo, size, content_type=None):
+        super().__init__(file=None, name=name, content_type=content_type, size=size)
+        self.motivo = motivo
+
+
+class AdjuntoUploadHandler(FileUploadHandler):
+    """
+    Recibe los campos de CAMPOS_ADJUNTOS validando formato y tamaño por chunk.
+    Los demás archivos (fotos, etc.) siguen a los handlers por defecto.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.activo = field_name in CAMPOS_ADJUNTOS
+        if not self.activo:
+            return
+        # content_length solo viene si el cliente declara el tamaño de la parte
+        self.motivo = motivo_rechazo(file_name, content_length)
+        self.archivo = None
+        self.hash = None
+        if self.motivo is None:
+            self.archivo = TemporaryUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+            self.hash = hashlib.sha256()
+        # Este handler se hace cargo del archivo completo (aceptado o descartado)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activo:
+            return raw_data
+        if self.archivo is None:
+            return None
+        if start + len(raw_data) > ArchivoAdjunto.TAMANO_MAXIMO:
+            # Se deja de escribir; el resto del archivo se lee y se descarta
+            self._descartar(mensaje_tamano_excedido(self.file_name))
+            return None
+        self.archivo.write(raw_data)
+        self.hash.update(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.activo:
+            return None
+        if self.archivo is None:
+            return ArchivoRechazado(self.file_name, self.motivo, file_size, self.content_type)
+        self.archivo.seek(0)
+        self.archivo.size = file_size
+        self.archivo.sha256 = self.hash.hexdigest()
+        return self.archivo
+
+    def upload_interrupted(self):
+        if getattr(self, 'activo', False) and self.archivo is not None:
+            self._descartar(None)
+
+    def _descartar(self, motivo):
+        # Cerrar el temporal lo elimina del disco
+        self.archivo.close()
+        self.archivo = None
+        self.motivo = motivo
+
+
+def adjuntos_validos(request, campo='archivos'):
+    """
+    Archivos del campo que pueden adjuntarse. Agrega un mensaje de error por cada archivo
+    rechazado (por el handler o, si no pasó por él, validando aquí).
+    """
+    validos = []
+    for archivo in request.FILES.getlist(campo):
+        if isinstance(archivo, ArchivoRechazado):
+            motivo = archivo.motivo
+        else:
+            motivo = motivo_rechazo(archivo.name, archivo.size)
+        if motivo:
+            messages.error(request, motivo)
+        else:
+            validos.append(archivo)
+    return validos
+
+
+def _sha256_archivo(archivo):
+    """Hash calculado por el handler o, si el archivo no pasó por él, leyéndolo por chunks"""
+    if not getattr(archivo, 'sha256', None):
+        hash_archivo = hashlib.sha256()
+        for chunk in archivo.chunks():
+            hash_archivo.update(chunk)
+        archivo.seek(0)
+        archivo.sha256 = hash_archivo.hexdigest()
+    return archivo.sha256
+
+
+def ruta_contenido(sha256, extension):
+    sufijo = f'.{extension}' if extension else ''
+    return f'{CARPETA_CONTENIDOS}/{sha256[:2]}/{sha256}{sufijo}'
+
+
+def _storage_contenidos():
+    return ContenidoArchivo._meta.get_field('archivo').storage
+
+
+def _sumar_referencias(cantidades, campo='pk'):
+    """
+    Suma (o resta, sin bajar de cero) referencias a los contenidos en un solo UPDATE;
+    cantidades es {valor de `campo`: n}. Marca desde cuándo quedan sin referencias los que
+    llegan a cero y desmarca los demás.
+    """
+    if not cantidades:
+        return
+    delta = Case(
+        *[When(**{campo: valor}, then=Value(n)) for valor, n in cantidades.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    ContenidoArchivo.objects.filter(**{f'{campo}__in': list(cantidades)}).update(
+        referencias=Greatest(F('referencias') + delta, Value(0), output_field=IntegerField()),
+        sin_referencias_desde=Case(
+            When(
+                LessThanOrEqual(F('referencias') + delta, 0),
+                then=Coalesce('sin_referencias_desde', Value(timezone.now())),
+            ),
+            default=Value(None),
+            output_field=DateTimeField(),
+        ),
+    )
+
+
+def liberar_contenidos(contenido_ids):
+    """Descuenta una referencia por cada id (los repetidos descuentan varias)"""
+    _sumar_referencias({pk: -n for pk, n in Counter(contenido_ids).items()})
+
+
+def reservar_contenidos(archivos, guardados=None):
+    """
+    Retorna {sha256: ContenidoArchivo} para los archivos y suma a cada contenido una
+    referencia por archivo. Los contenidos existentes se reservan antes de leerlos, así la
+    recolección ya no puede eliminarlos; los que faltan se guardan en el storage y se crean.
+    Debe llamarse dentro de una transacción; las rutas guardadas se agregan a `guardados`
+    para eliminarlas si se revierte.
+    """
+    cantidades = Counter()
+    por_hash = {}
+    for archivo in archivos:
+        sha256 = _sha256_archivo(archivo)
+        cantidades[sha256] += 1
+        por_hash.setdefault(sha256, archivo)
+    _sumar_referencias(cantidades, campo='sha256')
+    contenidos = ContenidoArchivo.objects.in_bulk(list(por_hash), field_name='sha256')
+
+    faltantes = {sha256: n for sha256, n in cantidades.items() if sha256 not in contenidos}
+    if not faltantes:
+        return contenidos
+    storage = _storage_contenidos()
+    rutas = {}
+    for sha256 in faltantes:
+        archivo = por_hash[sha256]
+        # Siempre en un archivo nuevo: el que ya esté en la ruta puede ser de un contenido
+        # que la recolección está eliminando
+        rutas[sha256] = storage.save(ruta_contenido(sha256, extension_archivo(archivo.name)), archivo)
+        if guardados is not None:
+            guardados.append(rutas[sha256])
+    ContenidoArchivo.objects.bulk_create(
+        [ContenidoArchivo(sha256=sha256, archivo=ruta, tamano=por_hash[sha256].size) for sha256, ruta in rutas.items()],
+        ignore_conflicts=True,
+    )
+    _sumar_referencias(faltantes, campo='sha256')
+    contenidos = ContenidoArchivo.objects.in_bulk(list(por_hash), field_name='sha256')
+    for sha256, ruta in rutas.items():
+        # Otra subida simultánea creó el mismo contenido: se usa el que quedó registrado
+        if contenidos[sha256].archivo.name != ruta:
+            storage.delete(ruta)
+    return contenidos
+
+
+def guardar_adjuntos(evento, archivos):
+    """
+    Crea los ArchivoAdjunto del evento en un solo INSERT, reutilizando los contenidos ya
+    guardados, y reindexa el evento una vez.
+    """
+    if not archivos:
+        return []
+    hashes = [_sha256_archivo(archivo) for archivo in archivos]
+    guardados = []
+    try:
+        with transaction.atomic():
+            contenidos = reservar_contenidos(archivos, guardados)
+            adjuntos = ArchivoAdjunto.objects.bulk_create([
+                ArchivoAdjunto(
+                    evento_clinico=evento,
+                    nombre=archivo.name,
+                    archivo=contenidos[sha256].archivo.name,
+                    tipo_archivo=extension_archivo(archivo.name),
+                    tamano=archivo.size,
+                    sha256=sha256,
+                    contenido=contenidos[sha256],
+                )
+                for archivo, sha256 in zip(archivos, hashes)
+            ])
+    except Exception:
+        # Sin sus filas, los archivos recién guardados quedarían huérfanos en el storage
+        storage = _storage_contenidos()
+        for ruta in guardados:
+            storage.delete(ruta)
+        raise
+    # bulk_create no emite post_save: el índice de búsqueda y las vistas de la mascota se actualizan aquí
+    indexar_evento_por_id(evento.pk)
+    invalidar_vistas_ficha(evento.ficha_clinica_id)
+    return adjuntos
+
+
+def migrar_adjuntos_anteriores():
+    """
+    Asocia los adjuntos sin contenido (anteriores al almacenamiento por hash) a su
+    ContenidoArchivo. El primer archivo de cada hash pasa a ser el contenido y las copias
+    se eliminan del storage. Retorna (migrados, copias_eliminadas).
+    """
+    storage = ArchivoAdjunto._meta.get_field('archivo').storage
+    migrados = eliminados = 0
+    for adjunto in ArchivoAdjunto.objects.filter(contenido__isnull=True).exclude(archivo='').iterator():
+        try:
+            sha256 = adjunto.sha256 or _sha256_archivo(adjunto.archivo)
+        except OSError:
+            # El archivo ya no existe en el storage
+            continue
+        finally:
+            adjunto.archivo.close()
+
+        with transaction.atomic():
+            contenido, creado = ContenidoArchivo.objects.get_or_create(
+                sha256=sha256,
+                defaults={'archivo': adjunto.archivo.name, 'tamano': adjunto.tamano},
+            )
+            copia = None if creado or contenido.archivo.name == adjunto.archivo.name else adjunto.archivo.name
+            ArchivoAdjunto.objects.filter(pk=adjunto.pk).update(
+                contenido=contenido, sha256=sha256, archivo=contenido.archivo.name
+            )
+            _sumar_referencias({contenido.pk: 1})
+        migrados += 1
+        if copia and not ArchivoAdjunto.objects.filter(archivo=copia).exists():
+            storage.delete(copia)
+            eliminados += 1
+    return migrados, eliminados
+
+
+def recolectar_contenidos(antiguedad=ANTIGUEDAD_MINIMA_RECOLECCION, ahora=None):
+    """Elimina los contenidos que llevan `antiguedad` sin referencias y retorna (cantidad, bytes)"""
+    ahora = ahora or timezone.now()
+    referenciados = ArchivoAdjunto.objects.filter(contenido=OuterRef('pk'))
+    sin_uso = ContenidoArchivo.objects.filter(referencias=0).exclude(Exists(referenciados))
+    candidatos = sin_uso.filter(sin_referencias_desde__lt=ahora - antiguedad)
+
+    storage = _storage_contenidos()
+    cantidad = liberados = 0
+    for contenido in candidatos.iterator():
+        try:
+            with transaction.atomic():
+                # Se bloquea y se vuelve a comprobar por si una subida lo reservó entre tanto
+                bloqueado = list(sin_uso.select_for_update().filter(pk=contenido.pk).values_list('pk', flat=True))
+                eliminados, _ = sin_uso.filter(pk__in=bloqueado).delete() if bloqueado else (0, {})
+        except (ProtectedError, IntegrityError):
+            # Una subida simultánea ya le asoció un adjunto
+            continue
+        if not eliminados:
+            continue
+        storage.delete(contenido.archivo.name)
+        cantidad += 1
+        liberados += contenido.tamano
+    return cantidad, liberados
+
+
+def recolectar_archivos_huerfanos(antiguedad=ANTIGUEDAD_MINIMA_RECOLECCION, ahora=None):
+    """
+    Elimina los archivos de CARPETA_CONTENIDOS que ningún contenido ni adjunto usa y que se
+    guardaron antes de `antiguedad` (por ejemplo, de una subida cuya transacción se revirtió).
+    Retorna (cantidad, bytes).
+    """
+    ahora = ahora or timezone.now()
+    storage = _storage_contenidos()
+    try:
+        carpetas, _ = storage.listdir(CARPETA_CONTENIDOS)
+    except FileNotFoundError:
+        return 0, 0
+
+    cantidad = liberados = 0
+    for carpeta in carpetas:
+        _, nombres = storage.listdir(f'{CARPETA_CONTENIDOS}/{carpeta}')
+        rutas = {f'{CARPETA_CONTENIDOS}/{carpeta}/{nombre}' for nombre in nombres}
+        if not rutas:
+            continue
+        usadas = set(ContenidoArchivo.objects.filter(archivo__in=rutas).values_list('archivo', flat=True))
+        usadas.update(ArchivoAdjunto.objects.filter(archivo__in=rutas).values_list('archivo', flat=True))
+        for ruta in sorted(rutas - usadas):
+            # Uno reciente puede ser de una subida cuya transacción aún no se confirma
+            if storage.get_modified_time(ruta) >= ahora - antiguedad:
+                continue
+            liberados += storage.size(ruta)
+            storage.delete(ruta)
+            cantidad += 1
+    return cantidad, liberados
@@ -1,5 +1,45 @@
+from django import forms
 from django.contrib import admin
-from .models import PerfilTutor, Mascota, PesoMascota, FichaClinica, EventoClinico, HistorialFichaClinica, ArchivoAdjunto
+from django.db import IntegrityError
+from .models import PerfilTutor, Mascota, PesoMascota, FichaClinica, EventoClinico, HistorialFichaClinica, ArchivoAdjunto, ContenidoArchivo, Vacunacion, Recordatorio, Microchip
+from .historial import CAMPOS_DELTA, eliminar_revision
+from .microchips import asignar_microchip, microchip_en_uso, validar_microchip
+
+
+MENSAJE_MICROCHIP_EN_USO = 'Este microchip ya está registrado en otra mascota.'
+
+
+class MascotaAdminForm(forms.ModelForm):
+    class Meta:
+        model = Mascota
+        fields = '__all__'
+
+    def clean_microchip(self):
+        microchip = validar_microchip(self.cleaned_data.get('microchip'))
+        if microchip_en_uso(microchip, self.instance.pk):
+            raise forms.ValidationError(MENSAJE_MICROCHIP_EN_USO)
+        return microchip or None
+
+
+class FichaClinicaAdminForm(forms.ModelForm):
+    class Meta:
+        model = FichaClinica
+        fields = '__all__'
+
+    def clean_microchip(self):
+        microchip = validar_microchip(self.cleaned_data.get('microchip'))
+        mascota = self.cleaned_data.get('mascota')
+        if microchip_en_uso(microchip, mascota.pk if mascota else self.instance.mascota_id):
+            raise forms.ValidationError(MENSAJE_MICROCHIP_EN_USO)
+        return microchip or None
+
+
+def _asignar_microchip_admin(mascota, microchip, ficha=None):
+    # El registro Microchip es la fuente de verdad: el cambio pasa por asignar_microchip, que
+    # actualiza el registro y las copias de la mascota y de la ficha (la validación del
+    # formulario puede perder contra otro guardado simultáneo: se revierte todo el guardado)
+    if not asignar_microchip(mascota, microchip, ficha):
+        raise IntegrityError(MENSAJE_MICROCHIP_EN_USO)
 
 
 @admin.register(PerfilTutor)
@@ -38,6 +78,18 @@ class MascotaAdmin(admin.ModelAdmin):
     search_fields = ('nombre', 'raza', 'tutor__username', 'tutor__email')
     autocomplete_fields = ('tutor',)
     readonly_fields = ('fecha_creacion', 'fecha_actualizacion')
+    form = MascotaAdminForm
+
+    def save_model(self, request, obj, form, change):
+        microchip = obj.microchip
+        if change and 'microchip' in form.changed_data:
+            # Se guarda con el identificador anterior y el nuevo se asigna después
+            obj.microchip = form.initial.get('microchip')
+            super().save_model(request, obj, form, change)
+            _asignar_microchip_admin(obj, microchip)
+        else:
+            # Una mascota nueva se registra en registrar_microchip_mascota (models.py)
+            super().save_model(request, obj, form, change)
 
 
 @admin.register(PesoMascota)
@@ -53,6 +105,15 @@ class FichaClinicaAdmin(admin.ModelAdmin):
     list_display = ('mascota', 'esterilizado', 'microchip', 'creado_en')
     search_fields = ('mascota__nombre', 'microchip', 'alergias')
     list_filter = ('esterilizado',)
+    form = FichaClinicaAdminForm
+
+    def save_model(self, request, obj, form, change):
+        microchip = obj.microchip
+        if change:
+            obj.microchip = form.initial.get('microchip')
+        super().save_model(request, obj, form, change)
+        if (microchip or '') != (obj.mascota.microchip or ''):
+            _asignar_microchip_admin(obj.mascota, microchip, obj)
 
 
 @admin.register(EventoClinico)
@@ -65,11 +126,25 @@ class EventoClinicoAdmin(admin.ModelAdmin):
 
 @admin.register(HistorialFichaClinica)
 class HistorialFichaClinicaAdmin(admin.ModelAdmin):
-    list_display = ('ficha_clinica', 'peso', 'temperatura', 'creado_en')
-    list_filter = ('creado_en',)
+    list_display = ('ficha_clinica', 'peso', 'temperatura', 'es_keyframe', 'creado_en')
+    list_filter = ('es_keyframe', 'creado_en')
     search_fields = ('ficha_clinica__mascota__nombre',)
     date_hierarchy = 'creado_en'
     readonly_fields = ('creado_en',)
+    
+    def get_readonly_fields(self, request, obj=None):
+        # En una diferencia los campos de texto no guardados se reconstruyen desde revisiones anteriores
+        if obj is not None and not obj.es_keyframe:
+            return self.readonly_fields + CAMPOS_DELTA
+        return self.readonly_fields
+    
+    def delete_model(self, request, obj):
+        eliminar_revision(obj)
+    
+    def delete_queryset(self, request, queryset):
+        # De la más reciente a la más antigua, para traspasar cada diferencia a una revisión que se conserva
+        for registro in queryset.order_by('-id'):
+            eliminar_revision(registro)
 
 
 @admin.register(ArchivoAdjunto)
@@ -78,4 +153,49 @@ class ArchivoAdjuntoAdmin(admin.ModelAdmin):
     list_filter = ('tipo_archivo', 'fecha_subida')
     search_fields = ('nombre', 'evento_clinico__ficha_clinica__mascota__nombre')
     date_hierarchy = 'fecha_subida'
-    readonly_fields = ('fecha_subida', 'tamano')
+    # El archivo es un contenido compartido: se reemplaza subiendo un adjunto nuevo, no editándolo
+    readonly_fields = ('archivo', 'fecha_subida', 'tamano', 'sha256', 'contenido')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ContenidoArchivo)
+class ContenidoArchivoAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'archivo', 'tamano', 'referencias', 'sin_referencias_desde', 'creado_en')
+    search_fields = ('sha256',)
+    readonly_fields = ('sha256', 'archivo', 'tamano', 'referencias', 'sin_referencias_desde', 'creado_en')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Vacunacion)
+class VacunacionAdmin(admin.ModelAdmin):
+    list_display = ('ficha_clinica', 'vacuna', 'fecha_aplicacion', 'proxima_dosis', 'lote', 'veterinario')
+    list_filter = ('proxima_dosis', 'fecha_aplicacion')
+    search_fields = ('ficha_clinica__mascota__nombre', 'vacuna', 'lote', 'veterinario')
+    date_hierarchy = 'proxima_dosis'
+    raw_id_fields = ('ficha_clinica', 'evento_clinico')
+    readonly_fields = ('creado_en',)
+
+
+@admin.register(Recordatorio)
+class RecordatorioAdmin(admin.ModelAdmin):
+    list_display = ('asunto', 'tutor', 'vence_en', 'estado', 'intentos', 'enviado_en')
+    list_filter = ('estado', 'vence_en')
+    search_fields = ('asunto', 'tutor__email', 'mascota__nombre')
+    date_hierarchy = 'vence_en'
+    raw_id_fields = ('tutor', 'mascota', 'evento_clinico')
+    readonly_fields = ('intentos', 'bloqueado_hasta', 'enviado_en', 'error', 'creado_en')
+
+
+@admin.register(Microchip)
+class MicrochipAdmin(admin.ModelAdmin):
+    list_display = ('codigo', 'mascota', 'actualizado_en')
+    search_fields = ('codigo', 'mascota__nombre', 'mascota__tutor__email')
+    # Los microchips se cambian desde la mascota o su ficha, que mantienen las copias al día
+    readonly_fields = ('codigo', 'mascota', 'actualizado_en')
+
+    def has_add_permission(self, request):
+        return False
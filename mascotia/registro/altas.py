@@ -0,0 +1,105 @@
+"""
+Alta de tutores y mascotas junto con su fila 1:1 (PerfilTutor y FichaClinica).
+
+crear_tutor() y crear_mascota() crean ambas filas en una transacción, con un INSERT cada
+una y sin el SELECT previo de get_or_create; crear_mascotas() hace lo mismo en bloque.
+La ficha nueva se inserta con sus métricas de salud ya calculadas (está vacía), así que
+no hace falta que las señales de FichaClinica la vuelvan a leer.
+
+Las señales crear_perfil_tutor y crear_ficha_clinica de models.py quedan para las altas
+que no pasan por aquí (admin, createsuperuser, shell). No se ejecutan al cargar fixtures,
+que traen sus propias filas, ni dentro de sin_altas_automaticas().
+
+Como todo usuario tiene su perfil y toda mascota su ficha (la migración 0028 completó las
+que faltaban), las vistas las obtienen con get() o select_related en vez de get_or_create.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .context_processors import invalidar_mascotas_usuario
+from .microchips import registrar_microchips
+from .models import FichaClinica, Mascota, PerfilTutor
+from .salud import calcular_salud_score
+
+
+_altas_automaticas = ContextVar('altas_automaticas', default=True)
+
+
+@contextmanager
+def sin_altas_automaticas():
+    """Desactiva la creación del perfil y la ficha desde las señales (para quien las crea por su cuenta)"""
+    token = _altas_automaticas.set(False)
+    try:
+        yield
+    finally:
+        _altas_automaticas.reset(token)
+
+
+def altas_automaticas_activas():
+    return _altas_automaticas.get()
+
+
+def microchip_provisorio(mascota_id):
+    """Identificador que se muestra mientras la mascota no tiene un microchip registrado"""
+    return f'M{mascota_id:06d}'
+
+
+def crear_tutor(username, password, **campos):
+    """Crea el usuario y su PerfilTutor en una transacción y retorna el usuario (con el perfil ya cargado)"""
+    with transaction.atomic(), sin_altas_automaticas():
+        user = User.objects.create_user(username, password=password, **campos)
+        user.perfil_tutor = PerfilTutor.objects.create(user=user)
+    return user
+
+
+def _ficha_nueva(mascota, hoy):
+    ficha = FichaClinica(
+        mascota=mascota,
+        microchip=mascota.microchip,
+        eventos_recientes=0,
+        metricas_calculadas_en=hoy,
+    )
+    ficha.salud_score = calcular_salud_score(ficha, 0)
+    return ficha
+
+
+def crear_mascota(mascota, con_microchip_provisorio=False):
+    """
+    Guarda la mascota (sin guardar aún) y crea su ficha clínica en una transacción.
+    Con con_microchip_provisorio, una mascota sin microchip recibe microchip_provisorio().
+    Retorna la ficha.
+    """
+    with transaction.atomic(), sin_altas_automaticas():
+        mascota.save()
+        if con_microchip_provisorio and not (mascota.microchip or '').strip():
+            mascota.microchip = microchip_provisorio(mascota.pk)
+            Mascota.objects.filter(pk=mascota.pk).update(microchip=mascota.microchip)
+        # bulk_create: la ficha vacía no necesita las señales de series de peso ni de métricas
+        ficha, = FichaClinica.objects.bulk_create([_ficha_nueva(mascota, timezone.now().date())])
+    mascota.ficha_clinica = ficha
+    return ficha
+
+
+def crear_mascotas(mascotas):
+    """
+    Crea en bloque las mascotas (sin guardar aún), sus fichas clínicas y el registro de sus
+    microchips, con un bulk_create por modelo. No emite señales: el caché del menú de mascotas de cada tutor se invalida
+    aquí, al confirmar la transacción. Retorna las fichas, en el mismo orden.
+    """
+    if not mascotas:
+        return []
+    hoy = timezone.now().date()
+    with transaction.atomic():
+        Mascota.objects.bulk_create(mascotas)
+        fichas = FichaClinica.objects.bulk_create([_ficha_nueva(mascota, hoy) for mascota in mascotas])
+        registrar_microchips(mascotas)
+        for mascota, ficha in zip(mascotas, fichas):
+            mascota.ficha_clinica = ficha
+        for tutor_id in {mascota.tutor_id for mascota in mascotas}:
+            transaction.on_commit(lambda tutor_id=tutor_id: invalidar_mascotas_usuario(tutor_id))
+    return fichas
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class RegistroConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mascotia.registro'
+
+    def ready(self):
+        from .esquema import limpiar_registro_esquema
+        # Las columnas disponibles pueden cambiar después de migrar
+        post_migrate.connect(limpiar_registro_esquema, dispatch_uid='registro_limpiar_esquema')
+
+        from .vistas_mascota import revisar_cache_compartido
+        checks.register(revisar_cache_compartido, checks.Tags.caches)
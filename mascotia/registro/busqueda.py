@@ -0,0 +1,441 @@
+"""
+Índice de búsqueda de texto completo sobre el historial clínico.
+
+Hay dos índices, uno por fuente:
+- eventos clínicos: descripcion, diagnostico, veterinario, medicacion, consideraciones
+  y los nombres de sus archivos adjuntos;
+- registros históricos de la ficha (HistorialFichaClinica): vacuna, alergias,
+  condiciones crónicas, medicamentos, enfermedades y comentarios.
+
+En SQLite cada índice es una tabla virtual FTS5 (rowid = id del objeto) con el tokenizador
+unicode61, que ignora mayúsculas y tildes, y los resultados se ordenan con bm25.
+En PostgreSQL es una tabla con un tsvector en configuración 'spanish' (con stemming) e índice
+GIN; las tildes se pliegan con translate() y los resultados se ordenan con ts_rank.
+
+Las tablas se crean en las migraciones 0019 y 0020 y se mantienen sincronizadas desde las
+señales de models.py. El comando reconstruir_busqueda_eventos vuelve a poblar los índices.
+En otras bases de datos (o si el índice no existe) se usan filtros icontains.
+"""
+
+import re
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import RawSQL
+
+from .esquema import columnas_tabla
+from .models import ArchivoAdjunto, EventoClinico, HistorialFichaClinica, Mascota
+
+
+# Fuente indexada: tabla del índice, tabla del modelo, columna clave en PostgreSQL y campos de texto
+Fuente = namedtuple('Fuente', 'tabla tabla_modelo clave_pg campos pesos')
+
+FUENTE_EVENTOS = Fuente(
+    tabla='registro_eventoclinico_busqueda',
+    tabla_modelo='registro_eventoclinico',
+    clave_pg='evento_id',
+    campos=('descripcion', 'diagnostico', 'veterinario', 'medicacion', 'consideraciones', 'archivos'),
+    pesos=(1.0, 2.0, 0.5, 1.0, 0.5, 0.5),
+)
+
+FUENTE_HISTORIAL = Fuente(
+    tabla='registro_historialfichaclinica_busqueda',
+    tabla_modelo='registro_historialfichaclinica',
+    clave_pg='historial_id',
+    campos=('vacuna_nombre', 'alergias', 'condiciones_cronicas', 'medicamentos_actuales', 'historial_enfermedades', 'comentarios'),
+    pesos=(1.0, 1.0, 1.0, 1.0, 1.0, 0.5),
+)
+
+TABLA_BUSQUEDA = FUENTE_EVENTOS.tabla
+
+# Campos del modelo EventoClinico incluidos en el índice (además de los nombres de adjuntos)
+CAMPOS_BUSQUEDA = FUENTE_EVENTOS.campos[:-1]
+
+MAX_TERMINOS = 8
+
+# Plegado de tildes en PostgreSQL sin depender de la extensión unaccent
+_PLEGADO_PG = "translate(lower(%s), 'áéíóúüñàèìòù', 'aeiouunaeiou')"
+
+
+def _conexion(using):
+    return connections[using]
+
+
+def indice_disponible(using=DEFAULT_DB_ALIAS, fuente=FUENTE_EVENTOS):
+    """Indica si la base de datos tiene creado el índice de búsqueda de la fuente"""
+    return _conexion(using).vendor in ('sqlite', 'postgresql') and bool(columnas_tabla(fuente.tabla, using))
+
+
+def terminos_busqueda(texto):
+    """Separa el texto buscado en términos (solo letras y números)"""
+    return re.findall(r'\w+', (texto or '').lower())[:MAX_TERMINOS]
+
+
+def _consulta_indice(terminos, vendor):
+    """Arma la consulta del motor: todos los términos deben aparecer, como prefijo"""
+    if vendor == 'sqlite':
+        return ' '.join(f'"{termino}"*' for termino in terminos)
+    return ' & '.join(f'{termino}:*' for termino in terminos)
+
+
+def _sql_insertar(fuente, vendor):
+    if vendor == 'sqlite':
+        columnas = ', '.join(fuente.campos)
+        valores = ', '.join(['%s'] * (len(fuente.campos) + 2))
+        return f'INSERT INTO {fuente.tabla} (rowid, ficha_clinica_id, {columnas}) VALUES ({valores})'
+    documento = " || ' ' || ".join(_PLEGADO_PG % '%s' for _ in fuente.campos)
+    return (
+        f'INSERT INTO {fuente.tabla} ({fuente.clave_pg}, ficha_clinica_id, documento) '
+        f"VALUES (%s, %s, to_tsvector('spanish', {documento}))"
+    )
+
+
+def _sql_eliminar(fuente, vendor):
+    columna = 'rowid' if vendor == 'sqlite' else fuente.clave_pg
+    return f'DELETE FROM {fuente.tabla} WHERE {columna} = %s'
+
+
+def _nombres_archivos(evento_ids, using):
+    """Retorna {evento_id: 'nombre1 nombre2 ...'} con los nombres de los adjuntos de los eventos"""
+    nombres = {}
+    archivos = (
+        ArchivoAdjunto.objects.using(using)
+        .filter(evento_clinico_id__in=evento_ids)
+        .order_by('evento_clinico_id', 'id')
+        .values_list('evento_clinico_id', 'nombre')
+    )
+    for evento_id, nombre in archivos:
+        nombres[evento_id] = f'{nombres[evento_id]} {nombre}' if evento_id in nombres else nombre
+    return nombres
+
+
+def _fila_evento(evento, archivos):
+    return (evento.pk, evento.ficha_clinica_id, *[getattr(evento, campo) or '' for campo in CAMPOS_BUSQUEDA], archivos)
+
+
+def _fila_historial(registro):
+    return (registro.pk, registro.ficha_clinica_id, *[getattr(registro, campo) or '' for campo in FUENTE_HISTORIAL.campos])
+
+
+def _reemplazar(fuente, fila, using):
+    vendor = _conexion(using).vendor
+    with _conexion(using).cursor() as cursor:
+        cursor.execute(_sql_eliminar(fuente, vendor), [fila[0]])
+        cursor.execute(_sql_insertar(fuente, vendor), list(fila))
+
+
+def _eliminar(fuente, pk, using):
+    with _conexion(using).cursor() as cursor:
+        cursor.execute(_sql_eliminar(fuente, _conexion(using).vendor), [pk])
+
+
+def indexar_evento(evento, using=DEFAULT_DB_ALIAS):
+    """Agrega o reemplaza el evento (con los nombres de sus adjuntos) en el índice de búsqueda"""
+    if not indice_disponible(using):
+        return
+    archivos = _nombres_archivos([evento.pk], using).get(evento.pk, '')
+    _reemplazar(FUENTE_EVENTOS, _fila_evento(evento, archivos), using)
+
+
+def indexar_eventos_nuevos(eventos, using=DEFAULT_DB_ALIAS):
+    """Agrega al índice eventos creados con bulk_create (que no emite post_save) y aún sin adjuntos"""
+    if not eventos or not indice_disponible(using):
+        return
+    with _conexion(using).cursor() as cursor:
+        cursor.executemany(
+            _sql_insertar(FUENTE_EVENTOS, _conexion(using).vendor),
+            [_fila_evento(evento, '') for evento in eventos],
+        )
+
+
+def indexar_evento_por_id(evento_id, using=DEFAULT_DB_ALIAS):
+    """Vuelve a indexar un evento a partir de su id (por ejemplo, al cambiar sus adjuntos)"""
+    if not indice_disponible(using):
+        return
+    evento = EventoClinico.objects.using(using).filter(pk=evento_id).only('id', 'ficha_clinica_id', *CAMPOS_BUSQUEDA).first()
+    if evento is not None:
+        indexar_evento(evento, using)
+
+
+def desindexar_evento(evento_id, using=DEFAULT_DB_ALIAS):
+    """Quita el evento del índice de búsqueda"""
+    if indice_disponible(using):
+        _eliminar(FUENTE_EVENTOS, evento_id, using)
+
+
+def indexar_historial(registro, using=DEFAULT_DB_ALIAS):
+    """Agrega o reemplaza el registro histórico de la ficha en el índice de búsqueda"""
+    if indice_disponible(using, FUENTE_HISTORIAL):
+        _reemplazar(FUENTE_HISTORIAL, _fila_historial(registro), using)
+
+
+def desindexar_historial(registro_id, using=DEFAULT_DB_ALIAS):
+    """Quita el registro histórico del índice de búsqueda"""
+    if indice_disponible(using, FUENTE_HISTORIAL):
+        _eliminar(FUENTE_HISTORIAL, registro_id, using)
+
+
+def _poblar(fuente, filas_por_lote, using):
+    """Vacía el índice de la fuente y lo vuelve a poblar con las filas generadas por lote"""
+    sql_insertar = _sql_insertar(fuente, _conexion(using).vendor)
+    total = 0
+    with _conexion(using).cursor() as cursor:
+        cursor.execute(f'DELETE FROM {fuente.tabla}')
+        for filas in filas_por_lote:
+            cursor.executemany(sql_insertar, filas)
+            total += len(filas)
+    return total
+
+
+def _lotes(queryset, lote):
+    objetos = []
+    for objeto in queryset.iterator(chunk_size=lote):
+        objetos.append(objeto)
+        if len(objetos) >= lote:
+            yield objetos
+            objetos = []
+    if objetos:
+        yield objetos
+
+
+def reconstruir_indice(lote=1000, using=DEFAULT_DB_ALIAS):
+    """Vacía y vuelve a poblar los índices con todos los eventos y registros históricos. Retorna la cantidad indexada"""
+    total = 0
+    if indice_disponible(using):
+        eventos = EventoClinico.objects.using(using).only('id', 'ficha_clinica_id', *CAMPOS_BUSQUEDA).order_by()
+
+        def filas_eventos():
+            for eventos_lote in _lotes(eventos, lote):
+                archivos = _nombres_archivos([evento.pk for evento in eventos_lote], using)
+                yield [_fila_evento(evento, archivos.get(evento.pk, '')) for evento in eventos_lote]
+
+        total += _poblar(FUENTE_EVENTOS, filas_eventos(), using)
+
+    if indice_disponible(using, FUENTE_HISTORIAL):
+        registros = HistorialFichaClinica.objects.using(using).only('id', 'ficha_clinica_id', *FUENTE_HISTORIAL.campos).order_by()
+        filas_historial = ([_fila_historial(registro) for registro in registros_lote] for registros_lote in _lotes(registros, lote))
+        total += _poblar(FUENTE_HISTORIAL, filas_historial, using)
+    return total
+
+
+def _subconsulta_ids(consulta, vendor):
+    tabla = FUENTE_EVENTOS.tabla
+    if vendor == 'sqlite':
+        return RawSQL(f'SELECT rowid FROM {tabla} WHERE {tabla} MATCH %s', [consulta])
+    return RawSQL(
+        f"SELECT evento_id FROM {tabla} WHERE documento @@ to_tsquery('spanish', {_PLEGADO_PG % '%s'})",
+        [consulta],
+    )
+
+
+def _filtro_icontains(texto):
+    filtro = Q(archivos_adjuntos__nombre__icontains=texto)
+    for campo in CAMPOS_BUSQUEDA:
+        filtro |= Q(**{f'{campo}__icontains': texto})
+    return filtro
+
+
+def filtrar_por_texto(eventos, texto):
+    """Filtra un queryset de eventos dejando los que contienen todos los términos buscados"""
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return eventos
+    using = eventos.db
+    if not indice_disponible(using):
+        return eventos.filter(_filtro_icontains(texto)).distinct()
+    vendor = _conexion(using).vendor
+    return eventos.filter(pk__in=_subconsulta_ids(_consulta_indice(terminos, vendor), vendor))
+
+
+def _rango_sql(fuente, vendor):
+    """Expresión de rango de la fuente (menor es más relevante en ambos motores)"""
+    if vendor == 'sqlite':
+        pesos = ', '.join(str(peso) for peso in fuente.pesos)
+        return f'bm25({fuente.tabla}, 0, {pesos})'
+    return '-ts_rank(documento, consulta)'
+
+
+def _desde_indice(fuente, vendor):
+    """FROM y condición de coincidencia de la fuente; la clave del índice se expone como indice_id"""
+    if vendor == 'sqlite':
+        return f'{fuente.tabla}', f'{fuente.tabla} MATCH %s', f'{fuente.tabla}.rowid'
+    return (
+        f"{fuente.tabla}, to_tsquery('spanish', {_PLEGADO_PG % '%s'}) AS consulta",
+        'documento @@ consulta',
+        f'{fuente.tabla}.{fuente.clave_pg}',
+    )
+
+
+def buscar_eventos(texto, ficha_ids=None, limite=50, using=DEFAULT_DB_ALIAS):
+    """
+    Retorna los ids de los eventos que coinciden con el texto, del más al menos relevante.
+    Con ficha_ids se limita a esas fichas clínicas.
+    """
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return []
+
+    if not indice_disponible(using):
+        eventos = EventoClinico.objects.using(using).filter(_filtro_icontains(texto)).distinct()
+        if ficha_ids is not None:
+            eventos = eventos.filter(ficha_clinica_id__in=ficha_ids)
+        return list(eventos.order_by('-fecha_evento', '-id').values_list('id', flat=True)[:limite])
+
+    vendor = _conexion(using).vendor
+    params = [_consulta_indice(terminos, vendor)]
+
+    filtro_fichas = ''
+    if ficha_ids is not None:
+        ficha_ids = list(ficha_ids)
+        if not ficha_ids:
+            return []
+        filtro_fichas = f" AND ficha_clinica_id IN ({', '.join(['%s'] * len(ficha_ids))})"
+        params.extend(ficha_ids)
+    params.append(limite)
+
+    desde, coincide, clave = _desde_indice(FUENTE_EVENTOS, vendor)
+    sql = (
+        f'SELECT {clave} FROM {desde} WHERE {coincide}{filtro_fichas}'
+        f' ORDER BY {_rango_sql(FUENTE_EVENTOS, vendor)}, {clave} DESC LIMIT %s'
+    )
+    with _conexion(using).cursor() as cursor:
+        cursor.execute(sql, params)
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+# ---------------------------------------------------------------------------
+# Búsqueda en todo el historial de un tutor
+# ---------------------------------------------------------------------------
+
+# Fila de resultado: (mascota_id, mascota_nombre, origen, objeto_id, fecha, tipo_evento, rango)
+ORIGEN_EVENTO = 'evento'
+ORIGEN_HISTORIAL = 'historial'
+
+
+def _sql_busqueda_mascotas(vendor, cantidad_mascotas):
+    """
+    Una consulta (UNION ALL de ambos índices) para un lote de mascotas, ordenada por mascota y
+    relevancia, con a lo más `por_mascota` filas por mascota (así una mascota con muchas
+    coincidencias no deja sin resultados a las demás).
+    """
+    mascotas = ', '.join(['%s'] * cantidad_mascotas)
+    desde_eventos, coincide_eventos, clave_eventos = _desde_indice(FUENTE_EVENTOS, vendor)
+    desde_historial, coincide_historial, clave_historial = _desde_indice(FUENTE_HISTORIAL, vendor)
+    # Ambas ramas entregan una fecha (la del registro histórico sin la hora)
+    fecha_historial = 'date(h.creado_en)' if vendor == 'sqlite' else 'CAST(h.creado_en AS date)'
+    union = (
+        f"SELECT m.id AS mascota_id, m.nombre AS mascota_nombre, '{ORIGEN_EVENTO}' AS origen, e.id AS objeto_id, "
+        'e.fecha_evento AS fecha, e.tipo_evento AS tipo_evento, '
+        f'{_rango_sql(FUENTE_EVENTOS, vendor)} AS rango '
+        f'FROM {desde_eventos} '
+        f'JOIN registro_eventoclinico e ON e.id = {clave_eventos} '
+        'JOIN registro_fichaclinica f ON f.id = e.ficha_clinica_id '
+        'JOIN registro_mascota m ON m.id = f.mascota_id '
+        f'WHERE {coincide_eventos} AND m.id IN ({mascotas}) '
+        'UNION ALL '
+        f"SELECT m.id, m.nombre, '{ORIGEN_HISTORIAL}', h.id, {fecha_historial}, NULL, "
+        f'{_rango_sql(FUENTE_HISTORIAL, vendor)} AS rango '
+        f'FROM {desde_historial} '
+        f'JOIN registro_historialfichaclinica h ON h.id = {clave_historial} '
+        'JOIN registro_fichaclinica f ON f.id = h.ficha_clinica_id '
+        'JOIN registro_mascota m ON m.id = f.mascota_id '
+        f'WHERE {coincide_historial} AND m.id IN ({mascotas})'
+    )
+    return (
+        'SELECT mascota_id, mascota_nombre, origen, objeto_id, fecha, tipo_evento, rango FROM ('
+        'SELECT r.*, ROW_NUMBER() OVER ('
+        'PARTITION BY mascota_id ORDER BY rango, objeto_id DESC, origen'
+        f') AS posicion FROM ({union}) r'
+        ') t WHERE posicion <= %s '
+        'ORDER BY mascota_id, rango, objeto_id DESC, origen'
+    )
+
+
+def _primeros_por_mascota(queryset, por_mascota):
+    """Deja las `por_mascota` filas más recientes (por id) de cada mascota"""
+    return queryset.annotate(
+        posicion=Window(RowNumber(), partition_by=F('ficha_clinica__mascota_id'), order_by=F('id').desc()),
+    ).filter(posicion__lte=por_mascota)
+
+
+def _resultados_indice(consulta, vendor, mascota_ids, por_mascota, using):
+    """Filas de un lote de mascotas desde los índices de texto completo"""
+    params = [consulta, *mascota_ids, consulta, *mascota_ids, por_mascota]
+    with _conexion(using).cursor() as cursor:
+        cursor.execute(_sql_busqueda_mascotas(vendor, len(mascota_ids)), params)
+        return cursor.fetchall()
+
+
+def _resultados_icontains(texto, mascota_ids, por_mascota, using):
+    """Alternativa sin índice: eventos y registros históricos de un lote de mascotas filtrados con icontains"""
+    filas = []
+    # Subconsulta en vez de distinct() (el filtro por adjuntos repite eventos), que no se combina con la ventana
+    coincidentes = EventoClinico.objects.using(using).filter(_filtro_icontains(texto)).values('id')
+    eventos = _primeros_por_mascota(
+        EventoClinico.objects.using(using)
+        .filter(pk__in=coincidentes, ficha_clinica__mascota_id__in=mascota_ids),
+        por_mascota,
+    ).values_list('ficha_clinica__mascota_id', 'ficha_clinica__mascota__nombre', 'id', 'fecha_evento', 'tipo_evento')
+    filas += [(m_id, nombre, ORIGEN_EVENTO, pk, fecha, tipo, 0) for m_id, nombre, pk, fecha, tipo in eventos]
+
+    filtro_historial = Q()
+    for campo in FUENTE_HISTORIAL.campos:
+        filtro_historial |= Q(**{f'{campo}__icontains': texto})
+    registros = _primeros_por_mascota(
+        HistorialFichaClinica.objects.using(using)
+        .filter(filtro_historial, ficha_clinica__mascota_id__in=mascota_ids),
+        por_mascota,
+    ).values_list('ficha_clinica__mascota_id', 'ficha_clinica__mascota__nombre', 'id', 'creado_en__date')
+    filas += [(m_id, nombre, ORIGEN_HISTORIAL, pk, fecha, None, 0) for m_id, nombre, pk, fecha in registros]
+
+    # Cada fuente aporta hasta por_mascota filas por mascota: se deja el tope entre ambas
+    filas.sort(key=lambda fila: (fila[0], -fila[3]))
+    por_mascota_usadas = Counter()
+    resultado = []
+    for fila in filas:
+        por_mascota_usadas[fila[0]] += 1
+        if por_mascota_usadas[fila[0]] <= por_mascota:
+            resultado.append(fila)
+    return resultado
+
+
+def resultados_tutor(texto, tutor_id, limite=500, por_mascota=20, using=DEFAULT_DB_ALIAS, mascotas_por_lote=10):
+    """
+    Genera las filas (mascota_id, mascota_nombre, origen, objeto_id, fecha, tipo_evento, rango) de
+    los eventos y registros históricos de las mascotas activas del tutor que coinciden con el texto,
+    agrupadas por mascota (por nombre) y de la más a la menos relevante dentro de cada mascota, con a
+    lo más `por_mascota` filas por mascota y `limite` en total.
+    Se consulta un lote de `mascotas_por_lote` mascotas a la vez y sus filas se entregan apenas
+    termina esa consulta, de modo que el llamador puede emitirlas sin esperar al resto.
+    """
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return
+
+    con_indice = indice_disponible(using) and indice_disponible(using, FUENTE_HISTORIAL)
+    if con_indice:
+        vendor = _conexion(using).vendor
+        consulta = _consulta_indice(terminos, vendor)
+
+    mascotas = list(
+        Mascota.objects.using(using).filter(tutor_id=tutor_id, activa=True)
+        .order_by('nombre', 'id').values_list('id', flat=True)
+    )
+    restantes = limite
+    for inicio in range(0, len(mascotas), mascotas_por_lote):
+        lote = mascotas[inicio:inicio + mascotas_por_lote]
+        if con_indice:
+            filas = _resultados_indice(consulta, vendor, lote, por_mascota, using)
+        else:
+            filas = _resultados_icontains(texto, lote, por_mascota, using)
+        filas_por_mascota = defaultdict(list)
+        for fila in filas:
+            filas_por_mascota[fila[0]].append(fila)
+        for mascota_id in lote:
+            for fila in filas_por_mascota[mascota_id]:
+                yield fila
+                restantes -= 1
+                if restantes <= 0:
+                    return
@@ -0,0 +1,87 @@
+"""
+Grilla mensual del calendario compartida por el home, la bitácora y el perfil de mascota.
+
+La grilla de un (año, mes) no cambia nunca, así que se construye una sola vez y se
+guarda en un caché LRU junto con la metadata de cada semana y un índice día → semana
+para agrupar eventos por semana sin recorrer la grilla.
+"""
+
+import calendar
+from collections import namedtuple
+from functools import lru_cache
+
+from django.utils import timezone
+
+
+CALENDAR_HEADERS = ['L', 'M', 'X', 'J', 'V', 'S', 'D']
+MESES_ES = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
+
+# semanas: tupla de semanas, cada una con 7 días (número del día o '' si no pertenece al mes)
+# meta: tupla de dicts {'index', 'inicio', 'fin'} por semana
+# pares: tupla de (semana, meta) lista para el template
+# semana_por_dia: tupla indexada por día del mes con el número de semana (1-based); posición 0 sin uso
+GrillaMes = namedtuple('GrillaMes', ['semanas', 'meta', 'pares', 'semana_por_dia'])
+
+_calendario = calendar.Calendar(firstweekday=0)
+
+
+@lru_cache(maxsize=256)
+def grilla_mes(anio, mes, quitar_puntos=False):
+    """Construye (y cachea) la grilla de semanas del mes con su metadata"""
+    semanas = []
+    meta = []
+    semana_por_dia = [0] * (calendar.monthrange(anio, mes)[1] + 1)
+
+    for week_index, semana_fechas in enumerate(_calendario.monthdatescalendar(anio, mes)):
+        fechas_reales = [d for d in semana_fechas if d.month == mes]
+        semanas.append(tuple(d.day if d.month == mes else '' for d in semana_fechas))
+        for d in fechas_reales:
+            semana_por_dia[d.day] = week_index + 1
+
+        if fechas_reales:
+            inicio = fechas_reales[0].strftime('%d %b')
+            fin = fechas_reales[-1].strftime('%d %b')
+            if quitar_puntos:
+                inicio = inicio.replace('.', '')
+                fin = fin.replace('.', '')
+        else:
+            inicio = ''
+            fin = ''
+        meta.append({
+            'index': week_index + 1,
+            'inicio': inicio,
+            'fin': fin,
+        })
+
+    semanas = tuple(semanas)
+    meta = tuple(meta)
+    return GrillaMes(semanas, meta, tuple(zip(semanas, meta)), tuple(semana_por_dia))
+
+
+def fecha_calendario_desde_request(request, hoy=None):
+    """Obtiene el primer día del mes pedido por GET (mes/anio) o la fecha de hoy"""
+    hoy = hoy or timezone.now().date()
+    mes_seleccionado = request.GET.get('mes')
+    anio_seleccionado = request.GET.get('anio')
+
+    if mes_seleccionado and anio_seleccionado:
+        try:
+            mes = int(mes_seleccionado)
+            anio = int(anio_seleccionado)
+            # Validar rango de mes y año
+            if 1 <= mes <= 12 and 2000 <= anio <= 2100:
+                return timezone.datetime(anio, mes, 1).date()
+        except (ValueError, TypeError):
+            pass
+    return hoy
+
+
+def contar_por_semana(grilla, dias):
+    """Cuenta ocurrencias por número de semana a partir de una lista de días del mes"""
+    conteo = {}
+    semana_por_dia = grilla.semana_por_dia
+    for dia in dias:
+        if 0 < dia < len(semana_por_dia):
+            semana_num = semana_por_dia[dia]
+            conteo[semana_num] = conteo.get(semana_num, 0) + 1
+    return conteo
@@ -1,18 +1,64 @@
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
 from .models import Mascota
 
 
+# Tiempo máximo en caché de la lista de mascotas del menú (se invalida al guardar/eliminar)
+CACHE_TIMEOUT_MASCOTAS_USUARIO = 60 * 15
+
+# Campos que usa el selector de mascotas del menú (foto_derivados para el avatar)
+CAMPOS_MASCOTAS_USUARIO = ('id', 'tutor', 'nombre', 'especie', 'raza', 'foto', 'foto_derivados', 'activa')
+
+
+def cache_key_mascotas_usuario(user_id):
+    return f'registro:mascotas_usuario:{user_id}'
+
+
+def invalidar_mascotas_usuario(user_id):
+    """Elimina del caché la lista de mascotas activas del usuario"""
+    cache.delete(cache_key_mascotas_usuario(user_id))
+
+
+def precargar_mascotas_usuario(request, mascotas):
+    """
+    Permite que una vista entregue las mascotas activas que ya consultó
+    (ordenadas por nombre) para que el context processor no las vuelva a buscar.
+    """
+    request._mascotas_usuario = list(mascotas)
+
+
+def obtener_mascotas_usuario(request):
+    """
+    Retorna las mascotas activas del usuario: primero las precargadas por la vista,
+    luego las del caché y, solo si no existen, las consulta a la base de datos.
+    """
+    precargadas = getattr(request, '_mascotas_usuario', None)
+    if precargadas is not None:
+        return precargadas
+
+    if not request.user.is_authenticated:
+        return []
+
+    key = cache_key_mascotas_usuario(request.user.pk)
+    mascotas = cache.get(key)
+    if mascotas is None:
+        mascotas = list(
+            Mascota.objects.filter(tutor=request.user, activa=True)
+            .only(*CAMPOS_MASCOTAS_USUARIO)
+            .order_by('nombre')
+        )
+        cache.set(key, mascotas, CACHE_TIMEOUT_MASCOTAS_USUARIO)
+
+    request._mascotas_usuario = mascotas
+    return mascotas
+
+
 def mascotas_usuario(request):
     """
     Context processor para incluir las mascotas del usuario en todas las vistas.
+    La lista es perezosa: solo se resuelve si el template la utiliza.
     """
-    context = {
-        'mascotas_usuario': [],
+    return {
+        'mascotas_usuario': SimpleLazyObject(lambda: obtener_mascotas_usuario(request)),
     }
-    
-    if request.user.is_authenticated:
-        mascotas = Mascota.objects.filter(tutor=request.user, activa=True).order_by('nombre')
-        # Pasar los objetos completos para tener acceso a todos los campos, incluyendo foto
-        context['mascotas_usuario'] = list(mascotas)
-    
-    return context
-
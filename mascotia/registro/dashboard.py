@@ -0,0 +1,100 @@
+"""
+Agregados del panel (home) calculados en bloque para todas las mascotas del tutor.
+
+Los eventos recientes, la última vacuna y el puntaje de salud se leen de las columnas
+precalculadas de la ficha clínica (ver salud.py) y los sparklines de peso se leen del
+caché, de modo que el número de consultas del panel no depende de cuántas mascotas tenga el tutor.
+Las vacunas vencidas y próximas de todas las mascotas salen de dos rangos sobre el índice de
+la próxima dosis (ver vacunas.py).
+"""
+
+from django.utils import timezone
+
+from .models import FichaClinica
+from .salud import asegurar_metricas_salud
+from .sparkline import sparklines_mascotas
+from .vacunas import proximas_vacunas, vacunas_vencidas
+
+
+# Dosis que muestra el panel en cada lista (vencidas y próximas)
+MAX_ALERTAS_VACUNAS = 10
+
+
+def _resumen_vacio():
+    return {
+        'eventos_recientes': 0,
+        'ultima_vacuna_fecha': None,
+        'peso': None,
+        'ultimo_peso': None,
+    }
+
+
+def _ficha_o_none(mascota):
+    try:
+        return mascota.ficha_clinica
+    except FichaClinica.DoesNotExist:
+        return None
+
+
+def resumen_panel_mascotas(mascotas, hoy=None):
+    """
+    Retorna un diccionario {mascota_id: resumen} con:
+    - eventos_recientes: eventos (sin comentarios) de los últimos 30 días
+    - ultima_vacuna_fecha: fecha de la última vacuna registrada o None
+    - peso: bloque del sparkline de peso (ver sparkline.renderizar_sparkline)
+    - ultimo_peso: último peso registrado o None
+
+    Espera las mascotas con select_related('ficha_clinica') y usa un número fijo de
+    consultas, sin importar el número de mascotas.
+    """
+    ids = [mascota.pk for mascota in mascotas]
+    resumen = {mascota_id: _resumen_vacio() for mascota_id in ids}
+    if not ids:
+        return resumen
+
+    hoy = hoy or timezone.now().date()
+
+    # Métricas precalculadas; solo se recalculan si quedaron de un día anterior
+    fichas = {mascota.pk: _ficha_o_none(mascota) for mascota in mascotas}
+    asegurar_metricas_salud([ficha for ficha in fichas.values() if ficha is not None], hoy)
+    for mascota_id, ficha in fichas.items():
+        if ficha is not None:
+            resumen[mascota_id]['eventos_recientes'] = ficha.eventos_recientes
+            resumen[mascota_id]['ultima_vacuna_fecha'] = ficha.ultima_vacuna_fecha
+
+    # Sparkline y último peso de cada mascota (cacheados según la versión de su serie de peso)
+    for mascota_id, bloque in sparklines_mascotas(ids).items():
+        resumen[mascota_id]['peso'] = bloque
+        resumen[mascota_id]['ultimo_peso'] = bloque['ultimo_peso']
+
+    return resumen
+
+
+def alertas_vacunas(mascotas, hoy=None):
+    """
+    Retorna (vencidas, proximas): las dosis vencidas sin refuerzo y las de los próximos días
+    de las mascotas, cada una como {mascota_id, mascota, vacuna, fecha}, de la más atrasada
+    o cercana a la más lejana. Usa dos consultas, sin importar el número de mascotas.
+    """
+    nombres = {}
+    for mascota in mascotas:
+        ficha = _ficha_o_none(mascota)
+        if ficha is not None:
+            nombres[ficha.pk] = (mascota.pk, mascota.nombre)
+    if not nombres:
+        return [], []
+
+    hoy = hoy or timezone.now().date()
+
+    def filas(vacunaciones):
+        return [
+            {
+                'mascota_id': nombres[vacunacion.ficha_clinica_id][0],
+                'mascota': nombres[vacunacion.ficha_clinica_id][1],
+                'vacuna': vacunacion.vacuna,
+                'fecha': vacunacion.proxima_dosis,
+            }
+            for vacunacion in vacunaciones[:MAX_ALERTAS_VACUNAS]
+        ]
+
+    return filas(vacunas_vencidas(list(nombres), hoy)), filas(proximas_vacunas(list(nombres), hoy))
@@ -0,0 +1,190 @@
+"""
+Entrega de archivos del storage (adjuntos clínicos y fotos).
+
+servir_archivo() responde con FileResponse en bloques, acepta solicitudes Range de un solo
+tramo (206 / 416, respetando If-Range) y GET condicionales con ETag y Last-Modified (304).
+Los adjuntos usan su SHA-256 como ETag; para el resto se deriva del nombre, tamaño y fecha
+de modificación.
+
+Con ARCHIVOS_ENVIO = 'x-accel-redirect' (nginx) o 'x-sendfile' (Apache/lighttpd) la vista
+solo valida el acceso y delega la transferencia al servidor web, que resuelve los Range sin
+ocupar un worker. En nginx la ubicación ARCHIVOS_ENVIO_PREFIJO debe ser `internal` y apuntar
+a MEDIA_ROOT; las carpetas de CARPETAS_PRIVADAS no deben publicarse bajo MEDIA_URL.
+"""
+
+import hashlib
+import mimetypes
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+
+ENVIO_X_ACCEL = 'x-accel-redirect'
+ENVIO_X_SENDFILE = 'x-sendfile'
+
+# Carpetas del storage con datos clínicos: solo se entregan a su tutor (descargar_adjunto)
+CARPETAS_PRIVADAS = ('adjuntos/', 'archivos_eventos/')
+
+# Carpetas que MEDIA_URL entrega sin sesión: fotos de mascotas y de perfil, y sus derivados
+CARPETAS_PUBLICAS = ('mascotas/', 'perfiles_tutores/', 'derivados/')
+
+TAMANO_BLOQUE = 64 * 1024
+
+PATRON_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _Tramo:
+    """Lectura limitada a `restante` bytes desde la posición actual del archivo"""
+
+    def __init__(self, archivo, restante):
+        self.archivo = archivo
+        self.restante = restante
+
+    def read(self, tamano=-1):
+        if self.restante <= 0:
+            return b''
+        if tamano < 0 or tamano > self.restante:
+            tamano = self.restante
+        datos = self.archivo.read(tamano)
+        self.restante -= len(datos)
+        return datos
+
+    def close(self):
+        self.archivo.close()
+
+
+def normalizar_ruta(ruta):
+    """Nombre en el storage sin segmentos '.' ni '..'; None si sale de la raíz del storage"""
+    nombre = posixpath.normpath(ruta.replace('\\', '/'))
+    if nombre == '.' or nombre.startswith(('..', '/')):
+        return None
+    return nombre
+
+
+def es_ruta_publica(nombre):
+    nombre = normalizar_ruta(nombre)
+    return nombre is not None and nombre.startswith(CARPETAS_PUBLICAS)
+
+
+def _etag_archivo(nombre, tamano, modificado):
+    firma = f'{nombre}:{tamano}:{modificado.timestamp() if modificado else ""}'
+    return hashlib.md5(firma.encode(), usedforsecurity=False).hexdigest()
+
+
+def _modificado(storage, nombre):
+    try:
+        return storage.get_modified_time(nombre)
+    except (NotImplementedError, OSError):
+        return None
+
+
+def tramo_solicitado(request, tamano, etag, modificado):
+    """
+    Retorna (inicio, fin) inclusivo del Range pedido, None si se debe enviar el archivo
+    completo o False si el tramo no es satisfacible. Los Range de varios tramos se ignoran.
+    """
+    valor = request.headers.get('Range', '')
+    match = PATRON_RANGE.match(valor.replace(' ', ''))
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+
+    # If-Range: solo se responde el tramo si el archivo no cambió desde que el cliente lo obtuvo
+    if_range = request.headers.get('If-Range')
+    if if_range:
+        fecha = parse_http_date_safe(if_range)
+        if fecha is not None:
+            if modificado is None or int(modificado.timestamp()) > fecha:
+                return None
+        elif if_range != quote_etag(etag):
+            return None
+
+    desde, hasta = match.groups()
+    if not desde:
+        # bytes=-N: los últimos N bytes
+        largo = int(hasta)
+        if largo == 0:
+            return False
+        return max(0, tamano - largo), tamano - 1
+    inicio = int(desde)
+    fin = min(int(hasta), tamano - 1) if hasta else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, fin
+
+
+def servir_archivo(request, storage, nombre, nombre_descarga=None, etag=None, descargar=False):
+    """
+    Respuesta con el archivo `nombre` del storage. `etag` (sin comillas) identifica el
+    contenido; si no se indica se calcula a partir de los metadatos del storage.
+    """
+    try:
+        existe = bool(nombre) and storage.exists(nombre)
+    except SuspiciousFileOperation:
+        existe = False
+    if not existe:
+        raise Http404('El archivo no existe')
+
+    tamano = storage.size(nombre)
+    modificado = _modificado(storage, nombre)
+    etag = etag or _etag_archivo(nombre, tamano, modificado)
+    ultima_modificacion = int(modificado.timestamp()) if modificado else None
+
+    respuesta = get_conditional_response(request, etag=quote_etag(etag), last_modified=ultima_modificacion)
+    if respuesta is None:
+        nombre_descarga = nombre_descarga or nombre.rsplit('/', 1)[-1]
+        modo_envio = getattr(settings, 'ARCHIVOS_ENVIO', '')
+        if modo_envio:
+            respuesta = _respuesta_delegada(modo_envio, storage, nombre, nombre_descarga, descargar)
+        else:
+            respuesta = _respuesta_directa(request, storage, nombre, tamano, etag, modificado, nombre_descarga, descargar)
+
+    respuesta.headers['ETag'] = quote_etag(etag)
+    if modificado is not None:
+        respuesta.headers['Last-Modified'] = http_date(ultima_modificacion)
+    # Datos de un tutor: cachés compartidos no, y el navegador revalida con el ETag
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+
+def _respuesta_directa(request, storage, nombre, tamano, etag, modificado, nombre_descarga, descargar):
+    tramo = tramo_solicitado(request, tamano, etag, modificado)
+    if tramo is False:
+        respuesta = HttpResponse(status=416)
+        respuesta.headers['Content-Range'] = f'bytes */{tamano}'
+        return respuesta
+
+    archivo = storage.open(nombre, 'rb')
+    if tramo is None:
+        respuesta = FileResponse(archivo, as_attachment=descargar, filename=nombre_descarga)
+    else:
+        inicio, fin = tramo
+        archivo.seek(inicio)
+        respuesta = FileResponse(
+            _Tramo(archivo, fin - inicio + 1), status=206, as_attachment=descargar, filename=nombre_descarga
+        )
+        respuesta.headers['Content-Length'] = fin - inicio + 1
+        respuesta.headers['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    respuesta.block_size = TAMANO_BLOQUE
+    respuesta.headers['Accept-Ranges'] = 'bytes'
+    return respuesta
+
+
+def _respuesta_delegada(modo_envio, storage, nombre, nombre_descarga, descargar):
+    """Respuesta vacía con la cabecera que indica al servidor web qué archivo enviar"""
+    tipo, _ = mimetypes.guess_type(nombre_descarga)
+    respuesta = HttpResponse(content_type=tipo or 'application/octet-stream')
+    if modo_envio == ENVIO_X_ACCEL:
+        prefijo = getattr(settings, 'ARCHIVOS_ENVIO_PREFIJO', '/media-protegida/')
+        respuesta.headers['X-Accel-Redirect'] = prefijo.rstrip('/') + '/' + quote(nombre)
+    elif modo_envio == ENVIO_X_SENDFILE:
+        respuesta.headers['X-Sendfile'] = storage.path(nombre)
+    else:
+        raise ValueError(f'ARCHIVOS_ENVIO desconocido: {modo_envio}')
+    respuesta.headers['Content-Disposition'] = content_disposition_header(descargar, nombre_descarga)
+    return respuesta
@@ -0,0 +1,39 @@
+"""
+Registro de columnas disponibles en la base de datos para los modelos de registro.
+
+Cada tabla se inspecciona una sola vez por proceso (y por conexión) con la API de
+introspección de Django, por lo que funciona en SQLite y PostgreSQL. Las vistas y formularios
+pueden preguntar si una columna existe sin volver a consultar la base de datos.
+El registro se limpia después de cada migrate (ver apps.py).
+"""
+
+from functools import lru_cache
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@lru_cache(maxsize=None)
+def columnas_tabla(tabla, using=DEFAULT_DB_ALIAS):
+    """Retorna el frozenset de columnas de la tabla (vacío si la tabla no existe)"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if tabla not in connection.introspection.table_names(cursor):
+            return frozenset()
+        descripcion = connection.introspection.get_table_description(cursor, tabla)
+    return frozenset(columna.name for columna in descripcion)
+
+
+def limpiar_registro_esquema(**kwargs):
+    """Descarta el registro para que se vuelva a construir (por ejemplo, tras migrar)"""
+    columnas_tabla.cache_clear()
+
+
+def columna_disponible(modelo, campo, using=DEFAULT_DB_ALIAS):
+    """Indica si la columna del campo del modelo existe en la base de datos"""
+    columna = modelo._meta.get_field(campo).column
+    return columna in columnas_tabla(modelo._meta.db_table, using)
+
+
+def campos_disponibles(modelo, campos, using=DEFAULT_DB_ALIAS):
+    """Filtra la lista de campos dejando solo los que tienen columna en la base de datos"""
+    return [campo for campo in campos if columna_disponible(modelo, campo, using)]
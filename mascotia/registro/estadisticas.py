@@ -0,0 +1,157 @@
+"""
+Estadísticas de los eventos clínicos de una ficha para el perfil de la mascota y la bitácora.
+
+Los conteos (por tipo, medicación por día, visitas y controles) salen de una sola consulta
+agrupada por tipo y fecha. Lo que necesita los eventos completos (última y próxima visita,
+controles, eventos del mes del calendario) se obtiene de una única lectura de los eventos de
+la ficha, y los resúmenes de vacunas de una única lectura de sus vacunaciones. Cada parte se
+consulta solo si se usa, y una sola vez por instancia.
+
+El home no usa estas estadísticas: lee las métricas precalculadas de cada ficha (salud.py).
+"""
+
+from collections import defaultdict
+from datetime import time
+from functools import cached_property
+
+from django.db.models import Count
+
+from .eventos import ORDEN_HISTORIAL
+from .models import EventoClinico
+from .vacunas import siguiente_dosis_de
+
+
+TIPOS_CONTROL = (EventoClinico.TIPO_CITA_GENERAL, EventoClinico.TIPO_CITA_ESPECIALISTA)
+
+
+def conteos_eventos(ficha_ids):
+    """Retorna {ficha_id: {(tipo_evento, fecha_evento): cantidad}} en una consulta agrupada"""
+    conteos = {ficha_id: {} for ficha_id in ficha_ids}
+    filas = (
+        EventoClinico.objects
+        .filter(ficha_clinica_id__in=ficha_ids)
+        .values_list('ficha_clinica_id', 'tipo_evento', 'fecha_evento')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for ficha_id, tipo, fecha, total in filas:
+        conteos[ficha_id][(tipo, fecha)] = total
+    return conteos
+
+
+class EstadisticasEventos:
+    """Estadísticas de los eventos y vacunas de una ficha al día `hoy`"""
+
+    def __init__(self, ficha, hoy):
+        self.ficha = ficha
+        self.hoy = hoy
+
+    # ---- Conteos (consulta agrupada) ----
+
+    @cached_property
+    def conteos(self):
+        return conteos_eventos([self.ficha.pk])[self.ficha.pk]
+
+    @cached_property
+    def por_tipo(self):
+        """{tipo_evento: cantidad}"""
+        por_tipo = defaultdict(int)
+        for (tipo, _), total in self.conteos.items():
+            por_tipo[tipo] += total
+        return dict(por_tipo)
+
+    @cached_property
+    def por_tipo_display(self):
+        """{nombre del tipo: cantidad}, en el orden de TIPO_EVENTO_CHOICES"""
+        return {
+            nombre: self.por_tipo[tipo]
+            for tipo, nombre in EventoClinico.TIPO_EVENTO_CHOICES
+            if tipo in self.por_tipo
+        }
+
+    @cached_property
+    def medicacion_por_dia(self):
+        """{fecha: dosis de medicación}, de la fecha más reciente a la más antigua"""
+        return {
+            fecha: total
+            for (tipo, fecha), total in sorted(self.conteos.items(), key=lambda item: item[0][1], reverse=True)
+            if tipo == EventoClinico.TIPO_MEDICACION
+        }
+
+    @property
+    def total_medicacion(self):
+        return sum(self.medicacion_por_dia.values())
+
+    @property
+    def total_visitas(self):
+        """Eventos clínicos sin contar los comentarios"""
+        return sum(total for tipo, total in self.por_tipo.items() if tipo != EventoClinico.TIPO_COMENTARIO)
+
+    @property
+    def total_controles(self):
+        return sum(self.por_tipo.get(tipo, 0) for tipo in TIPOS_CONTROL)
+
+    @property
+    def periodo_medicacion(self):
+        """(primera, última) fecha con medicación, o None si no hay"""
+        if not self.medicacion_por_dia:
+            return None
+        return min(self.medicacion_por_dia), max(self.medicacion_por_dia)
+
+    # ---- Eventos (una lectura) ----
+
+    @cached_property
+    def eventos(self):
+        """Eventos de la ficha del más reciente al más antiguo"""
+        return list(self.ficha.eventos.order_by(*ORDEN_HISTORIAL))
+
+    def eventos_del_mes(self, anio, mes):
+        """Eventos del mes por fecha y hora (los sin hora primero en su día)"""
+        eventos = [
+            evento for evento in self.eventos
+            if evento.fecha_evento.year == anio and evento.fecha_evento.month == mes
+        ]
+        eventos.sort(key=lambda evento: (evento.fecha_evento, evento.hora_evento is not None, evento.hora_evento or time.min))
+        return eventos
+
+    @cached_property
+    def ultima_visita(self):
+        """Último evento que no es un comentario (puede ser futuro)"""
+        return next((evento for evento in self.eventos if evento.tipo_evento != EventoClinico.TIPO_COMENTARIO), None)
+
+    @cached_property
+    def proxima_visita(self):
+        """Cita más cercana desde hoy"""
+        citas = [
+            evento for evento in self.eventos
+            if evento.tipo_evento in TIPOS_CONTROL and evento.fecha_evento >= self.hoy
+        ]
+        return min(
+            citas,
+            key=lambda evento: (evento.fecha_evento, evento.hora_evento is not None, evento.hora_evento or time.min),
+            default=None,
+        )
+
+    @cached_property
+    def controles(self):
+        """Citas veterinarias de la más reciente a la más antigua"""
+        return [evento for evento in self.eventos if evento.tipo_evento in TIPOS_CONTROL]
+
+    # ---- Vacunas (una lectura) ----
+
+    @cached_property
+    def vacunaciones(self):
+        """Vacunaciones de la ficha en el orden del modelo (la más reciente primero)"""
+        vacunaciones = list(self.ficha.vacunaciones.all())
+        # Misma caché que vacunas.ultima_vacunacion()
+        self.ficha._ultima_vacunacion = vacunaciones[0] if vacunaciones else None
+        return vacunaciones
+
+    @property
+    def ultima_vacuna(self):
+        return self.vacunaciones[0] if self.vacunaciones else None
+
+    @cached_property
+    def siguiente_dosis(self):
+        """Dosis pendiente más cercana (puede estar vencida), o None"""
+        return siguiente_dosis_de(self.vacunaciones)
@@ -0,0 +1,175 @@
+"""
+Listado de eventos clínicos con sus archivos adjuntos.
+
+Los eventos y todos sus adjuntos se obtienen en dos consultas (en lugar de una por
+evento), ambas ordenadas por la base de datos. La galería de "todos los archivos"
+se arma con las mismas filas, sin volver a consultar ni reordenar en Python.
+
+El historial se pagina por clave (cursor sobre fecha_evento e id, del más reciente
+al más antiguo) apoyándose en el índice (ficha_clinica, fecha_evento, id), por lo que
+una página profunda cuesta lo mismo que la primera.
+"""
+
+from datetime import date, datetime
+
+from django.db.models import Q
+from django.urls import reverse
+
+from .busqueda import filtrar_por_texto
+from .models import ArchivoAdjunto
+
+
+TAMANO_PAGINA_HISTORIAL = 20
+MAX_TAMANO_PAGINA_HISTORIAL = 100
+
+ORDEN_HISTORIAL = ('-fecha_evento', '-id')
+
+
+def _parsear_fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def filtrar_eventos(eventos, params):
+    """
+    Aplica los filtros del historial (fecha_desde, fecha_hasta, tipo_evento y buscar) tomados
+    de `params` (por ejemplo request.GET). Las fechas inválidas se ignoran.
+    """
+    fecha_desde = _parsear_fecha(params.get('fecha_desde', ''))
+    if fecha_desde:
+        eventos = eventos.filter(fecha_evento__gte=fecha_desde)
+
+    fecha_hasta = _parsear_fecha(params.get('fecha_hasta', ''))
+    if fecha_hasta:
+        eventos = eventos.filter(fecha_evento__lte=fecha_hasta)
+
+    tipo_evento = params.get('tipo_evento', '')
+    if tipo_evento:
+        eventos = eventos.filter(tipo_evento=tipo_evento)
+
+    # Búsqueda de texto completo (descripción, diagnóstico, veterinario, medicación y consideraciones)
+    buscar = params.get('buscar', '')
+    if buscar:
+        eventos = filtrar_por_texto(eventos, buscar)
+    return eventos
+
+
+def codificar_cursor(evento):
+    """Cursor de la página siguiente a partir del último evento de la página actual"""
+    return f'{evento.fecha_evento.isoformat()}_{evento.pk}'
+
+
+def decodificar_cursor(cursor):
+    """Retorna (fecha_evento, id) del cursor; lanza ValueError si no es válido"""
+    fecha, _, pk = cursor.partition('_')
+    return date.fromisoformat(fecha), int(pk)
+
+
+def tamano_pagina(valor, defecto=TAMANO_PAGINA_HISTORIAL):
+    """Normaliza el tamaño de página pedido al rango permitido"""
+    try:
+        limite = int(valor)
+    except (TypeError, ValueError):
+        return defecto
+    return max(1, min(MAX_TAMANO_PAGINA_HISTORIAL, limite))
+
+
+def pagina_historial(eventos, cursor=None, limite=TAMANO_PAGINA_HISTORIAL):
+    """
+    Retorna (eventos_con_archivos, siguiente_cursor) con la página de eventos posterior
+    al cursor (o la primera si no hay cursor). siguiente_cursor es None en la última página.
+    Lanza ValueError si el cursor no es válido.
+    """
+    eventos = eventos.order_by(*ORDEN_HISTORIAL)
+    if cursor:
+        fecha, pk = decodificar_cursor(cursor)
+        eventos = eventos.filter(Q(fecha_evento__lt=fecha) | Q(fecha_evento=fecha, pk__lt=pk))
+
+    # Un evento extra indica si hay una página siguiente
+    pagina = list(eventos[:limite + 1])
+    hay_mas = len(pagina) > limite
+    pagina = pagina[:limite]
+
+    eventos_con_archivos, _ = listar_eventos_con_archivos(pagina)
+    siguiente_cursor = codificar_cursor(pagina[-1]) if hay_mas else None
+    return eventos_con_archivos, siguiente_cursor
+
+
+def archivos_de_eventos(eventos):
+    """Retorna la galería [{'archivo', 'evento'}] de todos los adjuntos de los eventos, en una consulta"""
+    archivos = (
+        ArchivoAdjunto.objects
+        .filter(evento_clinico__in=eventos.order_by().values('pk'))
+        .select_related('evento_clinico')
+        .order_by('-fecha_subida', '-id')
+    )
+    return [{'archivo': archivo, 'evento': archivo.evento_clinico} for archivo in archivos]
+
+
+def evento_a_dict(evento, archivos):
+    """Representación JSON de un evento del historial con sus adjuntos"""
+    return {
+        'id': evento.pk,
+        'fecha_evento': evento.fecha_evento.isoformat(),
+        'hora_evento': evento.hora_evento.strftime('%H:%M') if evento.hora_evento else None,
+        'tipo_evento': evento.tipo_evento,
+        'tipo_evento_display': evento.get_tipo_evento_display(),
+        'descripcion': evento.descripcion,
+        'diagnostico': evento.diagnostico,
+        'veterinario': evento.veterinario,
+        'medicacion': evento.medicacion,
+        'consideraciones': evento.consideraciones,
+        'archivos': [
+            {
+                'id': archivo.pk,
+                'nombre': archivo.nombre,
+                'url': reverse('descargar_adjunto', args=[archivo.pk]) if archivo.archivo else None,
+                'tipo_archivo': archivo.tipo_archivo,
+                'tamano': archivo.tamano,
+                'tamano_display': archivo.obtener_tamano_display(),
+                'es_imagen': archivo.es_imagen(),
+            }
+            for archivo in archivos
+        ],
+    }
+
+
+def listar_eventos_con_archivos(eventos):
+    """
+    Recibe un queryset de eventos ya filtrado y ordenado y retorna (eventos_con_archivos, todos_los_archivos):
+    - eventos_con_archivos: [{'evento', 'archivos'}] en el orden del queryset
+    - todos_los_archivos: [{'archivo', 'evento'}] del más reciente al más antiguo
+    """
+    eventos = list(eventos)
+    if not eventos:
+        return [], []
+
+    por_id = {evento.pk: evento for evento in eventos}
+    archivos_por_evento = {evento.pk: [] for evento in eventos}
+    todos_los_archivos = []
+
+    archivos = (
+        ArchivoAdjunto.objects
+        .filter(evento_clinico_id__in=list(por_id))
+        .order_by('-fecha_subida', '-id')
+    )
+    for archivo in archivos:
+        evento = por_id[archivo.evento_clinico_id]
+        # Reutilizar el evento ya cargado si el template accede a archivo.evento_clinico
+        archivo.evento_clinico = evento
+        archivos_por_evento[evento.pk].append(archivo)
+        todos_los_archivos.append({
+            'archivo': archivo,
+            'evento': evento,
+        })
+
+    eventos_con_archivos = [
+        {
+            'evento': evento,
+            'archivos': archivos_por_evento[evento.pk],
+        }
+        for evento in eventos
+    ]
+    return eventos_con_archivos, todos_los_archivos
@@ -0,0 +1,214 @@
+"""
+Exportación de la ficha clínica completa de una mascota en un ZIP.
+
+exportar_ficha_zip() es un generador de bytes: arma el ZIP con zipfile sobre una salida
+sin seek (entradas con data descriptor) y entrega lo escrito después de cada bloque, de
+modo que la memoria usada no depende del tamaño de la ficha ni de los adjuntos. Los eventos,
+pesos y revisiones se leen por lotes y los adjuntos se copian por chunks desde el storage.
+
+Contenido del ZIP:
+    ficha.json       datos de la mascota y de su ficha clínica actual
+    eventos.csv      eventos clínicos, del más antiguo al más reciente
+    pesos.csv        registros de peso
+    vacunas.csv      vacunas aplicadas
+    historial.json   revisiones anteriores de la ficha, reconstruidas completas
+    adjuntos.csv     índice de adjuntos (evento, nombre, SHA-256 y ruta dentro del ZIP)
+    adjuntos/<evento>/<adjunto>-<nombre>
+"""
+
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.text import get_valid_filename, slugify
+
+from .historial import iterar_revisiones
+from .models import ArchivoAdjunto, EventoClinico, FichaClinica, PesoMascota, Vacunacion
+
+
+TAMANO_LOTE_EXPORTACION = 500
+TAMANO_CHUNK_ADJUNTO = 256 * 1024
+
+CAMPOS_MASCOTA = ('id', 'nombre', 'especie', 'raza', 'fecha_nacimiento', 'color_pelaje', 'sexo', 'esterilizado', 'microchip', 'activa')
+CAMPOS_FICHA = (
+    'tipo_sangre', 'peso', 'temperatura', 'frecuencia_cardiaca', 'esterilizado', 'vacunas_al_dia',
+    'alergias', 'condiciones_cronicas', 'medicamentos_actuales', 'historial_enfermedades',
+    'ultima_visita', 'proxima_cita', 'microchip', 'comentarios', 'creado_en', 'actualizado_en',
+)
+CAMPOS_EVENTO = (
+    'id', 'fecha_evento', 'hora_evento', 'tipo_evento', 'descripcion', 'diagnostico', 'veterinario',
+    'medicacion', 'proximos_eventos', 'consideraciones', 'creado_en',
+)
+CAMPOS_PESO = ('fecha', 'peso', 'creado_en')
+CAMPOS_VACUNA = ('vacuna', 'fecha_aplicacion', 'proxima_dosis', 'lote', 'veterinario', 'evento_clinico_id')
+CAMPOS_ADJUNTO = ('id', 'evento_clinico_id', 'nombre', 'tipo_archivo', 'tamano', 'sha256', 'fecha_subida', 'ruta')
+
+
+class _Salida:
+    """Destino del ZipFile sin seek: acumula lo escrito hasta que el generador lo entrega"""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def nombre_exportacion(mascota, hoy=None):
+    hoy = hoy or timezone.localdate()
+    return f'mascotia-{slugify(mascota.nombre) or mascota.pk}-{hoy:%Y%m%d}.zip'
+
+
+def _info(nombre, fecha=None, comprimir=True):
+    fecha = timezone.localtime(fecha) if fecha else timezone.localtime()
+    # ZIP no admite fechas anteriores a 1980
+    info = zipfile.ZipInfo(nombre, date_time=max(fecha.timetuple()[:6], (1980, 1, 1, 0, 0, 0)))
+    info.compress_type = zipfile.ZIP_DEFLATED if comprimir else zipfile.ZIP_STORED
+    return info
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat() if timezone.is_aware(valor) else valor.isoformat()
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return '' if valor is None else valor
+
+
+def _escribir_csv(zf, salida, nombre, campos, filas):
+    """Escribe una entrada CSV con las filas (tuplas de valores) y entrega lo escrito por lotes"""
+    with zf.open(_info(nombre), 'w') as destino:
+        texto = io.TextIOWrapper(destino, encoding='utf-8', newline='')
+        escritor = csv.writer(texto)
+        escritor.writerow(campos)
+        for indice, fila in enumerate(filas, 1):
+            escritor.writerow([_valor(valor) for valor in fila])
+            if indice % TAMANO_LOTE_EXPORTACION == 0:
+                texto.flush()
+                yield salida.vaciar()
+        texto.flush()
+        texto.detach()
+    yield salida.vaciar()
+
+
+def _escribir_json(zf, salida, nombre, datos):
+    with zf.open(_info(nombre), 'w') as destino:
+        destino.write(json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2).encode())
+    yield salida.vaciar()
+
+
+def _escribir_json_lista(zf, salida, nombre, elementos):
+    """Escribe una lista JSON elemento por elemento, sin armarla en memoria"""
+    with zf.open(_info(nombre), 'w') as destino:
+        destino.write(b'[')
+        for indice, elemento in enumerate(elementos):
+            if indice:
+                destino.write(b',')
+            destino.write(b'\n  ' + json.dumps(elemento, cls=DjangoJSONEncoder, ensure_ascii=False).encode())
+            if (indice + 1) % TAMANO_LOTE_EXPORTACION == 0:
+                yield salida.vaciar()
+        destino.write(b'\n]\n')
+    yield salida.vaciar()
+
+
+def _datos_ficha(mascota, ficha):
+    return {
+        'exportado_en': timezone.localtime(),
+        'mascota': {campo: getattr(mascota, campo) for campo in CAMPOS_MASCOTA},
+        'ficha_clinica': {campo: getattr(ficha, campo) for campo in CAMPOS_FICHA} if ficha else None,
+    }
+
+
+def _ruta_adjunto(adjunto):
+    nombre = get_valid_filename(adjunto.nombre) or 'archivo'
+    return f'adjuntos/{adjunto.evento_clinico_id}/{adjunto.pk}-{nombre}'
+
+
+def _adjuntos(ficha):
+    return (
+        ArchivoAdjunto.objects
+        .filter(evento_clinico__ficha_clinica=ficha)
+        .order_by('evento_clinico_id', 'id')
+        .iterator(chunk_size=TAMANO_LOTE_EXPORTACION)
+    )
+
+
+def exportar_ficha_zip(mascota):
+    """Generador con los bytes del ZIP de la ficha clínica completa de la mascota"""
+    return (parte for parte in _partes_zip(mascota) if parte)
+
+
+def _partes_zip(mascota):
+    salida = _Salida()
+    ficha = FichaClinica.objects.filter(mascota=mascota).first()
+
+    with zipfile.ZipFile(salida, 'w') as zf:
+        yield from _escribir_json(zf, salida, 'ficha.json', _datos_ficha(mascota, ficha))
+
+        pesos = PesoMascota.objects.filter(mascota=mascota).order_by('fecha', 'id')
+        yield from _escribir_csv(
+            zf, salida, 'pesos.csv', CAMPOS_PESO,
+            pesos.values_list(*CAMPOS_PESO).iterator(chunk_size=TAMANO_LOTE_EXPORTACION),
+        )
+
+        if ficha is not None:
+            eventos = EventoClinico.objects.filter(ficha_clinica=ficha).order_by('fecha_evento', 'hora_evento', 'id')
+            yield from _escribir_csv(
+                zf, salida, 'eventos.csv', CAMPOS_EVENTO,
+                eventos.values_list(*CAMPOS_EVENTO).iterator(chunk_size=TAMANO_LOTE_EXPORTACION),
+            )
+
+            vacunas = Vacunacion.objects.filter(ficha_clinica=ficha).order_by('fecha_aplicacion', 'id')
+            yield from _escribir_csv(
+                zf, salida, 'vacunas.csv', CAMPOS_VACUNA,
+                vacunas.values_list(*CAMPOS_VACUNA).iterator(chunk_size=TAMANO_LOTE_EXPORTACION),
+            )
+
+            revisiones = (
+                {'id': revision.pk, 'creado_en': revision.creado_en, **revision.estado}
+                for revision in iterar_revisiones(ficha.pk, TAMANO_LOTE_EXPORTACION)
+            )
+            yield from _escribir_json_lista(zf, salida, 'historial.json', revisiones)
+
+            filas_adjuntos = (
+                tuple(getattr(adjunto, campo) for campo in CAMPOS_ADJUNTO[:-1]) + (_ruta_adjunto(adjunto),)
+                for adjunto in _adjuntos(ficha)
+            )
+            yield from _escribir_csv(zf, salida, 'adjuntos.csv', CAMPOS_ADJUNTO, filas_adjuntos)
+
+            for adjunto in _adjuntos(ficha):
+                yield from _copiar_adjunto(zf, salida, adjunto)
+
+    yield salida.vaciar()
+
+
+def _copiar_adjunto(zf, salida, adjunto):
+    try:
+        origen = adjunto.archivo.open('rb')
+    except (OSError, ValueError):
+        # El archivo ya no está en el storage: queda solo su fila en adjuntos.csv
+        return
+    # Imágenes y PDF ya vienen comprimidos: se guardan sin volver a comprimir
+    comprimir = adjunto.tipo_archivo in ('txt', 'doc')
+    info = _info(_ruta_adjunto(adjunto), adjunto.fecha_subida, comprimir)
+    try:
+        with zf.open(info, 'w', force_zip64=adjunto.tamano >= zipfile.ZIP64_LIMIT) as destino:
+            for chunk in origen.chunks(TAMANO_CHUNK_ADJUNTO):
+                destino.write(chunk)
+                yield salida.vaciar()
+    finally:
+        origen.close()
+    yield salida.vaciar()
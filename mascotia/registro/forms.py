@@ -3,7 +3,11 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
-from .models import PerfilTutor, Mascota, FichaClinica, EventoClinico, ArchivoAdjunto
+from .models import PerfilTutor, Mascota, FichaClinica, EventoClinico
+from .vacunas import registrar_vacuna_ficha, ultima_vacunacion
+from .adjuntos import guardar_adjuntos
+from .altas import crear_tutor
+from .microchips import microchip_en_uso, validar_microchip
 
 
 class RegistroForm(UserCreationForm):
@@ -88,7 +92,8 @@ class RegistroForm(UserCreationForm):
     
     def save(self, commit=True):
         email = self.cleaned_data['email']
-        user = User.objects.create_user(
+        # Usuario y PerfilTutor en una transacción (ver altas.py)
+        user = crear_tutor(
             username=email,
             email=email,
             password=self.cleaned_data['password1'],
@@ -973,21 +978,10 @@ class FichaClinicaForm(forms.ModelForm):
             
             # Mapear valores existentes de vacunas
             if es_nuevo_registro and self.instance and self.instance.pk:
-                # Verificar si hay información de vacunas en comentarios primero
-                if self.instance.comentarios and 'Última vacuna:' in self.instance.comentarios:
-                    import re
-                    match = re.search(r'Última vacuna: ([^-]+)', self.instance.comentarios)
-                    if match:
-                        vacuna_nombre = match.group(1).strip()
-                        if vacuna_nombre in [choice[0] for choice in vacunas_choices]:
-                            self.initial['vacunas_estado'] = vacuna_nombre
-                        else:
-                            self.initial['vacunas_estado'] = 'desconocido'
-                    else:
-                        self.initial['vacunas_estado'] = 'desconocido'
-                elif self.instance.vacunas_al_dia:
-                    # Si está al día pero no hay vacuna específica, usar "desconocido" por ahora
-                    self.initial['vacunas_estado'] = 'desconocido'
+                # La última vacuna registrada (ver vacunas.py) preselecciona la opción
+                ultima = ultima_vacunacion(self.instance)
+                if ultima and ultima.vacuna in [choice[0] for choice in vacunas_choices]:
+                    self.initial['vacunas_estado'] = ultima.vacuna
                 else:
                     self.initial['vacunas_estado'] = 'desconocido'
             
@@ -1000,6 +994,13 @@ class FichaClinicaForm(forms.ModelForm):
                 else:
                     self.initial['esterilizado'] = 'desconocido'
     
+    def clean_microchip(self):
+        # Normalizado y, si es un microchip ISO, sin repetir el de otra mascota (ver microchips.py)
+        microchip = validar_microchip(self.cleaned_data.get('microchip'))
+        if microchip_en_uso(microchip, self.instance.mascota_id):
+            raise forms.ValidationError('Este microchip ya está registrado en otra mascota.')
+        return microchip or None
+    
     def clean(self):
         cleaned_data = super().clean()
         esterilizado = cleaned_data.get('esterilizado', '')
@@ -1045,19 +1046,8 @@ class FichaClinicaForm(forms.ModelForm):
                 else:
                     nombre_vacuna = 'Otra (sin especificar)'
             
-            # Guardar información de la vacuna en comentarios
-            comentarios_actual = cleaned_data.get('comentarios', '') or ''
-            # Limpiar información anterior de vacunas si existe
-            if 'Última vacuna:' in comentarios_actual:
-                import re
-                comentarios_actual = re.sub(r'Última vacuna:.*?(?=\n|$)', '', comentarios_actual).strip()
-            info_vacuna = f"Última vacuna: {nombre_vacuna}"
-            if ultima_vacuna_fecha:
-                info_vacuna += f" - Fecha: {ultima_vacuna_fecha.strftime('%d/%m/%Y')}"
-            if comentarios_actual:
-                cleaned_data['comentarios'] = f"{comentarios_actual}\n{info_vacuna}".strip()
-            else:
-                cleaned_data['comentarios'] = info_vacuna
+            # La vacuna se registra como Vacunacion al guardar la ficha
+            cleaned_data['vacuna_nombre'] = nombre_vacuna
         elif vacunas_estado == 'no':
             cleaned_data['vacunas_al_dia'] = False
         else:  # desconocido o vacío
@@ -1095,6 +1085,9 @@ class FichaClinicaForm(forms.ModelForm):
         
         if commit:
             instance.save()
+            vacuna_nombre = self.cleaned_data.get('vacuna_nombre')
+            if vacuna_nombre:
+                registrar_vacuna_ficha(instance, vacuna_nombre, self.cleaned_data.get('ultima_vacuna_fecha'))
         return instance
 
 
@@ -1187,14 +1180,6 @@ class EventoClinicoForm(forms.ModelForm):
         
         if commit and archivos_adjuntos:
             # Guardar archivos adjuntos pasados desde la vista
-            for archivo in archivos_adjuntos:
-                extension = archivo.name.split('.')[-1].lower() if '.' in archivo.name else ''
-                ArchivoAdjunto.objects.create(
-                    evento_clinico=evento,
-                    nombre=archivo.name,
-                    archivo=archivo,
-                    tipo_archivo=extension,
-                    tamano=archivo.size
-                )
+            guardar_adjuntos(evento, archivos_adjuntos)
         
         return evento
@@ -0,0 +1,203 @@
+"""
+Historial de la ficha clínica codificado por diferencias.
+
+Cada HistorialFichaClinica guarda el estado anterior de la ficha. Los campos numéricos y
+cortos (peso, temperatura, vacuna...) se guardan siempre, pero los campos de texto largos
+solo se guardan cuando cambiaron respecto de la revisión anterior (los demás quedan en NULL
+y campos_guardados indica cuáles se guardaron). Cada KEYFRAME_CADA revisiones se guarda una
+revisión completa (keyframe), de modo que reconstruir cualquier revisión requiere leer a lo más
+KEYFRAME_CADA filas.
+
+Las revisiones de una ficha se ordenan por id. Para eliminar una revisión se debe usar
+eliminar_revision(), que traspasa sus cambios a la revisión siguiente.
+"""
+
+from django.db import transaction
+
+from .models import HistorialFichaClinica
+
+
+KEYFRAME_CADA = 10
+
+# Campos de texto que se guardan solo cuando cambian
+CAMPOS_DELTA = ('alergias', 'condiciones_cronicas', 'medicamentos_actuales', 'historial_enfermedades', 'comentarios')
+
+# Campos que se guardan en todas las revisiones
+CAMPOS_COMPLETOS = ('tipo_sangre', 'peso', 'temperatura', 'esterilizado', 'vacunas_al_dia', 'vacuna_nombre', 'vacuna_fecha')
+
+CAMPOS_REVISION = CAMPOS_COMPLETOS + CAMPOS_DELTA
+
+
+class Revision:
+    """Estado reconstruido de la ficha en una revisión del historial"""
+
+    def __init__(self, registro, estado):
+        self.id = registro.pk
+        self.pk = registro.pk
+        self.ficha_clinica_id = registro.ficha_clinica_id
+        self.creado_en = registro.creado_en
+        self.es_keyframe = registro.es_keyframe
+        self.estado = estado
+        for campo, valor in estado.items():
+            setattr(self, campo, valor)
+
+    def __repr__(self):
+        return f'<Revision {self.pk} de la ficha {self.ficha_clinica_id}>'
+
+
+def _aplicar(estado, registro):
+    """Aplica la fila (keyframe o diferencia) sobre el estado y lo retorna"""
+    if registro.es_keyframe:
+        return {campo: getattr(registro, campo) for campo in CAMPOS_REVISION}
+    estado = dict(estado)
+    for campo in CAMPOS_COMPLETOS:
+        estado[campo] = getattr(registro, campo)
+    for campo in registro.campos_guardados:
+        estado[campo] = getattr(registro, campo)
+    return estado
+
+
+def _estado_vacio():
+    return {campo: None for campo in CAMPOS_REVISION}
+
+
+def _filas_desde_keyframe(ficha_id, hasta_id=None):
+    """Filas desde el último keyframe (inclusive) hasta hasta_id (o la última revisión), en orden"""
+    registros = HistorialFichaClinica.objects.filter(ficha_clinica_id=ficha_id)
+    if hasta_id is not None:
+        registros = registros.filter(pk__lte=hasta_id)
+    keyframe_id = (
+        registros.filter(es_keyframe=True)
+        .order_by('-id')
+        .values_list('id', flat=True)
+        .first()
+    )
+    if keyframe_id is not None:
+        registros = registros.filter(pk__gte=keyframe_id)
+    return list(registros.order_by('id'))
+
+
+def _reconstruir(filas):
+    estado = _estado_vacio()
+    for registro in filas:
+        estado = _aplicar(estado, registro)
+    return estado
+
+
+def reconstruir_revision(registro_id):
+    """Retorna el estado completo {campo: valor} de la ficha en la revisión indicada (None si no existe)"""
+    ficha_id = HistorialFichaClinica.objects.filter(pk=registro_id).values_list('ficha_clinica_id', flat=True).first()
+    if ficha_id is None:
+        return None
+    return _reconstruir(_filas_desde_keyframe(ficha_id, registro_id))
+
+
+def diferencias(registro_a_id, registro_b_id):
+    """Retorna {campo: (valor_en_a, valor_en_b)} con los campos que difieren entre dos revisiones"""
+    estado_a = reconstruir_revision(registro_a_id) or _estado_vacio()
+    estado_b = reconstruir_revision(registro_b_id) or _estado_vacio()
+    return {
+        campo: (estado_a[campo], estado_b[campo])
+        for campo in CAMPOS_REVISION
+        if estado_a[campo] != estado_b[campo]
+    }
+
+
+def revisiones_ficha(ficha_id, limite=None, recientes_primero=False):
+    """
+    Retorna las revisiones de la ficha (objetos Revision) reconstruidas en una pasada.
+    Con limite, solo las `limite` más antiguas (o las más recientes si recientes_primero).
+    """
+    registros = HistorialFichaClinica.objects.filter(ficha_clinica_id=ficha_id).order_by('id')
+    if limite is not None and recientes_primero:
+        # Basta leer desde el keyframe anterior a la primera revisión pedida
+        ids = list(registros.order_by('-id').values_list('id', flat=True)[:limite])
+        if not ids:
+            return []
+        filas = _filas_desde_keyframe(ficha_id, ids[-1]) + list(registros.filter(pk__gt=ids[-1]))
+    else:
+        filas = list(registros[:limite] if limite is not None else registros)
+
+    revisiones = []
+    estado = _estado_vacio()
+    for registro in filas:
+        estado = _aplicar(estado, registro)
+        revisiones.append(Revision(registro, estado))
+
+    if limite is not None and recientes_primero:
+        revisiones = revisiones[-limite:]
+    if recientes_primero:
+        revisiones.reverse()
+    return revisiones
+
+
+def iterar_revisiones(ficha_id, tamano_lote=500):
+    """Revisiones de la ficha de la más antigua a la más reciente, leyendo por lotes (para exportar)"""
+    registros = HistorialFichaClinica.objects.filter(ficha_clinica_id=ficha_id).order_by('id')
+    estado = _estado_vacio()
+    for registro in registros.iterator(chunk_size=tamano_lote):
+        estado = _aplicar(estado, registro)
+        yield Revision(registro, estado)
+
+
+def registrar_revision(ficha, **valores):
+    """
+    Guarda el estado actual de la ficha como una nueva revisión del historial.
+    `valores` permite completar o reemplazar campos que no están en la ficha (vacuna_nombre, vacuna_fecha).
+    Retorna el HistorialFichaClinica creado.
+    """
+    estado = {campo: getattr(ficha, campo, None) for campo in CAMPOS_REVISION}
+    estado.update(valores)
+
+    with transaction.atomic():
+        filas = _filas_desde_keyframe(ficha.pk)
+        registro = HistorialFichaClinica(ficha_clinica=ficha)
+        for campo in CAMPOS_COMPLETOS:
+            setattr(registro, campo, estado[campo])
+
+        if not filas or len(filas) >= KEYFRAME_CADA:
+            # Revisión completa
+            registro.es_keyframe = True
+            registro.campos_guardados = []
+            for campo in CAMPOS_DELTA:
+                setattr(registro, campo, estado[campo])
+        else:
+            anterior = _reconstruir(filas)
+            cambiados = [campo for campo in CAMPOS_DELTA if estado[campo] != anterior[campo]]
+            registro.es_keyframe = False
+            registro.campos_guardados = cambiados
+            for campo in cambiados:
+                setattr(registro, campo, estado[campo])
+        registro.save()
+    return registro
+
+
+def eliminar_revision(registro):
+    """
+    Elimina una revisión manteniendo reconstruibles las siguientes: sus cambios se traspasan a la
+    revisión siguiente (o esta pasa a ser keyframe si la eliminada lo era).
+    """
+    with transaction.atomic():
+        siguiente = (
+            HistorialFichaClinica.objects
+            .select_for_update()
+            .filter(ficha_clinica_id=registro.ficha_clinica_id, pk__gt=registro.pk)
+            .order_by('id')
+            .first()
+        )
+        if siguiente is not None and not siguiente.es_keyframe:
+            if registro.es_keyframe:
+                # La siguiente pasa a ser completa con el estado reconstruido
+                estado = reconstruir_revision(siguiente.pk)
+                for campo in CAMPOS_DELTA:
+                    setattr(siguiente, campo, estado[campo])
+                siguiente.es_keyframe = True
+                siguiente.campos_guardados = []
+            else:
+                # Los cambios de la eliminada que la siguiente no sobrescribe se traspasan
+                for campo in registro.campos_guardados:
+                    if campo not in siguiente.campos_guardados:
+                        setattr(siguiente, campo, getattr(registro, campo))
+                        siguiente.campos_guardados = siguiente.campos_guardados + [campo]
+            siguiente.save(update_fields=[*CAMPOS_DELTA, 'es_keyframe', 'campos_guardados'])
+        registro.delete()
@@ -0,0 +1,174 @@
+"""
+Derivados redimensionados de las fotos de mascotas y tutores.
+
+Al subir una foto se generan, en un pool de hilos y después del commit, versiones en WebP y
+JPEG de cada tamaño (avatar, tarjeta y completa), sin metadatos EXIF y con la orientación ya
+aplicada. Los archivos se guardan bajo el hash del contenido original
+(derivados/<xx>/<hash>/<tamaño>.<formato>), de modo que la misma foto genera siempre los mismos
+nombres y pueden servirse con caché permanente.
+
+Cuando terminan, el campo <foto>_derivados de la instancia guarda el hash y los templates
+usan el filtro `derivada` (registro_extras) para elegir el tamaño; mientras no existan se
+usa la foto original. El comando generar_derivados_fotos procesa las fotos existentes.
+"""
+
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .context_processors import invalidar_mascotas_usuario
+from .models import Mascota, PerfilTutor
+
+
+logger = logging.getLogger(__name__)
+
+# Lado máximo en píxeles; el avatar se recorta cuadrado
+TAMANOS_DERIVADOS = {
+    'avatar': 128,
+    'tarjeta': 480,
+    'completa': 1600,
+}
+TAMANOS_CUADRADOS = {'avatar'}
+
+# Extensión: (formato de Pillow, opciones de guardado)
+FORMATOS_DERIVADOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+FORMATO_POR_DEFECTO = 'webp'
+
+CARPETA_DERIVADOS = 'derivados'
+
+# Campos de foto con derivados: (modelo, campo de la foto, campo de los derivados)
+CAMPOS_FOTO = (
+    (Mascota, 'foto', 'foto_derivados'),
+    (PerfilTutor, 'foto_perfil', 'foto_perfil_derivados'),
+)
+
+HILOS_DERIVADOS = 2
+_pool = None
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=HILOS_DERIVADOS, thread_name_prefix='derivados')
+    return _pool
+
+
+def ruta_derivado(hash_contenido, tamano, formato=FORMATO_POR_DEFECTO):
+    return f'{CARPETA_DERIVADOS}/{hash_contenido[:2]}/{hash_contenido}/{tamano}.{formato}'
+
+
+def url_derivada(foto, tamano, formato=FORMATO_POR_DEFECTO):
+    """
+    URL del derivado de la foto (FieldFile de un campo en CAMPOS_FOTO) en el tamaño y formato pedidos,
+    o la de la foto original si aún no se generan. Retorna '' si no hay foto.
+    """
+    if not foto:
+        return ''
+    derivados = getattr(foto.instance, f'{foto.field.name}_derivados', None) or {}
+    # Los derivados corresponden a la foto actual solo si se generaron desde el mismo archivo
+    if derivados.get('origen') == foto.name and tamano in TAMANOS_DERIVADOS and formato in FORMATOS_DERIVADOS:
+        return foto.storage.url(ruta_derivado(derivados['hash'], tamano, formato))
+    return foto.url
+
+
+def _redimensionar(imagen, tamano):
+    lado = TAMANOS_DERIVADOS[tamano]
+    if tamano in TAMANOS_CUADRADOS:
+        return ImageOps.fit(imagen, (lado, lado), Image.LANCZOS)
+    copia = imagen.copy()
+    copia.thumbnail((lado, lado), Image.LANCZOS)
+    return copia
+
+
+def _a_rgb(imagen):
+    """Convierte a RGB aplanando la transparencia sobre fondo blanco"""
+    if imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info):
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.getchannel('A'))
+        return fondo
+    return imagen.convert('RGB')
+
+
+def generar_derivados(foto):
+    """
+    Genera (si no existen) los derivados de la foto y retorna el valor para <foto>_derivados.
+    Lanza OSError o UnidentifiedImageError si el archivo no es una imagen válida.
+    """
+    foto.open('rb')
+    try:
+        contenido = foto.read()
+    finally:
+        foto.close()
+    hash_contenido = hashlib.sha256(contenido).hexdigest()
+    storage = foto.storage
+
+    imagen = None
+    for tamano in TAMANOS_DERIVADOS:
+        for formato, (formato_pil, opciones) in FORMATOS_DERIVADOS.items():
+            ruta = ruta_derivado(hash_contenido, tamano, formato)
+            if storage.exists(ruta):
+                continue
+            if imagen is None:
+                imagen = Image.open(BytesIO(contenido))
+                # Aplicar la orientación EXIF antes de descartar los metadatos
+                imagen = _a_rgb(ImageOps.exif_transpose(imagen))
+            salida = BytesIO()
+            # Sin exif= Pillow no copia los metadatos del original
+            _redimensionar(imagen, tamano).save(salida, formato_pil, **opciones)
+            storage.save(ruta, ContentFile(salida.getvalue()))
+
+    return {'origen': foto.name, 'hash': hash_contenido}
+
+
+def procesar_foto(modelo, pk, campo, campo_derivados):
+    """Genera los derivados de la foto actual de la instancia y los registra en ella"""
+    instancia = modelo.objects.filter(pk=pk).first()
+    foto = getattr(instancia, campo, None) if instancia else None
+    if not foto:
+        return None
+    try:
+        derivados = generar_derivados(foto)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning('No se pudieron generar los derivados de %s %s', modelo.__name__, pk, exc_info=True)
+        return None
+
+    # Solo si la foto no cambió mientras se procesaba (update no dispara señales)
+    actualizados = modelo.objects.filter(pk=pk, **{campo: foto.name}).update(**{campo_derivados: derivados})
+    if actualizados and modelo is Mascota:
+        invalidar_mascotas_usuario(instancia.tutor_id)
+    return derivados
+
+
+def _procesar_en_pool(modelo, pk, campo, campo_derivados):
+    try:
+        procesar_foto(modelo, pk, campo, campo_derivados)
+    except Exception:
+        logger.exception('Error al generar los derivados de %s %s', modelo.__name__, pk)
+    finally:
+        # Los hilos del pool no pasan por el ciclo de request que cierra las conexiones
+        connections.close_all()
+
+
+def encolar_derivados(instancia, campo, campo_derivados):
+    """Programa la generación de derivados en el pool cuando la transacción actual termine"""
+    modelo, pk = type(instancia), instancia.pk
+    transaction.on_commit(lambda: _obtener_pool().submit(_procesar_en_pool, modelo, pk, campo, campo_derivados))
+
+
+def foto_actualizada(instancia, campo, campo_derivados, update_fields=None):
+    """Usado por las señales: encola los derivados si la foto cambió desde la última generación"""
+    if update_fields is not None and campo not in update_fields:
+        return
+    foto = getattr(instancia, campo)
+    derivados = getattr(instancia, campo_derivados) or {}
+    if foto and derivados.get('origen') != foto.name:
+        encolar_derivados(instancia, campo, campo_derivados)
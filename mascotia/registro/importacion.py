@@ -0,0 +1,482 @@
+"""
+Importación masiva de mascotas, registros de peso y eventos clínicos desde CSV o JSON.
+
+El archivo se lee como flujo y cada fila se valida por separado: las filas con errores se
+informan (fila y motivo) y el resto se importa. Las filas válidas se acumulan en lotes de
+TAMANO_LOTE_IMPORTACION y cada lote se guarda con bulk_create, creando en conjunto las
+fichas clínicas de las mascotas nuevas (altas.crear_mascotas) y las vacunaciones de los
+eventos de vacuna.
+
+bulk_create no emite señales, así que lo que hacen los receptores de models.py se hace
+una sola vez por importación: índice de búsqueda (por lote), métricas de salud de las
+fichas afectadas y cachés de series de peso, de las vistas de cada mascota y del menú de
+mascotas.
+
+Formatos:
+- CSV (separado por comas o punto y coma) con la columna `tipo` (mascota, peso o evento).
+  Las mascotas llevan una `ref` propia del archivo; los pesos y eventos indican en `mascota`
+  esa ref o el id de una mascota ya registrada del tutor. Las demás columnas son los campos
+  del modelo (fecha y fecha_evento son equivalentes en los eventos). Los eventos de vacuna
+  pueden traer `vacuna`, `proxima_dosis` y `lote` (sin `vacuna`, se usa la descripción).
+- JSON: arreglo u objetos por línea (JSON Lines). Un objeto sin `tipo` es una mascota y puede
+  traer sus `pesos` y `eventos` anidados; también se aceptan objetos planos como en el CSV.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .altas import crear_mascotas
+from .busqueda import indexar_eventos_nuevos
+from .microchips import es_microchip_iso, microchip_en_uso, validar_microchip
+from .models import EventoClinico, FichaClinica, Mascota, PesoMascota, Vacunacion
+from .pesos import invalidar_serie_peso
+from .salud import recalcular_metricas_salud
+from .vacunas import datos_vacuna_evento
+from .vistas_mascota import invalidar_vistas_mascota
+
+
+TAMANO_LOTE_IMPORTACION = 1000
+TAMANO_BLOQUE_LECTURA = 64 * 1024
+
+# Tamaño máximo del archivo subido por la vista (el comando no tiene límite)
+TAMANO_MAXIMO_IMPORTACION = 25 * 1024 * 1024
+
+# Errores de fila que se conservan en el resultado (el total se cuenta igual)
+MAX_ERRORES_INFORMADOS = 200
+
+TIPO_MASCOTA = 'mascota'
+TIPO_PESO = 'peso'
+TIPO_EVENTO = 'evento'
+
+CAMPOS_MASCOTA = ('nombre', 'raza', 'color_pelaje', 'microchip')
+CAMPOS_EVENTO = ('descripcion', 'diagnostico', 'veterinario', 'medicacion', 'proximos_eventos', 'consideraciones')
+
+VALORES_VERDADEROS = {'1', 'si', 'sí', 's', 'true', 'verdadero', 'x', 'yes'}
+VALORES_FALSOS = {'0', 'no', 'n', 'false', 'falso'}
+
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+
+class ErrorImportacion(ValueError):
+    """El archivo completo no se puede leer (formato desconocido, CSV sin columna tipo, JSON inválido)"""
+
+
+class ErrorFila(ValueError):
+    pass
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.filas = 0
+        self.mascotas = 0
+        self.pesos = 0
+        self.eventos = 0
+        self.vacunas = 0
+        self.total_errores = 0
+        self.errores = []
+        self.simulado = False
+
+    def agregar_error(self, fila, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES_INFORMADOS:
+            self.errores.append((fila, mensaje))
+
+    def como_dict(self):
+        return {
+            'filas': self.filas,
+            'mascotas': self.mascotas,
+            'pesos': self.pesos,
+            'eventos': self.eventos,
+            'vacunas': self.vacunas,
+            'simulado': self.simulado,
+            'total_errores': self.total_errores,
+            'errores': [{'fila': fila, 'error': mensaje} for fila, mensaje in self.errores],
+        }
+
+
+# Lectura
+
+def formato_archivo(nombre, inicio=b''):
+    """'csv' o 'json' según la extensión o, si no la hay, según el primer carácter del contenido"""
+    extension = nombre.rsplit('.', 1)[-1].lower() if '.' in nombre else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'json'
+    primero = inicio.lstrip(b'\xef\xbb\xbf \t\r\n')[:1]
+    if primero in (b'[', b'{'):
+        return 'json'
+    if primero:
+        return 'csv'
+    raise ErrorImportacion('El archivo está vacío.')
+
+
+def _filas_csv(texto):
+    muestra = texto.read(TAMANO_BLOQUE_LECTURA)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra.split('\n', 1)[0], delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.DictReader(texto, dialect=dialecto)
+    columnas = [columna.strip().lower() for columna in lector.fieldnames or []]
+    if 'tipo' not in columnas:
+        raise ErrorImportacion('El CSV debe tener la columna "tipo" (mascota, peso o evento).')
+    lector.fieldnames = columnas
+    for fila in lector:
+        # line_num es la línea física donde terminó la fila (los textos pueden tener saltos de línea)
+        yield lector.line_num, fila
+
+
+def _objetos_json(texto):
+    """Objetos de un arreglo JSON o de JSON Lines, decodificados de a uno mientras se lee el archivo"""
+    decodificador = json.JSONDecoder()
+    buffer, posicion, agotado = '', 0, False
+    while True:
+        while posicion < len(buffer) and buffer[posicion] in ' \t\r\n,[]':
+            posicion += 1
+        if posicion == len(buffer):
+            if agotado:
+                return
+            buffer, posicion = texto.read(TAMANO_BLOQUE_LECTURA), 0
+            agotado = not buffer
+            continue
+        try:
+            objeto, fin = decodificador.raw_decode(buffer, posicion)
+        except json.JSONDecodeError:
+            bloque = '' if agotado else texto.read(TAMANO_BLOQUE_LECTURA)
+            if not bloque:
+                raise ErrorImportacion('El JSON no es válido.')
+            buffer, posicion = buffer[posicion:] + bloque, 0
+            continue
+        yield objeto
+        posicion = fin
+
+
+def _filas_json(texto):
+    for numero, objeto in enumerate(_objetos_json(texto), 1):
+        if not isinstance(objeto, dict):
+            yield numero, None
+            continue
+        if objeto.get('tipo'):
+            yield numero, objeto
+            continue
+        # Mascota con sus pesos y eventos anidados; si no trae ref se le asigna una
+        pesos = objeto.pop('pesos', None) or []
+        eventos = objeto.pop('eventos', None) or []
+        ref = str(objeto.get('ref') or f'#{numero}')
+        yield numero, {**objeto, 'tipo': TIPO_MASCOTA, 'ref': ref}
+        for tipo, hijos in ((TIPO_PESO, pesos), (TIPO_EVENTO, eventos)):
+            for hijo in hijos:
+                yield numero, ({**hijo, 'tipo': tipo, 'mascota': ref} if isinstance(hijo, dict) else None)
+
+
+def leer_filas(archivo, nombre=''):
+    """Genera (número de fila, dict) desde un archivo binario; la fila es None si no es un objeto"""
+    inicio = archivo.read(64)
+    archivo.seek(0)
+    formato = formato_archivo(nombre, inicio)
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    try:
+        yield from (_filas_csv(texto) if formato == 'csv' else _filas_json(texto))
+    except UnicodeDecodeError:
+        raise ErrorImportacion('El archivo debe estar codificado en UTF-8.')
+    finally:
+        # El archivo lo cierra quien lo abrió
+        texto.detach()
+
+
+# Validación de valores
+
+def _valor(fila, campo):
+    valor = fila.get(campo)
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _texto(fila, campo, modelo):
+    valor = _valor(fila, campo)
+    maximo = modelo._meta.get_field(campo).max_length
+    if valor and maximo and len(valor) > maximo:
+        raise ErrorFila(f'{campo}: máximo {maximo} caracteres.')
+    return valor
+
+
+def _fecha(valor, campo):
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    raise ErrorFila(f'{campo}: fecha inválida "{valor}" (use AAAA-MM-DD o DD/MM/AAAA).')
+
+
+def _fecha_opcional(fila, campo):
+    valor = _valor(fila, campo)
+    return _fecha(valor, campo) if valor else None
+
+
+def _hora(fila, campo):
+    valor = _valor(fila, campo)
+    if not valor:
+        return None
+    for formato in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(valor, formato).time()
+        except ValueError:
+            continue
+    raise ErrorFila(f'{campo}: hora inválida "{valor}" (use HH:MM).')
+
+
+def _booleano(fila, campo, por_defecto):
+    valor = fila.get(campo)
+    if isinstance(valor, bool):
+        return valor
+    valor = _valor(fila, campo)
+    if valor is None:
+        return por_defecto
+    if valor.lower() in VALORES_VERDADEROS:
+        return True
+    if valor.lower() in VALORES_FALSOS:
+        return False
+    raise ErrorFila(f'{campo}: valor inválido "{valor}" (use sí o no).')
+
+
+def _opcion(fila, campo, opciones, por_defecto=None):
+    """Acepta el valor o la etiqueta de la opción, sin distinguir mayúsculas"""
+    valor = _valor(fila, campo)
+    if valor is None:
+        if por_defecto is None:
+            raise ErrorFila(f'{campo}: es obligatorio.')
+        return por_defecto
+    buscado = valor.lower()
+    for clave, etiqueta in opciones:
+        if buscado in (clave.lower(), str(etiqueta).lower()):
+            return clave
+    validas = ', '.join(clave for clave, _ in opciones)
+    raise ErrorFila(f'{campo}: "{valor}" no es válido (opciones: {validas}).')
+
+
+def _peso(fila):
+    valor = _valor(fila, 'peso')
+    if valor is None:
+        raise ErrorFila('peso: es obligatorio.')
+    try:
+        peso = Decimal(valor.replace(',', '.')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ErrorFila(f'peso: "{valor}" no es un número.')
+    if peso <= 0 or peso >= 1000:
+        raise ErrorFila('peso: debe ser mayor a 0 y menor a 1000 kg.')
+    return peso
+
+
+# Importación
+
+class _Importador:
+    """Estado de una importación: refs del archivo, lotes pendientes y lo que se debe actualizar al final"""
+
+    def __init__(self, tutor, tamano_lote, hoy):
+        self.tutor = tutor
+        self.tamano_lote = tamano_lote
+        self.hoy = hoy
+        self.resultado = ResultadoImportacion()
+        # ref o id -> (mascota_id, ficha_id) de mascotas guardadas, o Mascota del lote pendiente
+        self.destinos = {
+            str(mascota_id): (mascota_id, ficha_id)
+            for mascota_id, ficha_id in Mascota.objects.filter(tutor=tutor).values_list('id', 'ficha_clinica__id')
+        }
+        self.refs_archivo = set()
+        self.refs_fallidas = set()
+        self.microchips = set()
+        self.mascotas = []
+        self.pesos = []
+        self.eventos = []
+        self.fichas_afectadas = set()
+        self.mascotas_con_pesos = set()
+        self.mascotas_con_eventos = set()
+
+    def pendientes(self):
+        return len(self.mascotas) + len(self.pesos) + len(self.eventos)
+
+    def agregar(self, numero, fila):
+        self.resultado.filas += 1
+        try:
+            if fila is None:
+                raise ErrorFila('el registro debe ser un objeto.')
+            tipo = (_valor(fila, 'tipo') or '').lower()
+            if tipo == TIPO_MASCOTA:
+                self._agregar_mascota(fila)
+            elif tipo == TIPO_PESO:
+                self._agregar_peso(fila)
+            elif tipo == TIPO_EVENTO:
+                self._agregar_evento(fila)
+            else:
+                raise ErrorFila(f'tipo "{tipo}" desconocido (mascota, peso o evento).')
+        except ErrorFila as error:
+            self.resultado.agregar_error(numero, str(error))
+            return
+        if self.pendientes() >= self.tamano_lote:
+            self.guardar_lote()
+
+    def _agregar_mascota(self, fila):
+        ref = _valor(fila, 'ref')
+        if not ref:
+            raise ErrorFila('ref: es obligatoria para las mascotas.')
+        if ref in self.refs_archivo or ref in self.refs_fallidas:
+            raise ErrorFila(f'ref: "{ref}" está repetida en el archivo.')
+        try:
+            datos = {campo: _texto(fila, campo, Mascota) for campo in CAMPOS_MASCOTA}
+            if not datos['nombre']:
+                raise ErrorFila('nombre: es obligatorio.')
+            datos['microchip'] = self._microchip(datos['microchip'])
+            mascota = Mascota(
+                tutor=self.tutor,
+                especie=_opcion(fila, 'especie', Mascota.ESPECIE_CHOICES),
+                sexo=_opcion(fila, 'sexo', Mascota.SEXO_CHOICES, por_defecto='') or None,
+                fecha_nacimiento=_fecha_opcional(fila, 'fecha_nacimiento'),
+                esterilizado=_booleano(fila, 'esterilizado', False),
+                activa=_booleano(fila, 'activa', True),
+                **datos,
+            )
+        except ErrorFila:
+            # Sus pesos y eventos se informarán como errores en vez de asignarse a otra mascota
+            self.refs_fallidas.add(ref)
+            raise
+        mascota.ref_importacion = ref
+        self.refs_archivo.add(ref)
+        self.destinos[ref] = mascota
+        self.mascotas.append(mascota)
+
+    def _microchip(self, valor):
+        try:
+            codigo = validar_microchip(valor)
+        except ValidationError as error:
+            raise ErrorFila(f'microchip: {error.messages[0]}')
+        if es_microchip_iso(codigo):
+            if codigo in self.microchips or microchip_en_uso(codigo):
+                raise ErrorFila(f'microchip: {codigo} ya está registrado en otra mascota.')
+            self.microchips.add(codigo)
+        return codigo or None
+
+    def _destino(self, fila):
+        ref = _valor(fila, 'mascota')
+        if not ref:
+            raise ErrorFila('mascota: indique la ref o el id de la mascota.')
+        if ref in self.refs_fallidas:
+            raise ErrorFila(f'mascota: "{ref}" no se importó por errores en su fila.')
+        destino = self.destinos.get(ref)
+        if destino is None:
+            raise ErrorFila(f'mascota: "{ref}" no está antes en el archivo ni es una mascota registrada.')
+        return destino
+
+    def _agregar_peso(self, fila):
+        destino = self._destino(fila)
+        fecha = _fecha_opcional(fila, 'fecha')
+        if fecha is None:
+            raise ErrorFila('fecha: es obligatoria.')
+        peso = PesoMascota(fecha=fecha, peso=_peso(fila))
+        if isinstance(destino, Mascota):
+            peso.mascota = destino
+        else:
+            peso.mascota_id = destino[0]
+        self.pesos.append(peso)
+
+    def _agregar_evento(self, fila):
+        destino = self._destino(fila)
+        if not isinstance(destino, Mascota) and destino[1] is None:
+            raise ErrorFila('mascota: no tiene ficha clínica.')
+        fecha = _fecha_opcional(fila, 'fecha_evento') or _fecha_opcional(fila, 'fecha')
+        if fecha is None:
+            raise ErrorFila('fecha_evento: es obligatoria.')
+        evento = EventoClinico(
+            fecha_evento=fecha,
+            hora_evento=_hora(fila, 'hora_evento'),
+            tipo_evento=_opcion(fila, 'tipo_evento', EventoClinico.TIPO_EVENTO_CHOICES, EventoClinico.TIPO_COMENTARIO),
+            **{campo: _texto(fila, campo, EventoClinico) for campo in CAMPOS_EVENTO},
+        )
+        if evento.tipo_evento == EventoClinico.TIPO_VACUNA:
+            # Campos de su Vacunacion (ver vacunas.datos_vacuna_evento)
+            evento.datos_vacuna = {
+                'vacuna': _texto(fila, 'vacuna', Vacunacion),
+                'proxima_dosis': _fecha_opcional(fila, 'proxima_dosis'),
+                'lote': _texto(fila, 'lote', Vacunacion),
+            }
+        if isinstance(destino, Mascota):
+            # Su ficha se crea al guardar el lote
+            evento.mascota_importada = destino
+        else:
+            evento.ficha_clinica_id = destino[1]
+            self.mascotas_con_eventos.add(destino[0])
+        self.eventos.append(evento)
+
+    def guardar_lote(self):
+        if self.mascotas:
+            # Mascotas y fichas en bloque, sin las señales crear_ficha_clinica (ver altas.py)
+            crear_mascotas(self.mascotas)
+            self.resultado.mascotas += len(self.mascotas)
+
+        if self.pesos:
+            PesoMascota.objects.bulk_create(self.pesos)
+            self.mascotas_con_pesos.update(peso.mascota_id for peso in self.pesos)
+            self.resultado.pesos += len(self.pesos)
+
+        if self.eventos:
+            for evento in self.eventos:
+                if evento.ficha_clinica_id is None:
+                    evento.ficha_clinica = evento.mascota_importada.ficha_clinica
+            EventoClinico.objects.bulk_create(self.eventos)
+            vacunas = Vacunacion.objects.bulk_create([
+                Vacunacion(evento_clinico=evento, **datos_vacuna_evento(evento))
+                for evento in self.eventos
+                if evento.tipo_evento == EventoClinico.TIPO_VACUNA
+            ])
+            indexar_eventos_nuevos(self.eventos)
+            self.fichas_afectadas.update(evento.ficha_clinica_id for evento in self.eventos)
+            self.resultado.eventos += len(self.eventos)
+            self.resultado.vacunas += len(vacunas)
+
+        # Las mascotas guardadas quedan como ids para las filas siguientes
+        for mascota in self.mascotas:
+            self.destinos[mascota.ref_importacion] = (mascota.pk, mascota.ficha_clinica.pk)
+        self.mascotas, self.pesos, self.eventos = [], [], []
+
+    def finalizar(self):
+        self.guardar_lote()
+        fichas_ids = sorted(self.fichas_afectadas)
+        for inicio in range(0, len(fichas_ids), self.tamano_lote):
+            fichas = FichaClinica.objects.filter(pk__in=fichas_ids[inicio:inicio + self.tamano_lote])
+            recalcular_metricas_salud(fichas, self.hoy)
+
+    def invalidar_caches(self):
+        for mascota_id in self.mascotas_con_pesos:
+            invalidar_serie_peso(mascota_id)
+        # Las mascotas creadas en la importación aún no tienen vistas en caché
+        for mascota_id in self.mascotas_con_pesos | self.mascotas_con_eventos:
+            invalidar_vistas_mascota(mascota_id)
+
+
+def importar_archivo(archivo, tutor, nombre='', simular=False, tamano_lote=TAMANO_LOTE_IMPORTACION, hoy=None):
+    """
+    Importa las filas del archivo (binario, con seek) para el tutor y retorna un
+    ResultadoImportacion. Con simular=True valida y guarda todo dentro de una transacción
+    que luego se revierte. Lanza ErrorImportacion si el archivo no se puede leer.
+    """
+    with transaction.atomic():
+        importador = _Importador(tutor, tamano_lote, hoy)
+        for numero, fila in leer_filas(archivo, nombre):
+            importador.agregar(numero, fila)
+        importador.finalizar()
+        if simular:
+            transaction.set_rollback(True)
+    importador.resultado.simulado = simular
+    if not simular:
+        importador.invalidar_caches()
+    return importador.resultado
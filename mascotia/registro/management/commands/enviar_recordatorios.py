@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from mascotia.registro.recordatorios import (
+    DURACION_LEASE,
+    TAMANO_LOTE_RECORDATORIOS,
+    entregar_recordatorios,
+    obtener_backend,
+    reclamar_recordatorios,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía los recordatorios vencidos por lotes. Por defecto procesa la cola y termina '
+        '(para cron); con --continuo queda esperando nuevos recordatorios. '
+        'Se pueden ejecutar varios workers a la vez.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE_RECORDATORIOS, help='Recordatorios reclamados por lote')
+        parser.add_argument(
+            '--lease', type=int, default=int(DURACION_LEASE.total_seconds()),
+            help='Segundos que un lote queda reservado para este worker',
+        )
+        parser.add_argument('--continuo', action='store_true', help='No terminar cuando la cola queda vacía')
+        parser.add_argument('--espera', type=float, default=5, help='Segundos de espera con la cola vacía (con --continuo)')
+
+    def handle(self, *args, **options):
+        lote = max(1, options['lote'])
+        duracion_lease = timedelta(seconds=max(1, options['lease']))
+        backend = obtener_backend()
+
+        total_enviados = total_fallidos = 0
+        try:
+            while True:
+                recordatorios = reclamar_recordatorios(lote, duracion_lease)
+                if not recordatorios:
+                    if not options['continuo']:
+                        break
+                    time.sleep(options['espera'])
+                    continue
+                enviados, fallidos = entregar_recordatorios(recordatorios, backend)
+                total_enviados += enviados
+                total_fallidos += fallidos
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recordatorios enviados: {total_enviados}; con error: {total_fallidos}.'
+        ))
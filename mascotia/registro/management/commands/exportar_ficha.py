@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mascotia.registro.exportacion import exportar_ficha_zip, nombre_exportacion
+from mascotia.registro.models import Mascota
+
+
+class Command(BaseCommand):
+    help = 'Exporta en un ZIP la ficha clínica completa de una mascota (eventos, pesos, historial y adjuntos).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('mascota_id', type=int)
+        parser.add_argument('--salida', help='Ruta del ZIP (por defecto mascotia-<nombre>-<fecha>.zip; "-" para la salida estándar)')
+
+    def handle(self, *args, **options):
+        mascota = Mascota.objects.filter(pk=options['mascota_id']).first()
+        if mascota is None:
+            raise CommandError(f'No existe la mascota {options["mascota_id"]}.')
+
+        ruta = options['salida'] or nombre_exportacion(mascota)
+        if ruta == '-':
+            for parte in exportar_ficha_zip(mascota):
+                sys.stdout.buffer.write(parte)
+            sys.stdout.buffer.flush()
+            return
+
+        total = 0
+        with open(ruta, 'wb') as archivo:
+            for parte in exportar_ficha_zip(mascota):
+                archivo.write(parte)
+                total += len(parte)
+        self.stdout.write(self.style.SUCCESS(f'Ficha de {mascota.nombre} exportada en {ruta} ({total / (1024 * 1024):.2f} MB).'))
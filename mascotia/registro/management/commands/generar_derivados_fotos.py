@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from mascotia.registro.imagenes import CAMPOS_FOTO, HILOS_DERIVADOS, procesar_foto
+
+
+class Command(BaseCommand):
+    help = 'Genera los derivados redimensionados (avatar, tarjeta y completa) de las fotos de mascotas y tutores.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Procesar también las fotos que ya tienen derivados')
+        parser.add_argument('--hilos', type=int, default=HILOS_DERIVADOS, help='Cantidad de fotos procesadas en paralelo')
+
+    def handle(self, *args, **options):
+        generadas = fallidas = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['hilos'])) as pool:
+            for modelo, campo, campo_derivados in CAMPOS_FOTO:
+                pendientes = []
+                filas = modelo.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True})
+                for pk, foto, derivados in filas.values_list('pk', campo, campo_derivados).iterator():
+                    if options['todas'] or (derivados or {}).get('origen') != foto:
+                        pendientes.append(pk)
+
+                resultados = pool.map(lambda pk: procesar_foto(modelo, pk, campo, campo_derivados), pendientes)
+                for resultado in resultados:
+                    if resultado:
+                        generadas += 1
+                    else:
+                        fallidas += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Derivados generados para {generadas} foto(s).'))
+        if fallidas:
+            self.stdout.write(self.style.WARNING(f'{fallidas} foto(s) no se pudieron procesar (ver el log).'))
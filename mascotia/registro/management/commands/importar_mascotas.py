@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from mascotia.registro.importacion import ErrorImportacion, importar_archivo
+
+
+class Command(BaseCommand):
+    help = 'Importa mascotas, registros de peso y eventos clínicos de un tutor desde un archivo CSV o JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--tutor', required=True, help='Nombre de usuario o id del tutor')
+        parser.add_argument('--simular', action='store_true', help='Valida e informa sin guardar nada')
+        parser.add_argument('--errores', type=int, default=20, help='Errores de fila que se muestran')
+
+    def handle(self, *args, **options):
+        tutor = User.objects.filter(username=options['tutor']).first()
+        if tutor is None and options['tutor'].isdigit():
+            tutor = User.objects.filter(pk=int(options['tutor'])).first()
+        if tutor is None:
+            raise CommandError(f'No existe el tutor {options["tutor"]}.')
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importar_archivo(archivo, tutor, nombre=options['archivo'], simular=options['simular'])
+        except OSError as error:
+            raise CommandError(f'No se pudo leer el archivo: {error}')
+        except ErrorImportacion as error:
+            raise CommandError(str(error))
+
+        for fila, mensaje in resultado.errores[:max(0, options['errores'])]:
+            self.stderr.write(f'Fila {fila}: {mensaje}')
+        if resultado.total_errores > options['errores']:
+            self.stderr.write(f'... y {resultado.total_errores - options["errores"]} error(es) más.')
+
+        accion = 'validadas (simulación, no se guardó nada)' if resultado.simulado else 'importadas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.filas} fila(s) {accion}: {resultado.mascotas} mascota(s), {resultado.pesos} peso(s), '
+            f'{resultado.eventos} evento(s) ({resultado.vacunas} vacuna(s)); {resultado.total_errores} fila(s) con errores.'
+        ))
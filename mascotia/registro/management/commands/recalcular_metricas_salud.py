@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from mascotia.registro.models import FichaClinica
+from mascotia.registro.salud import recalcular_metricas_salud
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula las métricas de salud precalculadas de las fichas clínicas. '
+        'Por defecto solo las calculadas antes de hoy (ejecución nocturna); '
+        'con --todas recalcula todas las fichas (backfill).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Recalcular todas las fichas, no solo las vencidas')
+        parser.add_argument('--lote', type=int, default=500, help='Cantidad de fichas por lote')
+
+    def handle(self, *args, **options):
+        hoy = timezone.now().date()
+        fichas = FichaClinica.objects.order_by('pk')
+        if not options['todas']:
+            fichas = fichas.filter(Q(metricas_calculadas_en__isnull=True) | Q(metricas_calculadas_en__lt=hoy))
+
+        lote = max(1, options['lote'])
+        total = 0
+        ultimo_pk = 0
+        # Paginación por clave para no cargar todas las fichas en memoria
+        while True:
+            fichas_lote = list(fichas.filter(pk__gt=ultimo_pk)[:lote])
+            if not fichas_lote:
+                break
+            recalcular_metricas_salud(fichas_lote, hoy)
+            total += len(fichas_lote)
+            ultimo_pk = fichas_lote[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f'Métricas de salud recalculadas para {total} ficha(s).'))
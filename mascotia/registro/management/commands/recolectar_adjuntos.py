@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from mascotia.registro.adjuntos import (
+    ANTIGUEDAD_MINIMA_RECOLECCION,
+    migrar_adjuntos_anteriores,
+    recolectar_archivos_huerfanos,
+    recolectar_contenidos,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Migra los adjuntos anteriores al almacenamiento por contenido (eliminando las copias repetidas) '
+        'y elimina los contenidos que ya no usa ningún adjunto y los archivos de contenidos sin registro.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--antiguedad', type=int, default=int(ANTIGUEDAD_MINIMA_RECOLECCION.total_seconds() // 60),
+            help='Minutos que debe llevar un contenido sin referencias antes de eliminarlo',
+        )
+        parser.add_argument('--sin-migrar', action='store_true', help='No revisar los adjuntos anteriores')
+
+    def handle(self, *args, **options):
+        if not options['sin_migrar']:
+            migrados, copias = migrar_adjuntos_anteriores()
+            if migrados:
+                self.stdout.write(f'{migrados} adjunto(s) anteriores migrados; {copias} copia(s) repetida(s) eliminada(s).')
+
+        antiguedad = timedelta(minutes=max(0, options['antiguedad']))
+        cantidad, liberados = recolectar_contenidos(antiguedad)
+        self.stdout.write(self.style.SUCCESS(
+            f'{cantidad} contenido(s) sin referencias eliminado(s) ({liberados / (1024 * 1024):.2f} MB liberados).'
+        ))
+        huerfanos, liberados = recolectar_archivos_huerfanos(antiguedad)
+        if huerfanos:
+            self.stdout.write(self.style.SUCCESS(
+                f'{huerfanos} archivo(s) sin registro eliminado(s) ({liberados / (1024 * 1024):.2f} MB liberados).'
+            ))
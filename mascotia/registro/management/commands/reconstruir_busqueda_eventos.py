@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from mascotia.registro.busqueda import indice_disponible, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Vacía y vuelve a poblar los índices de búsqueda de texto completo (eventos clínicos y registros históricos).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Cantidad de eventos por lote')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Base de datos a reconstruir')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not indice_disponible(using):
+            self.stdout.write(self.style.WARNING(
+                'La base de datos no tiene índice de búsqueda (se usa búsqueda por icontains). Ejecuta migrate.'
+            ))
+            return
+
+        # En una transacción para que las búsquedas nunca vean el índice a medio poblar
+        with transaction.atomic(using=using):
+            total = reconstruir_indice(lote=max(1, options['lote']), using=using)
+        self.stdout.write(self.style.SUCCESS(f'Índices de búsqueda reconstruidos con {total} registro(s).'))
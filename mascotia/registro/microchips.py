@@ -0,0 +1,186 @@
+"""
+Registro de microchips y búsqueda de mascotas por microchip.
+
+Los microchips ISO 11784 (15 dígitos: código de país o fabricante y número nacional) se
+registran normalizados en Microchip, con índice único, que es la fuente de verdad: un mismo
+chip no puede quedar asociado a dos mascotas y la búsqueda por código usa ese índice.
+Mascota.microchip (copiado en FichaClinica.microchip) es la copia que se muestra en la
+ficha: el microchip registrado o, si la mascota no tiene, uno provisorio (M000001).
+
+asignar_microchip() es el único punto que cambia el identificador de una mascota existente
+(bitácora y admin): lo normaliza, actualiza el registro y las dos copias. El receptor
+registrar_microchip_mascota de models.py registra el de una mascota nueva y rechaza (con
+IntegrityError) guardar una mascota con el chip de otra.
+
+ficha_microchip() arma los datos que ve la clínica al escanear el chip, a partir de una
+sola consulta con select_related (microchip, mascota, tutor y perfil).
+"""
+
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .imagenes import url_derivada
+from .models import FichaClinica, Mascota, Microchip
+
+
+LARGO_MICROCHIP_ISO = 15
+
+# El número nacional de ISO 11784 ocupa 38 bits
+MAXIMO_NUMERO_NACIONAL = 2 ** 38 - 1
+
+# Separadores que los lectores y las personas agregan al código
+PATRON_SEPARADORES = re.compile(r'[\s\-.]')
+
+MAX_MICROCHIPS_POR_CONSULTA = 200
+
+PERMISO_CONSULTA = 'registro.consultar_microchip'
+
+
+def normalizar_microchip(valor):
+    """Quita espacios y separadores si el valor es numérico; los identificadores con letras solo se recortan"""
+    valor = (valor or '').strip()
+    sin_separadores = PATRON_SEPARADORES.sub('', valor)
+    return sin_separadores if sin_separadores.isdigit() else valor
+
+
+def es_microchip_iso(codigo):
+    """Indica si el código (ya normalizado) es un microchip ISO 11784 válido"""
+    return (
+        len(codigo) == LARGO_MICROCHIP_ISO
+        and codigo.isdigit()
+        and int(codigo[3:]) <= MAXIMO_NUMERO_NACIONAL
+    )
+
+
+def validar_microchip(valor):
+    """
+    Retorna el valor normalizado. Un valor numérico debe ser un microchip ISO 11784;
+    los identificadores con letras (como el provisorio) se aceptan tal cual.
+    """
+    codigo = normalizar_microchip(valor)
+    if codigo.isdigit() and not es_microchip_iso(codigo):
+        if len(codigo) != LARGO_MICROCHIP_ISO:
+            raise ValidationError(f'El microchip debe tener {LARGO_MICROCHIP_ISO} dígitos (ISO 11784).')
+        raise ValidationError('El número del microchip no es válido (ISO 11784).')
+    return codigo
+
+
+def microchip_en_uso(codigo, mascota_id=None):
+    """Indica si el código está registrado para otra mascota"""
+    if not es_microchip_iso(codigo):
+        return False
+    return Microchip.objects.filter(codigo=codigo).exclude(mascota_id=mascota_id).exists()
+
+
+def registrar_microchip(mascota_id, valor, nueva=False):
+    """
+    Deja el registro de la mascota de acuerdo con su identificador: lo crea o actualiza si es
+    un microchip ISO y lo elimina si no (una mascota nueva aún no tiene registro que revisar).
+    Retorna False si el chip ya está registrado en otra mascota.
+    """
+    codigo = normalizar_microchip(valor)
+    if not es_microchip_iso(codigo):
+        if not nueva:
+            Microchip.objects.filter(mascota_id=mascota_id).delete()
+        return True
+    try:
+        with transaction.atomic():
+            if nueva:
+                Microchip.objects.create(mascota_id=mascota_id, codigo=codigo)
+            else:
+                Microchip.objects.update_or_create(mascota_id=mascota_id, defaults={'codigo': codigo})
+    except IntegrityError:
+        return False
+    return True
+
+
+def registrar_microchips(mascotas):
+    """Registra en un solo INSERT los microchips ISO de mascotas recién creadas (los ya registrados se omiten)"""
+    registros = []
+    for mascota in mascotas:
+        codigo = normalizar_microchip(mascota.microchip)
+        if es_microchip_iso(codigo):
+            registros.append(Microchip(codigo=codigo, mascota_id=mascota.pk))
+    Microchip.objects.bulk_create(registros, ignore_conflicts=True)
+
+
+def asignar_microchip(mascota, valor, ficha=None):
+    """
+    Cambia el identificador de la mascota y de su ficha clínica (sin emitir señales) y
+    actualiza el registro. Retorna False si el chip ya está registrado en otra mascota
+    (en ese caso no cambia nada).
+    """
+    codigo = normalizar_microchip(valor)
+    with transaction.atomic():
+        # Si ni el identificador anterior ni el nuevo son microchips, no hay registro que tocar
+        if es_microchip_iso(codigo) or es_microchip_iso(normalizar_microchip(mascota.microchip)):
+            if not registrar_microchip(mascota.pk, codigo):
+                return False
+        Mascota.objects.filter(pk=mascota.pk).update(microchip=codigo)
+        FichaClinica.objects.filter(mascota_id=mascota.pk).update(microchip=codigo)
+    mascota.microchip = codigo
+    if ficha is not None:
+        ficha.microchip = codigo
+    return True
+
+
+def consulta_microchips(user):
+    """Registros visibles para el usuario: todos con el permiso de clínica, o solo los de sus mascotas"""
+    registros = Microchip.objects.select_related('mascota__tutor__perfil_tutor')
+    if not user.has_perm(PERMISO_CONSULTA):
+        registros = registros.filter(mascota__tutor=user)
+    return registros
+
+
+def ficha_microchip(registro):
+    """Datos de la mascota y de su tutor para quien escanea el chip"""
+    mascota = registro.mascota
+    tutor = mascota.tutor
+    perfil = getattr(tutor, 'perfil_tutor', None)
+    return {
+        'microchip': registro.codigo,
+        'mascota': {
+            'id': mascota.pk,
+            'nombre': mascota.nombre,
+            'especie': mascota.especie,
+            'especie_display': mascota.get_especie_display(),
+            'raza': mascota.raza,
+            'sexo': mascota.sexo,
+            'color_pelaje': mascota.color_pelaje,
+            'fecha_nacimiento': mascota.fecha_nacimiento.isoformat() if mascota.fecha_nacimiento else None,
+            'esterilizado': mascota.esterilizado,
+            'activa': mascota.activa,
+            'foto': url_derivada(mascota.foto, 'tarjeta'),
+        },
+        'tutor': {
+            'nombre': perfil.nombre_para_mostrar if perfil else (tutor.first_name or tutor.username),
+            'email': tutor.email,
+            'telefono': perfil.telefono if perfil else None,
+            'comuna': perfil.comuna if perfil else None,
+            'ciudad': perfil.ciudad if perfil else None,
+        },
+    }
+
+
+def buscar_microchips(user, valores):
+    """
+    Busca varios microchips en una sola consulta. Retorna una lista en el orden recibido con
+    el código normalizado, la ficha (o None si no está registrado) y el error si el código no es válido.
+    """
+    resultados = []
+    codigos = set()
+    for valor in valores:
+        codigo = normalizar_microchip(str(valor))
+        error = None if es_microchip_iso(codigo) else f'"{valor}" no es un microchip ISO 11784 de {LARGO_MICROCHIP_ISO} dígitos.'
+        if error is None:
+            codigos.add(codigo)
+        resultados.append({'codigo': codigo, 'error': error})
+
+    encontrados = {registro.codigo: registro for registro in consulta_microchips(user).filter(codigo__in=codigos)} if codigos else {}
+    for resultado in resultados:
+        registro = encontrados.get(resultado['codigo'])
+        resultado['encontrado'] = registro is not None
+        resultado['ficha'] = ficha_microchip(registro) if registro else None
+    return resultados
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0016_mascota_foto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fichaclinica',
+            name='eventos_recientes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Eventos Recientes'),
+        ),
+        migrations.AddField(
+            model_name='fichaclinica',
+            name='metricas_calculadas_en',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fichaclinica',
+            name='salud_score',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Puntaje de Salud'),
+        ),
+        migrations.AddField(
+            model_name='fichaclinica',
+            name='ultima_vacuna_fecha',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Última Vacuna'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0017_fichaclinica_metricas_salud'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventoclinico',
+            index=models.Index(fields=['ficha_clinica', 'fecha_evento', 'id'], name='evento_ficha_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventoclinico',
+            index=models.Index(fields=['ficha_clinica', 'tipo_evento', 'fecha_evento'], name='evento_ficha_tipo_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+TABLA = 'registro_eventoclinico_busqueda'
+
+PLEGADO_PG = "translate(lower(coalesce({}, '')), 'áéíóúüñàèìòù', 'aeiouunaeiou')"
+
+CAMPOS = ('descripcion', 'diagnostico', 'veterinario', 'medicacion', 'consideraciones')
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    connection = schema_editor.connection
+    campos = ', '.join(CAMPOS)
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE {TABLA} USING fts5('
+                f"ficha_clinica_id UNINDEXED, {campos}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite compilado sin FTS5: la búsqueda usa icontains
+            return
+        valores = ', '.join(f"coalesce({campo}, '')" for campo in CAMPOS)
+        schema_editor.execute(
+            f'INSERT INTO {TABLA} (rowid, ficha_clinica_id, {campos}) '
+            f'SELECT id, ficha_clinica_id, {valores} FROM registro_eventoclinico'
+        )
+    elif connection.vendor == 'postgresql':
+        documento = " || ' ' || ".join(PLEGADO_PG.format(campo) for campo in CAMPOS)
+        schema_editor.execute(
+            f'CREATE TABLE {TABLA} ('
+            'evento_id bigint PRIMARY KEY REFERENCES registro_eventoclinico (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'ficha_clinica_id bigint NOT NULL, '
+            'documento tsvector NOT NULL)'
+        )
+        schema_editor.execute(f'CREATE INDEX {TABLA}_documento_idx ON {TABLA} USING GIN (documento)')
+        schema_editor.execute(
+            f'INSERT INTO {TABLA} (evento_id, ficha_clinica_id, documento) '
+            f"SELECT id, ficha_clinica_id, to_tsvector('spanish', {documento}) FROM registro_eventoclinico"
+        )
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLA}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0018_eventoclinico_indices_historial'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,87 @@
+from django.db import migrations
+
+
+TABLA_EVENTOS = 'registro_eventoclinico_busqueda'
+TABLA_HISTORIAL = 'registro_historialfichaclinica_busqueda'
+
+PLEGADO_PG = "translate(lower(coalesce({}, '')), 'áéíóúüñàèìòù', 'aeiouunaeiou')"
+
+CAMPOS_EVENTOS = ('descripcion', 'diagnostico', 'veterinario', 'medicacion', 'consideraciones')
+CAMPOS_HISTORIAL = ('vacuna_nombre', 'alergias', 'condiciones_cronicas', 'medicamentos_actuales', 'historial_enfermedades', 'comentarios')
+
+# Nombres de los adjuntos de cada evento, separados por espacios
+ARCHIVOS_SQLITE = "(SELECT group_concat(a.nombre, ' ') FROM registro_archivoadjunto a WHERE a.evento_clinico_id = e.id)"
+ARCHIVOS_PG = "(SELECT string_agg(a.nombre, ' ') FROM registro_archivoadjunto a WHERE a.evento_clinico_id = e.id)"
+
+TOKENIZADOR = "tokenize = 'unicode61 remove_diacritics 2'"
+
+
+def crear_indices(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        tablas = connection.introspection.table_names(cursor)
+    if TABLA_EVENTOS not in tablas:
+        # Sin FTS5 en 0019: la búsqueda sigue usando icontains
+        return
+
+    if connection.vendor == 'sqlite':
+        # Las tablas FTS5 no admiten ALTER TABLE ADD COLUMN: se recrea con la columna de adjuntos
+        columnas = ', '.join(CAMPOS_EVENTOS)
+        valores = ', '.join(f"coalesce(e.{campo}, '')" for campo in CAMPOS_EVENTOS)
+        schema_editor.execute(f'DROP TABLE {TABLA_EVENTOS}')
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {TABLA_EVENTOS} USING fts5('
+            f'ficha_clinica_id UNINDEXED, {columnas}, archivos, {TOKENIZADOR})'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {TABLA_EVENTOS} (rowid, ficha_clinica_id, {columnas}, archivos) '
+            f"SELECT e.id, e.ficha_clinica_id, {valores}, coalesce({ARCHIVOS_SQLITE}, '') FROM registro_eventoclinico e"
+        )
+
+        columnas = ', '.join(CAMPOS_HISTORIAL)
+        valores = ', '.join(f"coalesce(h.{campo}, '')" for campo in CAMPOS_HISTORIAL)
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {TABLA_HISTORIAL} USING fts5(ficha_clinica_id UNINDEXED, {columnas}, {TOKENIZADOR})'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {TABLA_HISTORIAL} (rowid, ficha_clinica_id, {columnas}) '
+            f'SELECT h.id, h.ficha_clinica_id, {valores} FROM registro_historialfichaclinica h'
+        )
+    elif connection.vendor == 'postgresql':
+        expresiones = [f'e.{campo}' for campo in CAMPOS_EVENTOS] + [ARCHIVOS_PG]
+        documento = " || ' ' || ".join(PLEGADO_PG.format(expresion) for expresion in expresiones)
+        schema_editor.execute(f'DELETE FROM {TABLA_EVENTOS}')
+        schema_editor.execute(
+            f'INSERT INTO {TABLA_EVENTOS} (evento_id, ficha_clinica_id, documento) '
+            f"SELECT e.id, e.ficha_clinica_id, to_tsvector('spanish', {documento}) FROM registro_eventoclinico e"
+        )
+
+        documento = " || ' ' || ".join(PLEGADO_PG.format(f'h.{campo}') for campo in CAMPOS_HISTORIAL)
+        schema_editor.execute(
+            f'CREATE TABLE {TABLA_HISTORIAL} ('
+            'historial_id bigint PRIMARY KEY REFERENCES registro_historialfichaclinica (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'ficha_clinica_id bigint NOT NULL, '
+            'documento tsvector NOT NULL)'
+        )
+        schema_editor.execute(f'CREATE INDEX {TABLA_HISTORIAL}_documento_idx ON {TABLA_HISTORIAL} USING GIN (documento)')
+        schema_editor.execute(
+            f'INSERT INTO {TABLA_HISTORIAL} (historial_id, ficha_clinica_id, documento) '
+            f"SELECT h.id, h.ficha_clinica_id, to_tsvector('spanish', {documento}) FROM registro_historialfichaclinica h"
+        )
+
+
+def eliminar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLA_HISTORIAL}')
+        # El índice de eventos queda con la columna de adjuntos; reconstruir_busqueda_eventos lo repuebla
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0019_eventoclinico_busqueda'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, eliminar_indices),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:04
+
+from django.db import migrations, models
+
+
+# Copia de historial.py al momento de la migración
+KEYFRAME_CADA = 10
+CAMPOS_DELTA = ('alergias', 'condiciones_cronicas', 'medicamentos_actuales', 'historial_enfermedades', 'comentarios')
+
+TABLA_BUSQUEDA = 'registro_historialfichaclinica_busqueda'
+CAMPOS_BUSQUEDA = ('vacuna_nombre',) + CAMPOS_DELTA
+PLEGADO_PG = "translate(lower(coalesce({}, '')), 'áéíóúüñàèìòù', 'aeiouunaeiou')"
+
+
+def _reindexar_busqueda(schema_editor):
+    """Repuebla el índice de búsqueda del historial con el texto compactado (o restaurado)"""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        tablas = connection.introspection.table_names(cursor)
+    if TABLA_BUSQUEDA not in tablas:
+        return
+
+    schema_editor.execute(f'DELETE FROM {TABLA_BUSQUEDA}')
+    if connection.vendor == 'sqlite':
+        columnas = ', '.join(CAMPOS_BUSQUEDA)
+        valores = ', '.join(f"coalesce(h.{campo}, '')" for campo in CAMPOS_BUSQUEDA)
+        schema_editor.execute(
+            f'INSERT INTO {TABLA_BUSQUEDA} (rowid, ficha_clinica_id, {columnas}) '
+            f'SELECT h.id, h.ficha_clinica_id, {valores} FROM registro_historialfichaclinica h'
+        )
+    elif connection.vendor == 'postgresql':
+        documento = " || ' ' || ".join(PLEGADO_PG.format(f'h.{campo}') for campo in CAMPOS_BUSQUEDA)
+        schema_editor.execute(
+            f'INSERT INTO {TABLA_BUSQUEDA} (historial_id, ficha_clinica_id, documento) '
+            f"SELECT h.id, h.ficha_clinica_id, to_tsvector('spanish', {documento}) FROM registro_historialfichaclinica h"
+        )
+
+
+def _por_ficha(registros):
+    """Agrupa los registros (ordenados por ficha e id) en listas por ficha"""
+    ficha_id, grupo = None, []
+    for registro in registros:
+        if registro.ficha_clinica_id != ficha_id and grupo:
+            yield grupo
+            grupo = []
+        ficha_id = registro.ficha_clinica_id
+        grupo.append(registro)
+    if grupo:
+        yield grupo
+
+
+def compactar_historial(apps, schema_editor):
+    """Convierte los registros existentes en keyframes cada KEYFRAME_CADA revisiones y diferencias entre ellos"""
+    HistorialFichaClinica = apps.get_model('registro', 'HistorialFichaClinica')
+    db_alias = schema_editor.connection.alias
+    registros = (
+        HistorialFichaClinica.objects.using(db_alias)
+        .only('id', 'ficha_clinica_id', *CAMPOS_DELTA)
+        .order_by('ficha_clinica_id', 'id')
+    )
+
+    modificados = []
+    for grupo in _por_ficha(registros.iterator(chunk_size=2000)):
+        anterior = {}
+        for posicion, registro in enumerate(grupo):
+            estado = {campo: getattr(registro, campo) for campo in CAMPOS_DELTA}
+            if posicion % KEYFRAME_CADA:
+                registro.es_keyframe = False
+                registro.campos_guardados = [campo for campo in CAMPOS_DELTA if estado[campo] != anterior[campo]]
+                for campo in CAMPOS_DELTA:
+                    if campo not in registro.campos_guardados:
+                        setattr(registro, campo, None)
+                modificados.append(registro)
+            anterior = estado
+
+    HistorialFichaClinica.objects.using(db_alias).bulk_update(
+        modificados, ['es_keyframe', 'campos_guardados', *CAMPOS_DELTA], batch_size=500
+    )
+    _reindexar_busqueda(schema_editor)
+
+
+def expandir_historial(apps, schema_editor):
+    """Vuelve a guardar todos los registros completos"""
+    HistorialFichaClinica = apps.get_model('registro', 'HistorialFichaClinica')
+    db_alias = schema_editor.connection.alias
+    registros = (
+        HistorialFichaClinica.objects.using(db_alias)
+        .only('id', 'ficha_clinica_id', 'es_keyframe', 'campos_guardados', *CAMPOS_DELTA)
+        .order_by('ficha_clinica_id', 'id')
+    )
+
+    modificados = []
+    for grupo in _por_ficha(registros.iterator(chunk_size=2000)):
+        estado = {campo: None for campo in CAMPOS_DELTA}
+        for registro in grupo:
+            if registro.es_keyframe:
+                estado = {campo: getattr(registro, campo) for campo in CAMPOS_DELTA}
+                continue
+            for campo in registro.campos_guardados:
+                estado[campo] = getattr(registro, campo)
+            for campo in CAMPOS_DELTA:
+                setattr(registro, campo, estado[campo])
+            registro.es_keyframe = True
+            registro.campos_guardados = []
+            modificados.append(registro)
+
+    HistorialFichaClinica.objects.using(db_alias).bulk_update(
+        modificados, ['es_keyframe', 'campos_guardados', *CAMPOS_DELTA], batch_size=500
+    )
+    _reindexar_busqueda(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0020_busqueda_archivos_historial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialfichaclinica',
+            name='campos_guardados',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='historialfichaclinica',
+            name='es_keyframe',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.RunPython(compactar_historial, expandir_historial),
+    ]
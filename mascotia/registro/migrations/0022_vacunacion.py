@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0021_historial_diferencias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vacunacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vacuna', models.CharField(max_length=200)),
+                ('fecha_aplicacion', models.DateField(blank=True, null=True, verbose_name='Fecha de aplicación')),
+                ('proxima_dosis', models.DateField(blank=True, null=True, verbose_name='Próxima dosis')),
+                ('lote', models.CharField(blank=True, max_length=100, null=True)),
+                ('veterinario', models.CharField(blank=True, max_length=150, null=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('evento_clinico', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vacunacion', to='registro.eventoclinico')),
+                ('ficha_clinica', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vacunaciones', to='registro.fichaclinica')),
+            ],
+            options={
+                'verbose_name': 'Vacunación',
+                'verbose_name_plural': 'Vacunaciones',
+                'ordering': [models.OrderBy(models.F('fecha_aplicacion'), descending=True, nulls_last=True), '-id'],
+                'indexes': [models.Index(fields=['proxima_dosis'], name='vacunacion_proxima_idx'), models.Index(fields=['ficha_clinica', 'proxima_dosis'], name='vacunacion_ficha_proxima_idx'), models.Index(fields=['ficha_clinica', 'fecha_aplicacion'], name='vacunacion_ficha_fecha_idx'), models.Index(fields=['ficha_clinica', 'vacuna', 'fecha_aplicacion'], name='vacunacion_ficha_vacuna_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,119 @@
+import re
+from datetime import datetime, timedelta
+
+from django.db import migrations
+
+
+# Copia de vacunas.py al momento de la migración
+DIAS_REFUERZO_VACUNA = 365
+PATRON_PROXIMA_DOSIS = re.compile(r'^Próxima dosis: (\d{2}/\d{2}/\d{4})\s*$', re.MULTILINE)
+PATRON_LOTE = re.compile(r'^Lote: (.+?)\s*$', re.MULTILINE)
+
+# Línea que FichaClinicaForm agregaba a los comentarios de la ficha
+PATRON_ULTIMA_VACUNA = re.compile(r'Última vacuna: (.+?)(?: - Fecha: (\d{2}/\d{2}/\d{4}))?\s*$', re.MULTILINE)
+PATRON_LINEA_VACUNA = re.compile(r'Última vacuna:.*?(?=\n|$)')
+
+
+def _parsear_fecha(valor):
+    try:
+        return datetime.strptime(valor, '%d/%m/%Y').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _proxima_por_defecto(fecha):
+    return fecha + timedelta(days=DIAS_REFUERZO_VACUNA) if fecha else None
+
+
+def vacunas_desde_texto(apps, schema_editor):
+    """Crea una Vacunacion por cada evento de vacuna y por la última vacuna anotada en los comentarios"""
+    EventoClinico = apps.get_model('registro', 'EventoClinico')
+    FichaClinica = apps.get_model('registro', 'FichaClinica')
+    Vacunacion = apps.get_model('registro', 'Vacunacion')
+    db_alias = schema_editor.connection.alias
+
+    nuevas = []
+    eventos = (
+        EventoClinico.objects.using(db_alias)
+        .filter(tipo_evento='vacuna')
+        .only('id', 'ficha_clinica_id', 'fecha_evento', 'descripcion', 'veterinario')
+    )
+    for evento in eventos.iterator(chunk_size=2000):
+        descripcion = evento.descripcion or ''
+        proxima = PATRON_PROXIMA_DOSIS.search(descripcion)
+        lote = PATRON_LOTE.search(descripcion)
+        nuevas.append(Vacunacion(
+            ficha_clinica_id=evento.ficha_clinica_id,
+            evento_clinico_id=evento.id,
+            vacuna=(descripcion.split('\n')[0].strip() or 'Vacuna')[:200],
+            fecha_aplicacion=evento.fecha_evento,
+            proxima_dosis=(proxima and _parsear_fecha(proxima.group(1))) or _proxima_por_defecto(evento.fecha_evento),
+            lote=lote.group(1)[:100] if lote else None,
+            veterinario=evento.veterinario or None,
+        ))
+
+    # La línea "Última vacuna: ..." pasa a ser una Vacunacion y se quita de los comentarios
+    fichas = (
+        FichaClinica.objects.using(db_alias)
+        .filter(comentarios__contains='Última vacuna:')
+        .only('id', 'comentarios')
+    )
+    modificadas = []
+    for ficha in fichas.iterator(chunk_size=2000):
+        match = PATRON_ULTIMA_VACUNA.search(ficha.comentarios)
+        if match:
+            fecha = _parsear_fecha(match.group(2))
+            nuevas.append(Vacunacion(
+                ficha_clinica_id=ficha.id,
+                vacuna=match.group(1).strip()[:200],
+                fecha_aplicacion=fecha,
+                proxima_dosis=_proxima_por_defecto(fecha),
+            ))
+        ficha.comentarios = PATRON_LINEA_VACUNA.sub('', ficha.comentarios).strip() or None
+        modificadas.append(ficha)
+
+    Vacunacion.objects.using(db_alias).bulk_create(nuevas, batch_size=500)
+    FichaClinica.objects.using(db_alias).bulk_update(modificadas, ['comentarios'], batch_size=500)
+    # La fecha de la última vacuna del panel se recalcula con las nuevas vacunaciones
+    FichaClinica.objects.using(db_alias).filter(
+        id__in=Vacunacion.objects.using(db_alias).values('ficha_clinica_id')
+    ).update(metricas_calculadas_en=None)
+
+
+def vacunas_a_texto(apps, schema_editor):
+    """Vuelve a anotar en los comentarios la última vacuna indicada en la ficha"""
+    FichaClinica = apps.get_model('registro', 'FichaClinica')
+    Vacunacion = apps.get_model('registro', 'Vacunacion')
+    db_alias = schema_editor.connection.alias
+
+    ultimas = {}
+    vacunaciones = (
+        Vacunacion.objects.using(db_alias)
+        .filter(evento_clinico__isnull=True)
+        .order_by('ficha_clinica_id', 'id')
+    )
+    for vacunacion in vacunaciones.iterator(chunk_size=2000):
+        ultimas[vacunacion.ficha_clinica_id] = vacunacion
+
+    fichas = FichaClinica.objects.using(db_alias).filter(id__in=list(ultimas)).only('id', 'comentarios')
+    modificadas = []
+    for ficha in fichas:
+        vacunacion = ultimas[ficha.id]
+        info_vacuna = f'Última vacuna: {vacunacion.vacuna}'
+        if vacunacion.fecha_aplicacion:
+            info_vacuna += f" - Fecha: {vacunacion.fecha_aplicacion.strftime('%d/%m/%Y')}"
+        ficha.comentarios = f"{ficha.comentarios or ''}\n{info_vacuna}".strip()
+        modificadas.append(ficha)
+    FichaClinica.objects.using(db_alias).bulk_update(modificadas, ['comentarios'], batch_size=500)
+    Vacunacion.objects.using(db_alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0022_vacunacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(vacunas_desde_texto, vacunas_a_texto),
+    ]
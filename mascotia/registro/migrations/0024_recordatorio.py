@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0023_vacunacion_desde_texto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recordatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anticipacion_dias', models.PositiveSmallIntegerField(default=0, verbose_name='Días de anticipación')),
+                ('asunto', models.CharField(max_length=200)),
+                ('mensaje', models.TextField()),
+                ('vence_en', models.DateTimeField(verbose_name='Enviar el')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('lease', models.CharField(blank=True, editable=False, max_length=32, null=True)),
+                ('bloqueado_hasta', models.DateTimeField(blank=True, null=True)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('evento_clinico', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recordatorios', to='registro.eventoclinico')),
+                ('mascota', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recordatorios', to='registro.mascota')),
+                ('tutor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recordatorios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recordatorio',
+                'verbose_name_plural': 'Recordatorios',
+                'ordering': ['vence_en'],
+                'indexes': [models.Index(condition=models.Q(('estado', 'pendiente')), fields=['vence_en'], name='recordatorio_pendiente_idx'), models.Index(condition=models.Q(('lease__isnull', False)), fields=['lease'], name='recordatorio_lease_idx')],
+            },
+        ),
+    ]
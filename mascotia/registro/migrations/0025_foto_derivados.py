@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0024_recordatorio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mascota',
+            name='foto_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='perfiltutor',
+            name='foto_perfil_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0025_foto_derivados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256'),
+        ),
+    ]
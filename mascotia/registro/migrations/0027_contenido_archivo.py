@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0026_archivoadjunto_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContenidoArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('archivo', models.FileField(upload_to='adjuntos/', verbose_name='Archivo')),
+                ('tamano', models.BigIntegerField(verbose_name='Tamaño (bytes)')),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Contenido de Archivo',
+                'verbose_name_plural': 'Contenidos de Archivos',
+                'indexes': [models.Index(condition=models.Q(('referencias', 0)), fields=['creado_en'], name='contenido_sin_referencias_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='contenido',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='adjuntos', to='registro.contenidoarchivo'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def completar_perfiles_fichas(apps, schema_editor):
+    """Crea el PerfilTutor y la FichaClinica que falten, para que las vistas puedan asumir que existen"""
+    User = apps.get_model('auth', 'User')
+    PerfilTutor = apps.get_model('registro', 'PerfilTutor')
+    Mascota = apps.get_model('registro', 'Mascota')
+    FichaClinica = apps.get_model('registro', 'FichaClinica')
+    db_alias = schema_editor.connection.alias
+
+    sin_perfil = User.objects.using(db_alias).filter(perfil_tutor__isnull=True).values_list('id', flat=True)
+    PerfilTutor.objects.using(db_alias).bulk_create(
+        [PerfilTutor(user_id=user_id) for user_id in sin_perfil.iterator(chunk_size=2000)],
+        batch_size=500,
+    )
+
+    # Sin métricas calculadas: el panel las calcula la primera vez que muestra la ficha
+    sin_ficha = Mascota.objects.using(db_alias).filter(ficha_clinica__isnull=True).values_list('id', 'microchip')
+    FichaClinica.objects.using(db_alias).bulk_create(
+        [FichaClinica(mascota_id=mascota_id, microchip=microchip) for mascota_id, microchip in sin_ficha.iterator(chunk_size=2000)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0027_contenido_archivo'),
+    ]
+
+    operations = [
+        migrations.RunPython(completar_perfiles_fichas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:32
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copia de microchips.py al momento de la migración
+PATRON_SEPARADORES = re.compile(r'[\s\-.]')
+
+
+def _codigo_iso(valor):
+    codigo = PATRON_SEPARADORES.sub('', (valor or '').strip())
+    if len(codigo) == 15 and codigo.isdigit() and int(codigo[3:]) <= 2 ** 38 - 1:
+        return codigo
+    return None
+
+
+def registrar_microchips(apps, schema_editor):
+    """Registra los microchips ISO ya cargados (el de la mascota o, si no tiene, el de su ficha); ante repetidos gana la mascota más antigua"""
+    Mascota = apps.get_model('registro', 'Mascota')
+    Microchip = apps.get_model('registro', 'Microchip')
+    db_alias = schema_editor.connection.alias
+
+    registrados = set()
+    nuevos = []
+    mascotas = Mascota.objects.using(db_alias).order_by('id').values_list('id', 'microchip', 'ficha_clinica__microchip')
+    for mascota_id, microchip, microchip_ficha in mascotas.iterator(chunk_size=2000):
+        codigo = _codigo_iso(microchip) or _codigo_iso(microchip_ficha)
+        if codigo and codigo not in registrados:
+            registrados.add(codigo)
+            nuevos.append(Microchip(codigo=codigo, mascota_id=mascota_id))
+    Microchip.objects.using(db_alias).bulk_create(nuevos, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0028_completar_perfiles_fichas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Microchip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=15, unique=True, verbose_name='Código')),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('mascota', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='microchip_registrado', to='registro.mascota')),
+            ],
+            options={
+                'verbose_name': 'Microchip',
+                'verbose_name_plural': 'Microchips',
+                'ordering': ['codigo'],
+                'permissions': [('consultar_microchip', 'Puede consultar cualquier microchip (clínicas)')],
+            },
+        ),
+        migrations.RunPython(registrar_microchips, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def marcar_sin_referencias(apps, schema_editor):
+    """Los contenidos que ya no tienen referencias cuentan su plazo de recolección desde ahora"""
+    ContenidoArchivo = apps.get_model('registro', 'ContenidoArchivo')
+    db_alias = schema_editor.connection.alias
+    ContenidoArchivo.objects.using(db_alias).filter(referencias=0).update(sin_referencias_desde=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0029_microchip'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='contenidoarchivo',
+            name='contenido_sin_referencias_idx',
+        ),
+        migrations.AddField(
+            model_name='contenidoarchivo',
+            name='sin_referencias_desde',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='contenidoarchivo',
+            index=models.Index(condition=models.Q(('referencias', 0)), fields=['sin_referencias_desde'], name='contenido_sin_referencias_idx'),
+        ),
+        migrations.RunPython(marcar_sin_referencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+import re
+
+from django.db import migrations
+from django.db.models import Exists, OuterRef, Subquery
+
+
+# Copia de microchips.py al momento de la migración
+PATRON_SEPARADORES = re.compile(r'[\s\-.]')
+
+
+def _es_codigo_iso(valor):
+    codigo = PATRON_SEPARADORES.sub('', (valor or '').strip())
+    return len(codigo) == 15 and codigo.isdigit() and int(codigo[3:]) <= 2 ** 38 - 1
+
+
+def copiar_microchips_registrados(apps, schema_editor):
+    """
+    Deja Mascota.microchip y FichaClinica.microchip como copias del registro Microchip: las
+    mascotas registradas toman su código, las que tenían un chip registrado en otra mascota
+    (repetidos que 0029 no registró) quedan sin microchip y cada ficha copia el de su mascota.
+    """
+    Mascota = apps.get_model('registro', 'Mascota')
+    FichaClinica = apps.get_model('registro', 'FichaClinica')
+    Microchip = apps.get_model('registro', 'Microchip')
+    db_alias = schema_editor.connection.alias
+
+    registro = Microchip.objects.using(db_alias).filter(mascota_id=OuterRef('pk')).values('codigo')[:1]
+    Mascota.objects.using(db_alias).filter(Exists(registro)).update(microchip=Subquery(registro))
+
+    sin_registro = (
+        Mascota.objects.using(db_alias)
+        .filter(~Exists(registro), microchip__isnull=False)
+        .values_list('id', 'microchip')
+    )
+    repetidos = [mascota_id for mascota_id, microchip in sin_registro.iterator(chunk_size=2000) if _es_codigo_iso(microchip)]
+    for inicio in range(0, len(repetidos), 500):
+        Mascota.objects.using(db_alias).filter(pk__in=repetidos[inicio:inicio + 500]).update(microchip=None)
+
+    microchip_mascota = Mascota.objects.using(db_alias).filter(pk=OuterRef('mascota_id')).values('microchip')[:1]
+    FichaClinica.objects.using(db_alias).update(microchip=Subquery(microchip_mascota))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0030_contenido_sin_referencias_desde'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_microchips_registrados, migrations.RunPython.noop),
+    ]
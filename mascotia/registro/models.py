@@ -1,6 +1,6 @@
-from django.db import models
+from django.db import IntegrityError, models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
@@ -16,6 +16,8 @@ class PerfilTutor(models.Model):
     ciudad = models.CharField(max_length=100, blank=True, null=True, verbose_name='Ciudad')
     comuna = models.CharField(max_length=100, blank=True, null=True, verbose_name='Comuna')
     foto_perfil = models.ImageField(upload_to='perfiles_tutores/', blank=True, null=True, verbose_name='Foto de Perfil')
+    # Derivados redimensionados de la foto (ver imagenes.py)
+    foto_perfil_derivados = models.JSONField(default=dict, blank=True, editable=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
@@ -66,8 +68,11 @@ class Mascota(models.Model):
     color_pelaje = models.CharField(max_length=100, blank=True, null=True)
     sexo = models.CharField(max_length=10, choices=SEXO_CHOICES, blank=True, null=True, verbose_name='Sexo')
     esterilizado = models.BooleanField(default=False, verbose_name='Esterilizado')
+    # Copia del registro Microchip (o identificador provisorio); solo la cambia microchips.asignar_microchip
     microchip = models.CharField(max_length=100, blank=True, null=True)
     foto = models.ImageField(upload_to='mascotas/', blank=True, null=True, verbose_name='Foto de la Mascota')
+    # Derivados redimensionados de la foto (ver imagenes.py)
+    foto_derivados = models.JSONField(default=dict, blank=True, editable=False)
     activa = models.BooleanField(default=True, verbose_name='Activa')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
@@ -153,8 +158,14 @@ class FichaClinica(models.Model):
     historial_enfermedades = models.TextField(blank=True, null=True, verbose_name='Historial de Enfermedades')
     ultima_visita = models.DateField(blank=True, null=True, verbose_name='Última Visita')
     proxima_cita = models.DateField(blank=True, null=True, verbose_name='Próxima Cita')
+    # Copia de Mascota.microchip (ver microchips.py)
     microchip = models.CharField(max_length=100, blank=True, null=True)
     comentarios = models.TextField(blank=True, null=True, verbose_name='Comentarios Adicionales')
+    # Métricas precalculadas para el panel (ver salud.py)
+    salud_score = models.FloatField(blank=True, null=True, editable=False, verbose_name='Puntaje de Salud')
+    eventos_recientes = models.PositiveIntegerField(default=0, editable=False, verbose_name='Eventos Recientes')
+    ultima_vacuna_fecha = models.DateField(blank=True, null=True, editable=False, verbose_name='Última Vacuna')
+    metricas_calculadas_en = models.DateField(blank=True, null=True, editable=False)
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
@@ -221,6 +232,10 @@ class HistorialFichaClinica(models.Model):
     medicamentos_actuales = models.TextField(blank=True, null=True)
     historial_enfermedades = models.TextField(blank=True, null=True)
     comentarios = models.TextField(blank=True, null=True)
+    # Revisión completa o diferencia: en una diferencia los campos de texto solo se guardan
+    # si cambiaron (listados en campos_guardados). Ver historial.py
+    es_keyframe = models.BooleanField(default=True, editable=False)
+    campos_guardados = models.JSONField(default=list, blank=True, editable=False)
     creado_en = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -289,6 +304,11 @@ class EventoClinico(models.Model):
         verbose_name = 'Evento Clínico'
         verbose_name_plural = 'Eventos Clínicos'
         ordering = ['-fecha_evento']
+        indexes = [
+            # Historial paginado por cursor (fecha_evento, id) y filtros por tipo dentro de una ficha
+            models.Index(fields=['ficha_clinica', 'fecha_evento', 'id'], name='evento_ficha_fecha_idx'),
+            models.Index(fields=['ficha_clinica', 'tipo_evento', 'fecha_evento'], name='evento_ficha_tipo_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_evento_display()} - {self.ficha_clinica.mascota.nombre} ({self.fecha_evento})"
@@ -306,6 +326,28 @@ class EventoClinico(models.Model):
         return True
 
 
+class ContenidoArchivo(models.Model):
+    """Contenido de un archivo adjunto, guardado una sola vez por hash y compartido entre adjuntos (ver adjuntos.py)"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    archivo = models.FileField(upload_to='adjuntos/', verbose_name='Archivo')
+    tamano = models.BigIntegerField(verbose_name='Tamaño (bytes)')
+    # Cantidad de ArchivoAdjunto que usan este contenido; en 0 lo elimina recolectar_adjuntos
+    referencias = models.PositiveIntegerField(default=0)
+    # Desde cuándo no tiene referencias (se cuenta desde aquí el plazo antes de eliminarlo)
+    sin_referencias_desde = models.DateTimeField(blank=True, null=True, editable=False)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Contenido de Archivo'
+        verbose_name_plural = 'Contenidos de Archivos'
+        indexes = [
+            models.Index(fields=['sin_referencias_desde'], condition=models.Q(referencias=0), name='contenido_sin_referencias_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.referencias} referencia{'s' if self.referencias != 1 else ''})"
+
+
 class ArchivoAdjunto(models.Model):
     """Modelo para archivos adjuntos a eventos clínicos"""
     # Formatos permitidos
@@ -321,6 +363,12 @@ class ArchivoAdjunto(models.Model):
     archivo = models.FileField(upload_to='archivos_eventos/%Y/%m/%d/', verbose_name='Archivo')
     tipo_archivo = models.CharField(max_length=50, blank=True, null=True, verbose_name='Tipo de archivo')
     tamano = models.BigIntegerField(verbose_name='Tamaño (bytes)')
+    # Calculado al recibir el archivo (vacío en adjuntos anteriores)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False, verbose_name='SHA-256')
+    # archivo apunta al archivo de este contenido; vacío en adjuntos aún no migrados
+    contenido = models.ForeignKey(
+        ContenidoArchivo, on_delete=models.PROTECT, blank=True, null=True, editable=False, related_name='adjuntos'
+    )
     fecha_subida = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de subida')
     
     class Meta:
@@ -362,16 +410,323 @@ class ArchivoAdjunto(models.Model):
             return f"{self.tamano / (1024 * 1024):.2f} MB"
 
 
+class Vacunacion(models.Model):
+    """Dosis de vacuna aplicada a una mascota (ver vacunas.py)"""
+    ficha_clinica = models.ForeignKey(FichaClinica, on_delete=models.CASCADE, related_name='vacunaciones')
+    # Evento de tipo vacuna del que proviene; vacío si se indicó en la ficha clínica
+    evento_clinico = models.OneToOneField(EventoClinico, on_delete=models.CASCADE, blank=True, null=True, related_name='vacunacion')
+    vacuna = models.CharField(max_length=200)
+    fecha_aplicacion = models.DateField(blank=True, null=True, verbose_name='Fecha de aplicación')
+    proxima_dosis = models.DateField(blank=True, null=True, verbose_name='Próxima dosis')
+    lote = models.CharField(max_length=100, blank=True, null=True)
+    veterinario = models.CharField(max_length=150, blank=True, null=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Vacunación'
+        verbose_name_plural = 'Vacunaciones'
+        ordering = [models.F('fecha_aplicacion').desc(nulls_last=True), '-id']
+        indexes = [
+            # Próximas dosis y vacunas vencidas (de todas las mascotas o de una ficha)
+            models.Index(fields=['proxima_dosis'], name='vacunacion_proxima_idx'),
+            models.Index(fields=['ficha_clinica', 'proxima_dosis'], name='vacunacion_ficha_proxima_idx'),
+            # Listado de la ficha y dosis posteriores de la misma vacuna
+            models.Index(fields=['ficha_clinica', 'fecha_aplicacion'], name='vacunacion_ficha_fecha_idx'),
+            models.Index(fields=['ficha_clinica', 'vacuna', 'fecha_aplicacion'], name='vacunacion_ficha_vacuna_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.vacuna} - {self.ficha_clinica.mascota.nombre} ({self.fecha_aplicacion or 'sin fecha'})"
+
+
+class Recordatorio(models.Model):
+    """Aviso pendiente de envío al tutor (ver recordatorios.py)"""
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_ENVIADO = 'enviado'
+    ESTADO_FALLIDO = 'fallido'
+
+    ESTADO_CHOICES = (
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_ENVIADO, 'Enviado'),
+        (ESTADO_FALLIDO, 'Fallido'),
+    )
+
+    tutor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recordatorios')
+    mascota = models.ForeignKey(Mascota, on_delete=models.CASCADE, related_name='recordatorios')
+    evento_clinico = models.ForeignKey(EventoClinico, on_delete=models.CASCADE, blank=True, null=True, related_name='recordatorios')
+    anticipacion_dias = models.PositiveSmallIntegerField(default=0, verbose_name='Días de anticipación')
+    asunto = models.CharField(max_length=200)
+    mensaje = models.TextField()
+    vence_en = models.DateTimeField(verbose_name='Enviar el')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    # Lease del worker que lo reclamó: otro worker puede tomarlo cuando bloqueado_hasta vence
+    lease = models.CharField(max_length=32, blank=True, null=True, editable=False)
+    bloqueado_hasta = models.DateTimeField(blank=True, null=True)
+    enviado_en = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Recordatorio'
+        verbose_name_plural = 'Recordatorios'
+        ordering = ['vence_en']
+        indexes = [
+            # Cola de envío: solo los pendientes, ordenados por vencimiento
+            models.Index(fields=['vence_en'], condition=models.Q(estado='pendiente'), name='recordatorio_pendiente_idx'),
+            models.Index(fields=['lease'], condition=models.Q(lease__isnull=False), name='recordatorio_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} ({self.vence_en:%d/%m/%Y %H:%M})"
+
+
+class Microchip(models.Model):
+    """Registro canónico de microchips ISO 11784 (15 dígitos), uno por mascota (ver microchips.py)"""
+    codigo = models.CharField(max_length=15, unique=True, verbose_name='Código')
+    mascota = models.OneToOneField(Mascota, on_delete=models.CASCADE, related_name='microchip_registrado')
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Microchip'
+        verbose_name_plural = 'Microchips'
+        ordering = ['codigo']
+        permissions = [
+            ('consultar_microchip', 'Puede consultar cualquier microchip (clínicas)'),
+        ]
+
+    def __str__(self):
+        return self.codigo
+
+
+def _en_cascada(sender, origin):
+    """Indica si la eliminación viene de la de otro modelo (p. ej. los eventos de una mascota eliminada)"""
+    return origin is not None and getattr(origin, 'model', type(origin)) is not sender
+
+
 @receiver(post_save, sender=User)
-def crear_perfil_tutor(sender, instance, created, **kwargs):
-    if created:
-        PerfilTutor.objects.get_or_create(user=instance)
+def crear_perfil_tutor(sender, instance, created, raw=False, **kwargs):
+    from .altas import altas_automaticas_activas
+    # Altas fuera de altas.py (admin, createsuperuser); las fixtures traen su propio perfil
+    if created and not raw and altas_automaticas_activas():
+        PerfilTutor.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Mascota)
+def crear_ficha_clinica(sender, instance, created, raw=False, **kwargs):
+    from .altas import altas_automaticas_activas
+    if created and not raw and altas_automaticas_activas():
+        FichaClinica.objects.create(mascota=instance, microchip=instance.microchip)
+
+
+@receiver(post_save, sender=Mascota)
+@receiver(post_delete, sender=Mascota)
+def invalidar_cache_mascotas_usuario(sender, instance, **kwargs):
+    # Guardar, desactivar o eliminar una mascota cambia el selector del menú
+    from .context_processors import invalidar_mascotas_usuario
+    invalidar_mascotas_usuario(instance.tutor_id)
+
+
+@receiver(post_save, sender=PerfilTutor)
+def invalidar_cache_perfil_completo(sender, instance, raw=False, **kwargs):
+    from .perfiles import invalidar_perfil_completo
+    if not raw:
+        invalidar_perfil_completo(instance.user_id)
+
+
+@receiver(post_save, sender=PesoMascota)
+def actualizar_serie_peso_registro(sender, instance, raw=False, **kwargs):
+    from .pesos import invalidar_serie_peso
+    if not raw:
+        invalidar_serie_peso(instance.mascota_id)
+
+
+@receiver(post_save, sender=HistorialFichaClinica)
+def actualizar_serie_peso_historial(sender, instance, created, raw=False, **kwargs):
+    from .pesos import invalidar_serie_peso
+    # Un registro nuevo sin peso no agrega puntos a la serie
+    if raw or (created and not instance.peso):
+        return
+    invalidar_serie_peso(instance.ficha_clinica.mascota_id)
+
+
+@receiver(post_save, sender=FichaClinica)
+def actualizar_serie_peso_ficha(sender, instance, raw=False, update_fields=None, **kwargs):
+    from .pesos import invalidar_serie_peso
+    # El punto de la ficha cambia con su peso o con su fecha (actualizado_en, que con
+    # update_fields solo se escribe si está en la lista)
+    if not raw and (update_fields is None or {'actualizado_en', 'peso'}.intersection(update_fields)):
+        invalidar_serie_peso(instance.mascota_id)
+
+
+@receiver(post_save, sender=FichaClinica)
+def actualizar_metricas_salud_ficha(sender, instance, raw=False, update_fields=None, **kwargs):
+    from .salud import CAMPOS_PUNTAJE_SALUD, programar_metricas_ficha
+    # Guardados parciales que no tocan el puntaje (microchip, temperatura...) no lo recalculan
+    if not raw and (update_fields is None or CAMPOS_PUNTAJE_SALUD.intersection(update_fields)):
+        programar_metricas_ficha(instance.pk)
+
+
+@receiver(post_save, sender=EventoClinico)
+def actualizar_metricas_salud_evento(sender, instance, raw=False, **kwargs):
+    from .salud import programar_metricas_ficha
+    if not raw:
+        programar_metricas_ficha(instance.ficha_clinica_id)
+
+
+@receiver(post_delete, sender=EventoClinico)
+def actualizar_metricas_salud_evento_eliminado(sender, instance, origin=None, **kwargs):
+    from .salud import programar_metricas_ficha
+    # Los eventos de una ficha o mascota eliminada no tienen métricas que actualizar
+    if not _en_cascada(sender, origin):
+        programar_metricas_ficha(instance.ficha_clinica_id)
+
+
+@receiver(post_delete, sender=PesoMascota)
+def invalidar_serie_peso_registro(sender, instance, origin=None, **kwargs):
+    from .pesos import invalidar_serie_peso
+    if not _en_cascada(sender, origin):
+        invalidar_serie_peso(instance.mascota_id)
+
+
+@receiver(post_delete, sender=HistorialFichaClinica)
+def invalidar_serie_peso_historial(sender, instance, origin=None, **kwargs):
+    from .pesos import invalidar_serie_peso
+    if _en_cascada(sender, origin):
+        return
+    try:
+        invalidar_serie_peso(instance.ficha_clinica.mascota_id)
+    except FichaClinica.DoesNotExist:
+        pass
+
+
+@receiver(post_save, sender=EventoClinico)
+def indexar_evento_busqueda(sender, instance, using, raw=False, **kwargs):
+    from .busqueda import indexar_evento
+    # Con loaddata el índice se reconstruye con reconstruir_busqueda_eventos
+    if not raw:
+        indexar_evento(instance, using)
+
+
+@receiver(post_delete, sender=EventoClinico)
+def desindexar_evento_busqueda(sender, instance, using, **kwargs):
+    from .busqueda import desindexar_evento
+    desindexar_evento(instance.pk, using)
+
+
+@receiver(post_save, sender=ArchivoAdjunto)
+@receiver(post_delete, sender=ArchivoAdjunto)
+def reindexar_evento_archivos(sender, instance, using, raw=False, origin=None, **kwargs):
+    from .busqueda import indexar_evento_por_id
+    # Los nombres de los adjuntos forman parte del texto indexado del evento (que, si se
+    # elimina con sus adjuntos, ya sale del índice)
+    if not raw and not _en_cascada(sender, origin):
+        indexar_evento_por_id(instance.evento_clinico_id, using)
+
+
+@receiver(post_delete, sender=ArchivoAdjunto)
+def liberar_contenido_adjunto(sender, instance, **kwargs):
+    from .adjuntos import liberar_contenidos
+    if instance.contenido_id:
+        liberar_contenidos([instance.contenido_id])
+
+
+@receiver(post_save, sender=HistorialFichaClinica)
+def indexar_historial_busqueda(sender, instance, using, raw=False, **kwargs):
+    from .busqueda import indexar_historial
+    if not raw:
+        indexar_historial(instance, using)
+
+
+@receiver(post_delete, sender=HistorialFichaClinica)
+def desindexar_historial_busqueda(sender, instance, using, **kwargs):
+    from .busqueda import desindexar_historial
+    desindexar_historial(instance.pk, using)
+
+
+@receiver(post_save, sender=EventoClinico)
+def sincronizar_vacunacion_evento(sender, instance, created, raw=False, **kwargs):
+    from .vacunas import sincronizar_vacunacion
+    # Un evento nuevo que no es vacuna no puede tener una vacunación asociada; las fixtures
+    # traen sus propias vacunaciones
+    if not raw and (not created or instance.tipo_evento == EventoClinico.TIPO_VACUNA):
+        sincronizar_vacunacion(instance, creado=created)
+
+
+@receiver(post_save, sender=Vacunacion)
+def actualizar_metricas_salud_vacunacion(sender, instance, raw=False, **kwargs):
+    from .salud import programar_metricas_ficha
+    # La de un evento se recalcula junto con la del evento (misma ficha pendiente)
+    if not raw:
+        programar_metricas_ficha(instance.ficha_clinica_id)
+
+
+@receiver(post_delete, sender=Vacunacion)
+def actualizar_metricas_salud_vacunacion_eliminada(sender, instance, origin=None, **kwargs):
+    from .salud import programar_metricas_ficha
+    # Eliminada junto con su evento, ficha o mascota: la recalcula (o no) el receptor de esos
+    if not _en_cascada(sender, origin):
+        programar_metricas_ficha(instance.ficha_clinica_id)
+
+
+@receiver(post_save, sender=EventoClinico)
+def reprogramar_recordatorios_evento(sender, instance, created, raw=False, **kwargs):
+    from .recordatorios import reprogramar_recordatorios
+    # Los recordatorios se programan después de crear el evento; solo se ajustan si cambia
+    if not created and not raw:
+        reprogramar_recordatorios(instance)
 
 
 @receiver(post_save, sender=Mascota)
-def crear_ficha_clinica(sender, instance, created, **kwargs):
-    if created:
-        ficha, _ = FichaClinica.objects.get_or_create(mascota=instance)
-        if instance.microchip and not ficha.microchip:
-            ficha.microchip = instance.microchip
-            ficha.save(update_fields=['microchip'])
+def generar_derivados_foto_mascota(sender, instance, raw=False, update_fields=None, **kwargs):
+    from .imagenes import foto_actualizada
+    if not raw:
+        foto_actualizada(instance, 'foto', 'foto_derivados', update_fields)
+
+
+@receiver(post_save, sender=PerfilTutor)
+def generar_derivados_foto_perfil(sender, instance, raw=False, update_fields=None, **kwargs):
+    from .imagenes import foto_actualizada
+    if not raw:
+        foto_actualizada(instance, 'foto_perfil', 'foto_perfil_derivados', update_fields)
+
+
+@receiver(post_save, sender=Mascota)
+def registrar_microchip_mascota(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    from .microchips import registrar_microchip
+    # Un chip de otra mascota no se guarda: el error revierte la transacción del guardado
+    if not raw and (update_fields is None or 'microchip' in update_fields):
+        if not registrar_microchip(instance.pk, instance.microchip, nueva=created):
+            raise IntegrityError(f'El microchip {instance.microchip} ya está registrado en otra mascota.')
+
+
+@receiver(post_save, sender=EventoClinico)
+@receiver(post_delete, sender=EventoClinico)
+@receiver(post_save, sender=HistorialFichaClinica)
+@receiver(post_delete, sender=HistorialFichaClinica)
+@receiver(post_save, sender=Vacunacion)
+@receiver(post_delete, sender=Vacunacion)
+def invalidar_vistas_mascota_ficha(sender, instance, raw=False, origin=None, **kwargs):
+    from .vistas_mascota import invalidar_vistas_ficha
+    # Lo eliminado en cascada lo invalida la eliminación de su evento, ficha o mascota
+    if not raw and not _en_cascada(sender, origin):
+        invalidar_vistas_ficha(instance.ficha_clinica_id)
+
+
+@receiver(post_save, sender=Mascota)
+@receiver(post_save, sender=PesoMascota)
+@receiver(post_delete, sender=PesoMascota)
+@receiver(post_save, sender=FichaClinica)
+@receiver(post_delete, sender=FichaClinica)
+def invalidar_vistas_mascota_registro(sender, instance, raw=False, origin=None, **kwargs):
+    from .vistas_mascota import invalidar_vistas_mascota
+    if not raw and not _en_cascada(sender, origin):
+        invalidar_vistas_mascota(instance.pk if sender is Mascota else instance.mascota_id)
+
+
+@receiver(post_save, sender=ArchivoAdjunto)
+@receiver(post_delete, sender=ArchivoAdjunto)
+def invalidar_vistas_mascota_adjunto(sender, instance, raw=False, origin=None, **kwargs):
+    from .vistas_mascota import invalidar_vistas_evento
+    if not raw and not _en_cascada(sender, origin):
+        invalidar_vistas_evento(instance.evento_clinico_id)
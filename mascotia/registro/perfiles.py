@@ -0,0 +1,46 @@
+"""
+Carga del PerfilTutor una sola vez por request.
+
+El perfil se adjunta a request.perfil_tutor para que el decorador y las vistas
+compartan la misma instancia, y el indicador de perfil completo se guarda en
+caché por usuario (se invalida al guardar el PerfilTutor).
+"""
+
+from django.core.cache import cache
+
+
+CACHE_TIMEOUT_PERFIL_COMPLETO = 60 * 60
+
+
+def cache_key_perfil_completo(user_id):
+    return f'registro:perfil_completo:{user_id}'
+
+
+def invalidar_perfil_completo(user_id):
+    """Elimina del caché el indicador de perfil completo del usuario"""
+    cache.delete(cache_key_perfil_completo(user_id))
+
+
+def obtener_perfil_tutor(request):
+    """Retorna el PerfilTutor del usuario autenticado, consultándolo solo una vez por request"""
+    perfil = getattr(request, 'perfil_tutor', None)
+    if perfil is None:
+        # Todo usuario tiene su perfil (ver altas.py); el acceso inverso deja perfil.user
+        # apuntando al usuario del request, sin volver a consultarlo
+        perfil = request.user.perfil_tutor
+        request.perfil_tutor = perfil
+    return perfil
+
+
+def perfil_completo(request):
+    """Indica si el perfil del usuario está completo, usando el caché cuando es posible"""
+    perfil = getattr(request, 'perfil_tutor', None)
+    if perfil is not None:
+        return perfil.perfil_completo
+
+    key = cache_key_perfil_completo(request.user.pk)
+    completo = cache.get(key)
+    if completo is None:
+        completo = obtener_perfil_tutor(request).perfil_completo
+        cache.set(key, completo, CACHE_TIMEOUT_PERFIL_COMPLETO)
+    return completo
@@ -0,0 +1,181 @@
+"""
+Serie de peso unificada por mascota.
+
+La serie combina PesoMascota, el peso de cada HistorialFichaClinica y el peso actual
+de la FichaClinica. En caché se guarda solo la vista ya calculada (JSON del gráfico con
+muestreo, últimos registros y cambio total), que es lo único que leen las páginas, por lo
+que su costo no crece con el largo del historial.
+
+Como en vistas_mascota, la clave de la vista incluye un número de versión por mascota: las
+señales de models.py lo incrementan cuando cambia un peso (al confirmarse la transacción) y
+la próxima lectura reconstruye la serie desde la base de datos. Nunca se modifica en caché
+una serie ya guardada, así que dos escrituras simultáneas no pueden pisarse.
+
+Alcance: la serie no se mantiene de forma incremental. Cada cambio de peso cuesta una
+reconstrucción (tres consultas por índice de mascota y un recorrido de sus puntos) en la
+primera lectura posterior, no en cada página; las páginas solo leen la vista en caché. El
+muestreo promedia tramos que se desplazan al insertar un punto antiguo, de modo que una
+versión incremental tendría que recalcular igualmente la vista completa.
+"""
+
+import json
+import math
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import FichaClinica, HistorialFichaClinica, PesoMascota
+
+
+CACHE_TIMEOUT_SERIE_PESO = 60 * 60 * 24
+
+# Máximo de puntos que se envían al gráfico; series más largas se promedian por tramos
+MAX_PUNTOS_GRAFICO = 365
+
+# Registros recientes que se entregan a los templates (más reciente primero)
+MAX_ULTIMOS_REGISTROS = 20
+
+MESES_ABREV = {
+    1: 'Ene', 2: 'Feb', 3: 'Mar', 4: 'Abr', 5: 'May', 6: 'Jun',
+    7: 'Jul', 8: 'Ago', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dic'
+}
+
+# Orden de desempate entre puntos de la misma fecha (igual que al concatenar las fuentes)
+ORIGEN_PESO = 0
+ORIGEN_HISTORIAL = 1
+ORIGEN_FICHA = 2
+
+
+def cache_key_version_serie(mascota_id):
+    return f'registro:serie_peso:version:{mascota_id}'
+
+
+def cache_key_serie_vista(mascota_id, version):
+    return f'registro:serie_peso:vista:{mascota_id}:{version}'
+
+
+def _version_serie(mascota_id):
+    """Versión actual de la serie de la mascota (la crea si no existe)"""
+    key = cache_key_version_serie(mascota_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        # Si otro proceso la creó primero, se usa la suya
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def versiones_series(mascota_ids):
+    """Retorna {mascota_id: versión} de la serie de cada mascota con una sola lectura de caché"""
+    keys = {mascota_id: cache_key_version_serie(mascota_id) for mascota_id in mascota_ids}
+    en_cache = cache.get_many(list(keys.values()))
+    return {
+        mascota_id: en_cache[key] if key in en_cache else _version_serie(mascota_id)
+        for mascota_id, key in keys.items()
+    }
+
+
+def _cargar_serie_cruda(mascota_id):
+    """Consulta las tres fuentes y retorna la lista ordenada de puntos (fecha, origen, orden, peso, id)"""
+    puntos = []
+    pesos = PesoMascota.objects.filter(mascota_id=mascota_id).values_list('id', 'fecha', 'peso')
+    for peso_id, fecha, peso in pesos:
+        puntos.append((fecha, ORIGEN_PESO, peso_id, float(peso), peso_id))
+
+    historial = (
+        HistorialFichaClinica.objects
+        .filter(ficha_clinica__mascota_id=mascota_id, peso__isnull=False)
+        .exclude(peso=0)
+        .values_list('id', 'creado_en', 'peso')
+    )
+    for registro_id, creado_en, peso in historial:
+        puntos.append((creado_en.date(), ORIGEN_HISTORIAL, registro_id, float(peso), None))
+
+    ficha = FichaClinica.objects.filter(mascota_id=mascota_id).values_list('id', 'actualizado_en', 'peso').first()
+    if ficha and ficha[2]:
+        puntos.append((ficha[1].date(), ORIGEN_FICHA, ficha[0], float(ficha[2]), None))
+
+    puntos.sort()
+    return puntos
+
+
+def _punto_display(fecha, peso, peso_id):
+    return {
+        'id': peso_id,
+        'fecha': fecha,
+        'fecha_display': fecha.strftime('%d/%m/%Y'),
+        'mes_abrev': MESES_ABREV.get(fecha.month, fecha.strftime('%b')),
+        'peso': peso,
+    }
+
+
+def _muestrear(puntos, maximo=MAX_PUNTOS_GRAFICO):
+    """Reduce la serie a lo más `maximo` puntos promediando tramos consecutivos"""
+    if len(puntos) <= maximo:
+        return [(fecha, peso, peso_id) for fecha, _, _, peso, peso_id in puntos]
+    tamano = math.ceil(len(puntos) / maximo)
+    muestreo = []
+    for inicio in range(0, len(puntos), tamano):
+        tramo = puntos[inicio:inicio + tamano]
+        promedio = round(sum(p[3] for p in tramo) / len(tramo), 2)
+        # El tramo toma la fecha de su último punto para que el final de la serie sea exacto
+        muestreo.append((tramo[-1][0], promedio, None))
+    return muestreo
+
+
+def _calcular_vista(puntos):
+    """Calcula lo que necesitan los templates a partir de la serie cruda"""
+    muestreo = _muestrear(puntos)
+    historial_peso = [_punto_display(fecha, peso, peso_id) for fecha, peso, peso_id in muestreo]
+    historial_peso_json = json.dumps([
+        {'fecha': fecha.strftime('%Y-%m-%d'), 'peso': peso}
+        for fecha, peso, _ in muestreo
+    ])
+    ultimos_registros_peso = [
+        _punto_display(fecha, peso, peso_id)
+        for fecha, _, _, peso, peso_id in reversed(puntos[-MAX_ULTIMOS_REGISTROS:])
+    ]
+
+    cambio_peso_display = None
+    if len(puntos) >= 2:
+        peso_inicial = puntos[0][3]
+        peso_final = puntos[-1][3]
+        delta = peso_final - peso_inicial
+        signo = '+' if delta > 0 else ('-' if delta < 0 else '±')
+        cambio_peso_display = f"{signo}{abs(delta):.1f} kg ({peso_inicial:.1f} kg → {peso_final:.1f} kg)"
+
+    return {
+        'historial_peso': historial_peso,
+        'historial_peso_json': historial_peso_json,
+        'ultimos_registros_peso': ultimos_registros_peso,
+        'cambio_peso_display': cambio_peso_display,
+        'ultimo_peso': puntos[-1][3] if puntos else None,
+        'total_registros_peso': len(puntos),
+    }
+
+
+def serie_peso_mascota(mascota_id):
+    """
+    Retorna la vista precalculada de la serie de peso de la mascota:
+    historial_peso, historial_peso_json, ultimos_registros_peso, cambio_peso_display,
+    ultimo_peso y total_registros_peso.
+    """
+    key = cache_key_serie_vista(mascota_id, _version_serie(mascota_id))
+    vista = cache.get(key)
+    if vista is None:
+        vista = _calcular_vista(_cargar_serie_cruda(mascota_id))
+        cache.set(key, vista, CACHE_TIMEOUT_SERIE_PESO)
+    return vista
+
+
+def invalidar_serie_peso(mascota_id):
+    """Incrementa la versión de la serie (al confirmarse la transacción en curso); se reconstruye en la próxima lectura"""
+    def incrementar():
+        try:
+            cache.incr(cache_key_version_serie(mascota_id))
+        except ValueError:
+            # Sin versión en caché: la próxima lectura crea una nueva
+            pass
+    transaction.on_commit(incrementar)
@@ -0,0 +1,231 @@
+"""
+Recordatorios de eventos clínicos.
+
+Al registrar un evento con recordatorios activados se crean filas en Recordatorio con la
+fecha y hora de envío (vence_en) y el texto ya armado, de modo que el envío no vuelve a
+consultar los eventos. El comando enviar_recordatorios reclama los vencidos por lotes
+usando el índice parcial de pendientes y un lease: cada lote queda marcado con un token y
+bloqueado por unos minutos, por lo que varios workers pueden correr en paralelo y un lote
+de un worker caído vuelve a la cola cuando el lease vence.
+
+El envío pasa por el backend configurado en RECORDATORIOS_BACKEND. BackendCorreo usa el
+EMAIL_BACKEND de Django (consola, archivo o SMTP según la configuración).
+"""
+
+import logging
+import uuid
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Recordatorio
+
+
+logger = logging.getLogger(__name__)
+
+# Un recordatorio una semana antes, otro el día anterior y otro el mismo día
+DIAS_ANTICIPACION_RECORDATORIOS = (7, 1, 0)
+HORA_RECORDATORIO = time(9, 0)
+
+TAMANO_LOTE_RECORDATORIOS = 500
+DURACION_LEASE = timedelta(minutes=5)
+MAX_INTENTOS_RECORDATORIO = 5
+# Espera antes de reintentar un envío fallido (se multiplica por el número de intentos)
+ESPERA_REINTENTO = timedelta(minutes=10)
+
+BACKEND_POR_DEFECTO = 'mascotia.registro.recordatorios.BackendCorreo'
+
+
+def _vence_en(evento, anticipacion_dias):
+    fecha = evento.fecha_evento - timedelta(days=anticipacion_dias)
+    return timezone.make_aware(datetime.combine(fecha, HORA_RECORDATORIO))
+
+
+def _texto_recordatorio(evento, mascota, anticipacion_dias):
+    tipo = evento.get_tipo_evento_display()
+    if anticipacion_dias == 0:
+        cuando = 'hoy'
+    elif anticipacion_dias == 1:
+        cuando = 'mañana'
+    else:
+        cuando = f'en {anticipacion_dias} días'
+
+    asunto = f'Recordatorio: {tipo} de {mascota.nombre} {cuando}'
+    lineas = [f'{tipo} de {mascota.nombre} el {evento.fecha_evento:%d/%m/%Y}']
+    if evento.hora_evento:
+        lineas[0] += f' a las {evento.hora_evento:%H:%M}'
+    if evento.descripcion:
+        lineas.append(evento.descripcion.split('\n')[0].strip())
+    if evento.veterinario:
+        lineas.append(f'Veterinario: {evento.veterinario}')
+    return asunto[:200], '\n'.join(lineas)
+
+
+def programar_recordatorios(evento, mascota, tutor, ahora=None):
+    """Crea los recordatorios del evento cuya fecha de envío aún no pasa y retorna cuántos se crearon"""
+    ahora = ahora or timezone.now()
+    recordatorios = []
+    for anticipacion_dias in DIAS_ANTICIPACION_RECORDATORIOS:
+        vence_en = _vence_en(evento, anticipacion_dias)
+        if vence_en <= ahora:
+            continue
+        asunto, mensaje = _texto_recordatorio(evento, mascota, anticipacion_dias)
+        recordatorios.append(Recordatorio(
+            tutor=tutor,
+            mascota=mascota,
+            evento_clinico=evento,
+            anticipacion_dias=anticipacion_dias,
+            asunto=asunto,
+            mensaje=mensaje,
+            vence_en=vence_en,
+        ))
+    Recordatorio.objects.bulk_create(recordatorios)
+    return len(recordatorios)
+
+
+def reprogramar_recordatorios(evento, ahora=None):
+    """
+    Actualiza fecha y texto de los recordatorios pendientes cuando el evento cambia.
+    Los que con la nueva fecha ya debieron enviarse se eliminan, igual que al programarlos.
+    """
+    ahora = ahora or timezone.now()
+    pendientes = list(
+        evento.recordatorios
+        .filter(estado=Recordatorio.ESTADO_PENDIENTE)
+        .select_related('mascota')
+    )
+    if not pendientes:
+        return
+
+    vigentes, vencidos = [], []
+    for recordatorio in pendientes:
+        recordatorio.vence_en = _vence_en(evento, recordatorio.anticipacion_dias)
+        if recordatorio.vence_en <= ahora:
+            vencidos.append(recordatorio.pk)
+            continue
+        recordatorio.asunto, recordatorio.mensaje = _texto_recordatorio(
+            evento, recordatorio.mascota, recordatorio.anticipacion_dias
+        )
+        vigentes.append(recordatorio)
+    Recordatorio.objects.bulk_update(vigentes, ['vence_en', 'asunto', 'mensaje'])
+    if vencidos:
+        Recordatorio.objects.filter(pk__in=vencidos).delete()
+
+
+def _disponibles(ahora):
+    """Pendientes vencidos que ningún worker tiene reclamados"""
+    return Recordatorio.objects.filter(
+        Q(bloqueado_hasta__isnull=True) | Q(bloqueado_hasta__lt=ahora),
+        estado=Recordatorio.ESTADO_PENDIENTE,
+        vence_en__lte=ahora,
+    )
+
+
+def reclamar_recordatorios(lote=TAMANO_LOTE_RECORDATORIOS, duracion_lease=DURACION_LEASE, ahora=None):
+    """
+    Reclama hasta `lote` recordatorios vencidos para este worker y los retorna.
+    En PostgreSQL las filas tomadas por otro worker se saltan (SKIP LOCKED); en cualquier base,
+    la condición de disponibilidad del UPDATE impide que dos workers reclamen la misma fila.
+    """
+    ahora = ahora or timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        ids = list(
+            _disponibles(ahora)
+            .select_for_update(skip_locked=True)
+            .order_by('vence_en')
+            .values_list('id', flat=True)[:lote]
+        )
+        if not ids:
+            return []
+        _disponibles(ahora).filter(pk__in=ids).update(
+            lease=token,
+            bloqueado_hasta=ahora + duracion_lease,
+            intentos=F('intentos') + 1,
+        )
+    return list(Recordatorio.objects.filter(lease=token).select_related('tutor').order_by('vence_en'))
+
+
+def entregar_recordatorios(recordatorios, backend=None, ahora=None):
+    """
+    Envía los recordatorios reclamados y registra el resultado. Retorna (enviados, fallidos).
+    Solo se actualizan las filas que siguen reclamadas con el lease de este worker: si el lease
+    venció y otro worker las reclamó, el resultado lo registra ese worker.
+    """
+    if not recordatorios:
+        return 0, 0
+    backend = backend or obtener_backend()
+    errores = backend.enviar(recordatorios)
+    ahora = ahora or timezone.now()
+    reclamados = Recordatorio.objects.filter(lease__in={recordatorio.lease for recordatorio in recordatorios})
+
+    enviados = [recordatorio.pk for recordatorio in recordatorios if recordatorio.pk not in errores]
+    enviados = reclamados.filter(pk__in=enviados).update(
+        estado=Recordatorio.ESTADO_ENVIADO,
+        enviado_en=ahora,
+        lease=None,
+        bloqueado_hasta=None,
+        error='',
+    )
+
+    fallidos = [recordatorio for recordatorio in recordatorios if recordatorio.pk in errores]
+    for recordatorio in fallidos:
+        recordatorio.error = errores[recordatorio.pk]
+        recordatorio.lease = None
+        if recordatorio.intentos >= MAX_INTENTOS_RECORDATORIO:
+            recordatorio.estado = Recordatorio.ESTADO_FALLIDO
+            recordatorio.bloqueado_hasta = None
+        else:
+            recordatorio.bloqueado_hasta = ahora + ESPERA_REINTENTO * recordatorio.intentos
+    fallidos = reclamados.bulk_update(fallidos, ['error', 'lease', 'estado', 'bloqueado_hasta'])
+    return enviados, fallidos
+
+
+# Backends de envío
+
+class BackendRecordatorios:
+    """Backend de envío: enviar() recibe un lote y retorna {id: error} con los que no se enviaron"""
+
+    def enviar(self, recordatorios):
+        raise NotImplementedError
+
+
+class BackendCorreo(BackendRecordatorios):
+    """Envía cada recordatorio por correo al tutor usando una sola conexión por lote"""
+
+    def enviar(self, recordatorios):
+        errores = {}
+        with get_connection() as conexion:
+            for recordatorio in recordatorios:
+                if not recordatorio.tutor.email:
+                    errores[recordatorio.pk] = 'El tutor no tiene correo registrado'
+                    continue
+                mensaje = EmailMessage(
+                    recordatorio.asunto,
+                    recordatorio.mensaje,
+                    to=[recordatorio.tutor.email],
+                    connection=conexion,
+                )
+                try:
+                    mensaje.send()
+                except Exception as error:
+                    errores[recordatorio.pk] = str(error) or error.__class__.__name__
+        return errores
+
+
+class BackendRegistro(BackendRecordatorios):
+    """Escribe los recordatorios en el log (útil en desarrollo y pruebas de carga)"""
+
+    def enviar(self, recordatorios):
+        for recordatorio in recordatorios:
+            logger.info('Recordatorio %s para %s: %s', recordatorio.pk, recordatorio.tutor_id, recordatorio.asunto)
+        return {}
+
+
+def obtener_backend():
+    return import_string(getattr(settings, 'RECORDATORIOS_BACKEND', BACKEND_POR_DEFECTO))()
@@ -0,0 +1,177 @@
+"""
+Métricas de salud precalculadas en la ficha clínica.
+
+El puntaje de salud (0-5), los eventos de los últimos 30 días y la fecha de la última
+vacuna se guardan en columnas de FichaClinica, de modo que el panel solo las lee.
+Las señales de models.py las recalculan cuando cambia la ficha, alguno de sus eventos o
+alguna de sus vacunas: anotan la ficha y, al confirmarse la transacción, todas las fichas
+anotadas se recalculan juntas una sola vez (ver programar_metricas_ficha).
+Como la ventana de 30 días avanza cada día, las fichas calculadas en un día anterior
+se recalculan en bloque con el comando recalcular_metricas_salud (pensado para correr
+cada noche) o, si no se ha ejecutado, al cargar el panel.
+"""
+
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import EventoClinico, FichaClinica, Vacunacion
+
+
+DIAS_EVENTOS_RECIENTES = 30
+
+CAMPOS_METRICAS_SALUD = ('salud_score', 'eventos_recientes', 'ultima_vacuna_fecha', 'metricas_calculadas_en')
+
+# Campos de la ficha que afectan el puntaje de salud
+CAMPOS_PUNTAJE_SALUD = frozenset({
+    'peso', 'alergias', 'condiciones_cronicas', 'medicamentos_actuales', 'historial_enfermedades',
+})
+
+# Fichas con métricas por recalcular al confirmarse la transacción (por hilo); las de una
+# transacción revertida se recalculan con la siguiente que se confirme
+_pendientes = threading.local()
+
+
+def _tiene_texto(valor):
+    return bool(valor and valor.strip())
+
+
+def calcular_salud_score(ficha, eventos_recientes):
+    """Retorna el puntaje de salud (0-5) de la ficha, o None si la bitácora no está completada (sin peso)"""
+    if ficha.peso is None:
+        return None
+
+    score = 5  # Empezamos con 5 (máximo)
+
+    # Condiciones crónicas, alergias, medicamentos e historial de enfermedades
+    if _tiene_texto(ficha.condiciones_cronicas):
+        score -= 1
+    if _tiene_texto(ficha.alergias):
+        score -= 0.5
+    if _tiene_texto(ficha.medicamentos_actuales):
+        score -= 0.5
+    if _tiene_texto(ficha.historial_enfermedades):
+        score -= 0.5
+
+    # Eventos clínicos recientes (últimos 30 días)
+    if eventos_recientes > 3:
+        score -= 0.5
+    elif eventos_recientes > 0:
+        score -= 0.25
+
+    return max(0, min(5, score))
+
+
+def estado_salud(ficha):
+    """Retorna (salud_score, salud_estado, salud_detalle) para mostrar en el panel"""
+    if ficha is None or ficha.salud_score is None:
+        return '—', 'Completar', 'Bitácora'
+
+    score = ficha.salud_score
+    if score >= 4.5:
+        estado, detalle = 'Excelente', 'Sin alertas'
+    elif score >= 3.5:
+        estado, detalle = 'Muy bien', 'Sin alertas'
+    elif score >= 2.5:
+        estado, detalle = 'Bien', 'Atención'
+    elif score >= 1.5:
+        estado, detalle = 'Regular', 'Atención'
+    else:
+        estado, detalle = 'Revisar', 'Atención'
+    return f'{int(round(score))}/5', estado, detalle
+
+
+def estado_vacunas(ficha):
+    """Retorna (vacunas_resumen, vacunas_detalle) para mostrar en el panel"""
+    if ficha is None or ficha.peso is None:
+        return '—', 'Completar'
+
+    resumen = 'Al día' if ficha.vacunas_al_dia else 'No al día'
+    if ficha.ultima_vacuna_fecha:
+        detalle = f'Última: {ficha.ultima_vacuna_fecha.strftime("%d/%m/%Y")}'
+    else:
+        detalle = 'Completo' if ficha.vacunas_al_dia else 'Sin registro'
+    return resumen, detalle
+
+
+def _eventos_recientes(ficha_ids, hoy):
+    """Retorna {ficha_id: eventos recientes} en una consulta agrupada"""
+    fecha_limite = hoy - timedelta(days=DIAS_EVENTOS_RECIENTES)
+    filas = (
+        EventoClinico.objects
+        .filter(ficha_clinica_id__in=ficha_ids)
+        .values('ficha_clinica_id')
+        .annotate(
+            eventos_recientes=Count(
+                'id',
+                filter=Q(fecha_evento__gte=fecha_limite) & ~Q(tipo_evento=EventoClinico.TIPO_COMENTARIO),
+            ),
+        )
+        .order_by()
+    )
+    return {fila['ficha_clinica_id']: fila['eventos_recientes'] for fila in filas}
+
+
+def _ultimas_vacunas(ficha_ids):
+    """Retorna {ficha_id: fecha de la última vacuna} en una consulta agrupada"""
+    filas = (
+        Vacunacion.objects
+        .filter(ficha_clinica_id__in=ficha_ids)
+        .values('ficha_clinica_id')
+        .annotate(ultima_vacuna_fecha=Max('fecha_aplicacion'))
+        .order_by()
+    )
+    return {fila['ficha_clinica_id']: fila['ultima_vacuna_fecha'] for fila in filas}
+
+
+def recalcular_metricas_salud(fichas, hoy=None):
+    """
+    Recalcula las métricas de las fichas dadas y las guarda con bulk_update
+    (sin disparar señales ni modificar actualizado_en). Retorna la lista de fichas.
+    """
+    fichas = list(fichas)
+    if not fichas:
+        return fichas
+
+    hoy = hoy or timezone.now().date()
+    ficha_ids = [ficha.pk for ficha in fichas]
+    eventos_recientes = _eventos_recientes(ficha_ids, hoy)
+    ultimas_vacunas = _ultimas_vacunas(ficha_ids)
+    for ficha in fichas:
+        ficha.eventos_recientes = eventos_recientes.get(ficha.pk, 0)
+        ficha.ultima_vacuna_fecha = ultimas_vacunas.get(ficha.pk)
+        ficha.salud_score = calcular_salud_score(ficha, ficha.eventos_recientes)
+        ficha.metricas_calculadas_en = hoy
+
+    FichaClinica.objects.bulk_update(fichas, CAMPOS_METRICAS_SALUD, batch_size=500)
+    return fichas
+
+
+def _recalcular_pendientes():
+    ficha_ids = getattr(_pendientes, 'fichas', None)
+    _pendientes.fichas = set()
+    # Las demás llamadas de la misma transacción ya no encuentran fichas pendientes
+    if ficha_ids:
+        recalcular_metricas_salud(FichaClinica.objects.filter(pk__in=ficha_ids))
+
+
+def programar_metricas_ficha(ficha_id):
+    """
+    Recalcula las métricas de la ficha al confirmarse la transacción en curso (de inmediato
+    si no hay una). Las fichas anotadas en la misma transacción se recalculan juntas una
+    sola vez, aunque cambien varios de sus eventos o vacunas.
+    """
+    if not hasattr(_pendientes, 'fichas'):
+        _pendientes.fichas = set()
+    _pendientes.fichas.add(ficha_id)
+    transaction.on_commit(_recalcular_pendientes)
+
+
+def asegurar_metricas_salud(fichas, hoy=None):
+    """Recalcula solo las fichas cuyas métricas no corresponden al día de hoy"""
+    hoy = hoy or timezone.now().date()
+    vencidas = [ficha for ficha in fichas if ficha.metricas_calculadas_en != hoy]
+    recalcular_metricas_salud(vencidas, hoy)
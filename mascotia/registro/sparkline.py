@@ -0,0 +1,123 @@
+"""
+Mini gráfico (sparkline) SVG del peso de cada mascota para el home.
+
+El resultado se guarda en caché por (mascota, versión de la serie de peso), la misma
+versión que las señales de models.py incrementan para pesos.py cuando cambia un peso.
+Así, después del primer render, el home solo lee los bloques ya calculados sin consultar
+la base de datos.
+"""
+
+from django.core.cache import cache
+from django.utils.html import format_html
+
+from .models import PesoMascota
+from .pesos import versiones_series
+
+
+CACHE_TIMEOUT_SPARKLINE = 60 * 60 * 24 * 7
+
+COLOR_SPARKLINE = '#d2de7d'
+
+
+def _bloque_vacio():
+    return {
+        'historial': [],
+        'svg_points': '',
+        'svg': '',
+        'ultimo_peso': None,
+    }
+
+
+def renderizar_sparkline(registros, color=COLOR_SPARKLINE):
+    """
+    Calcula las coordenadas (viewBox 0-100) y el fragmento SVG para una serie [(fecha, peso)]
+    ordenada por fecha. Retorna historial (con svg_x/svg_y por punto), svg_points, svg y ultimo_peso.
+    """
+    if not registros:
+        return _bloque_vacio()
+
+    fechas = [fecha for fecha, _ in registros]
+    valores = [peso for _, peso in registros]
+    max_peso = max(valores)
+    min_peso = min(valores)
+    rango = max_peso - min_peso if max_peso != min_peso else 1
+    total = len(valores) - 1 if len(valores) > 1 else 1
+
+    # Cálculo de toda la serie de una vez (sin estado por punto)
+    offsets = [10 + ((peso - min_peso) / rango) * 70 for peso in valores]
+    xs = [(index / total) * 100 for index in range(len(valores))]
+    ys = [100 - offset for offset in offsets]
+    svg_points = ' '.join(f"{x},{y}" for x, y in zip(xs, ys))
+
+    historial = [
+        {
+            'mes': fecha.strftime('%b'),
+            'peso': peso,
+            'etiqueta': fecha.strftime('%d %b'),
+            'offset': offset,
+            'svg_x': x,
+            'svg_y': y,
+            'peso_display': f"{peso:.1f} K",
+        }
+        for fecha, peso, offset, x, y in zip(fechas, valores, offsets, xs, ys)
+    ]
+
+    svg = format_html(
+        '<svg viewBox="0 0 100 100" preserveAspectRatio="none" class="sparkline-peso" aria-hidden="true">'
+        '<polyline points="{}" fill="none" stroke="{}" stroke-width="2" vector-effect="non-scaling-stroke"/>'
+        '</svg>',
+        svg_points,
+        color,
+    )
+
+    return {
+        'historial': historial,
+        'svg_points': svg_points,
+        'svg': str(svg),
+        'ultimo_peso': valores[-1],
+    }
+
+
+def cache_key_sparkline(mascota_id, version):
+    return f'registro:sparkline:{mascota_id}:{version}'
+
+
+def sparklines_mascotas(mascota_ids):
+    """
+    Retorna {mascota_id: bloque} con el sparkline de cada mascota. Solo carga los pesos
+    de las mascotas cuyo sparkline no está en caché para la versión actual de su serie.
+    """
+    mascota_ids = list(mascota_ids)
+    bloques = {mascota_id: _bloque_vacio() for mascota_id in mascota_ids}
+    if not mascota_ids:
+        return bloques
+
+    versiones = versiones_series(mascota_ids)
+    keys = {mascota_id: cache_key_sparkline(mascota_id, version) for mascota_id, version in versiones.items()}
+    en_cache = cache.get_many(list(keys.values()))
+
+    faltantes = []
+    for mascota_id, key in keys.items():
+        if key in en_cache:
+            bloques[mascota_id] = en_cache[key]
+        else:
+            faltantes.append(mascota_id)
+
+    if faltantes:
+        series = {mascota_id: [] for mascota_id in faltantes}
+        pesos = (
+            PesoMascota.objects
+            .filter(mascota_id__in=faltantes)
+            .order_by('mascota_id', 'fecha', 'id')
+            .values_list('mascota_id', 'fecha', 'peso')
+        )
+        for mascota_id, fecha, peso in pesos:
+            series[mascota_id].append((fecha, float(peso)))
+
+        nuevos = {}
+        for mascota_id, registros in series.items():
+            bloques[mascota_id] = renderizar_sparkline(registros)
+            nuevos[keys[mascota_id]] = bloques[mascota_id]
+        cache.set_many(nuevos, CACHE_TIMEOUT_SPARKLINE)
+
+    return bloques
@@ -16,3 +16,12 @@ def get_item(dictionary, key):
             return None
     return None
 
+
+@register.filter
+def derivada(foto, tamano):
+    """URL de la versión redimensionada de una foto: {{ mascota.foto|derivada:'avatar' }} o 'avatar.jpg'"""
+    from ..imagenes import url_derivada
+    tamano, _, formato = str(tamano).partition('.')
+    if formato:
+        return url_derivada(foto, tamano, formato)
+    return url_derivada(foto, tamano)
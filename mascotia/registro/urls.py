@@ -13,12 +13,19 @@ urlpatterns = [
     path('completar-perfil/', views.completar_perfil_view, name='completar_perfil'),
     path('registro-mascota/', views.registro_mascota_view, name='registro_mascota'),
     path('registrar_mascotas/', RedirectView.as_view(pattern_name='registro_mascota', permanent=True)),
+    path('mascotas/importar/', views.importar_mascotas_view, name='importar_mascotas'),
     path('mascotas/<int:mascota_id>/historial/', RedirectView.as_view(pattern_name='bitacora_mascota', permanent=True)),
     path('mascotas/<int:mascota_id>/bitacora/', views.bitacora_mascota_view, name='bitacora_mascota'),
     path('mascotas/<int:mascota_id>/perfil/', views.perfil_mascota_view, name='perfil_mascota'),
+    path('mascotas/<int:mascota_id>/eventos/', views.historial_eventos_mascota_view, name='historial_eventos_mascota'),
     path('mascotas/<int:mascota_id>/desactivar/', views.desactivar_mascota_view, name='desactivar_mascota'),
     path('mascotas/<int:mascota_id>/agregar-peso/', views.agregar_peso_mascota_view, name='agregar_peso_mascota'),
+    path('mascotas/<int:mascota_id>/exportar/', views.exportar_ficha_view, name='exportar_ficha'),
     path('mascotas/<int:mascota_id>/actualizar-foto/', views.actualizar_foto_mascota_view, name='actualizar_foto_mascota'),
+    path('microchips/buscar/', views.buscar_microchips_view, name='buscar_microchips'),
+    path('microchips/<str:codigo>/', views.microchip_view, name='microchip'),
+    path('adjuntos/<int:adjunto_id>/', views.descargar_adjunto_view, name='descargar_adjunto'),
+    path('buscar/', views.buscar_historial_tutor_view, name='buscar_historial_tutor'),
     path('actualizar-foto-perfil/', views.actualizar_foto_perfil_banner_view, name='actualizar_foto_perfil_banner'),
     path('logout/', views.logout_view, name='logout'),
 ]
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Registro estructurado de vacunas.
+
+Cada dosis se guarda en Vacunacion (vacuna, fecha de aplicación, próxima dosis, lote y
+veterinario). La bitácora y la importación registran la vacuna con sus campos (ver
+registrar_vacuna y datos_vacuna_evento); la fecha y el veterinario salen del evento clínico,
+que se sincroniza al guardarlo (señal en models.py). La última vacuna indicada en la ficha
+se registra desde FichaClinicaForm.
+
+Las próximas dosis y las vacunas vencidas (panel del home) se obtienen con rangos sobre el
+índice de proxima_dosis, considerando solo la dosis más reciente de cada vacuna.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import EventoClinico, Vacunacion
+
+
+# Refuerzo por defecto cuando no se indica la próxima dosis
+DIAS_REFUERZO_VACUNA = 365
+
+DIAS_PROXIMAS_VACUNAS = 30
+
+NOMBRE_VACUNA_POR_DEFECTO = 'Vacuna'
+
+
+def proxima_dosis_por_defecto(fecha_aplicacion):
+    return fecha_aplicacion + timedelta(days=DIAS_REFUERZO_VACUNA) if fecha_aplicacion else None
+
+
+def datos_vacuna_evento(evento):
+    """
+    Campos de la Vacunacion de un evento de vacuna: ficha, fecha y veterinario del evento, más
+    los indicados al registrarla en evento.datos_vacuna (vacuna, proxima_dosis, lote). Sin
+    nombre indicado, la vacuna se llama como el evento (la bitácora lo describe con el nombre).
+    """
+    datos = {
+        'ficha_clinica_id': evento.ficha_clinica_id,
+        'fecha_aplicacion': evento.fecha_evento,
+        'veterinario': evento.veterinario or None,
+    }
+    datos.update(getattr(evento, 'datos_vacuna', None) or {})
+    if not datos.get('vacuna'):
+        datos['vacuna'] = (evento.descripcion or '').strip()[:200] or NOMBRE_VACUNA_POR_DEFECTO
+    if not datos.get('proxima_dosis'):
+        datos['proxima_dosis'] = proxima_dosis_por_defecto(evento.fecha_evento)
+    return datos
+
+
+def registrar_vacuna(ficha, vacuna, fecha_aplicacion, proxima_dosis=None, lote=None, veterinario=None):
+    """Crea el evento de vacuna de la ficha y su Vacunacion con los datos indicados"""
+    evento = EventoClinico(
+        ficha_clinica=ficha,
+        fecha_evento=fecha_aplicacion,
+        tipo_evento=EventoClinico.TIPO_VACUNA,
+        descripcion=vacuna,
+        veterinario=veterinario or None,
+    )
+    # La señal de models.py crea la Vacunacion con estos datos (ver sincronizar_vacunacion)
+    evento.datos_vacuna = {'vacuna': vacuna[:200], 'proxima_dosis': proxima_dosis, 'lote': lote or None}
+    with transaction.atomic():
+        evento.save()
+    return evento
+
+
+def sincronizar_vacunacion(evento, creado=False):
+    """
+    Crea o actualiza la Vacunacion del evento (o la elimina si el evento ya no es una vacuna).
+    Al editar el evento solo se actualiza lo que sale de él (ficha, fecha y veterinario): el
+    nombre, la próxima dosis y el lote se conservan.
+    """
+    if evento.tipo_evento != EventoClinico.TIPO_VACUNA:
+        if not creado:
+            Vacunacion.objects.filter(evento_clinico=evento).delete()
+        return None
+    vacunacion = None if creado else Vacunacion.objects.filter(evento_clinico=evento).first()
+    if vacunacion is None:
+        return Vacunacion.objects.create(evento_clinico=evento, **datos_vacuna_evento(evento))
+    vacunacion.ficha_clinica_id = evento.ficha_clinica_id
+    vacunacion.fecha_aplicacion = evento.fecha_evento
+    vacunacion.veterinario = evento.veterinario or None
+    vacunacion.save(update_fields=['ficha_clinica', 'fecha_aplicacion', 'veterinario'])
+    return vacunacion
+
+
+def ultima_vacunacion(ficha):
+    """Última vacuna registrada de la ficha (o None), consultada una sola vez por instancia de ficha"""
+    if not hasattr(ficha, '_ultima_vacunacion'):
+        ficha._ultima_vacunacion = ficha.vacunaciones.first() if ficha.pk else None
+    return ficha._ultima_vacunacion
+
+
+def registrar_vacuna_ficha(ficha, nombre, fecha_aplicacion=None):
+    """
+    Registra la última vacuna indicada en la ficha clínica. Si la dosis ya estaba registrada
+    (misma vacuna y misma fecha, o cualquier fecha si no se indica) no se crea una nueva.
+    """
+    existentes = ficha.vacunaciones.filter(vacuna=nombre)
+    if fecha_aplicacion is not None:
+        existentes = existentes.filter(fecha_aplicacion=fecha_aplicacion)
+    if existentes.exists():
+        return None
+
+    vacunacion = Vacunacion.objects.create(
+        ficha_clinica=ficha,
+        vacuna=nombre,
+        fecha_aplicacion=fecha_aplicacion,
+        proxima_dosis=proxima_dosis_por_defecto(fecha_aplicacion),
+    )
+    # La última vacuna de la ficha se vuelve a consultar si se necesita
+    ficha.__dict__.pop('_ultima_vacunacion', None)
+    return vacunacion
+
+
+def vacunas_ficha(ficha, hoy, vacunaciones=None):
+    """
+    Listado de vacunas de la ficha para la bitácora, de la más reciente a la más antigua.
+    Acepta las vacunaciones de la ficha ya consultadas (en el orden del modelo).
+    """
+    if vacunaciones is None:
+        vacunaciones = list(ficha.vacunaciones.all())
+    # El listado ya trae la última vacuna
+    ficha._ultima_vacunacion = vacunaciones[0] if vacunaciones else None
+
+    vacunas = []
+    for vacunacion in vacunaciones:
+        es_proxima = bool(vacunacion.proxima_dosis and vacunacion.proxima_dosis > hoy)
+        vacunas.append({
+            'id': vacunacion.id,
+            'nombre': vacunacion.vacuna,
+            'fecha_aplicada': vacunacion.fecha_aplicacion,
+            'proxima_fecha': vacunacion.proxima_dosis if es_proxima else None,
+            'lote': vacunacion.lote or '',
+            'veterinario': vacunacion.veterinario or '',
+            'es_proxima': es_proxima,
+        })
+    return vacunas
+
+
+def vacunaciones_vigentes():
+    """Dosis que no fueron reemplazadas por una dosis posterior de la misma vacuna"""
+    posteriores = Vacunacion.objects.filter(
+        ficha_clinica_id=OuterRef('ficha_clinica_id'),
+        vacuna=OuterRef('vacuna'),
+        fecha_aplicacion__gt=OuterRef('fecha_aplicacion'),
+    )
+    return Vacunacion.objects.filter(~Exists(posteriores))
+
+
+def proximas_vacunas(ficha_ids, hoy, dias=DIAS_PROXIMAS_VACUNAS):
+    """Dosis que vencen entre hoy y hoy + dias (sin límite si dias es None), de la más cercana a la más lejana"""
+    vacunaciones = vacunaciones_vigentes().filter(ficha_clinica_id__in=ficha_ids, proxima_dosis__gte=hoy)
+    if dias is not None:
+        vacunaciones = vacunaciones.filter(proxima_dosis__lte=hoy + timedelta(days=dias))
+    return vacunaciones.order_by('proxima_dosis', 'id')
+
+
+def vacunas_vencidas(ficha_ids, hoy):
+    """Dosis cuya próxima fecha ya pasó sin registrar un refuerzo, de la más atrasada a la más reciente"""
+    return (
+        vacunaciones_vigentes()
+        .filter(ficha_clinica_id__in=ficha_ids, proxima_dosis__lt=hoy)
+        .order_by('proxima_dosis', 'id')
+    )
+
+
+def siguiente_dosis_de(vacunaciones):
+    """Dosis pendiente más cercana (puede estar vencida) entre las vacunaciones ya consultadas de una ficha, o None"""
+    ultima_por_vacuna = {}
+    for vacunacion in vacunaciones:
+        if vacunacion.fecha_aplicacion is not None:
+            fecha = ultima_por_vacuna.get(vacunacion.vacuna)
+            if fecha is None or vacunacion.fecha_aplicacion > fecha:
+                ultima_por_vacuna[vacunacion.vacuna] = vacunacion.fecha_aplicacion
+    # Vigentes: las que no tienen una dosis posterior de la misma vacuna (ver vacunaciones_vigentes)
+    pendientes = [
+        vacunacion for vacunacion in vacunaciones
+        if vacunacion.proxima_dosis is not None and (
+            vacunacion.fecha_aplicacion is None
+            or vacunacion.fecha_aplicacion >= ultima_por_vacuna[vacunacion.vacuna]
+        )
+    ]
+    return min(pendientes, key=lambda vacunacion: (vacunacion.proxima_dosis, vacunacion.id), default=None)
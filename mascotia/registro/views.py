@@ -1,19 +1,43 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.urls import reverse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.core.files.storage import default_storage
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.views.decorators.csrf import csrf_protect
 from functools import wraps
-from datetime import timedelta
-import calendar
 import json
+import re
 from .forms import RegistroForm, LoginForm, PerfilTutorForm, UserForm, MascotaForm, FichaClinicaForm, EventoClinicoForm, RecuperarClaveForm
 from django import forms
-from .models import PerfilTutor, Mascota, PesoMascota, FichaClinica, EventoClinico, HistorialFichaClinica, ArchivoAdjunto
+from .models import PerfilTutor, Mascota, PesoMascota, FichaClinica, EventoClinico, ArchivoAdjunto
+from .dashboard import alertas_vacunas, resumen_panel_mascotas
+from .esquema import campos_disponibles
+from .eventos import filtrar_eventos, pagina_historial, archivos_de_eventos, tamano_pagina, evento_a_dict, listar_eventos_con_archivos
+from .busqueda import buscar_eventos, resultados_tutor, terminos_busqueda
+from .perfiles import obtener_perfil_tutor, perfil_completo
+from .context_processors import precargar_mascotas_usuario, obtener_mascotas_usuario
+from .pesos import serie_peso_mascota
+from .salud import estado_salud, estado_vacunas
+from .historial import registrar_revision, eliminar_revision, revisiones_ficha
+from .vacunas import registrar_vacuna, ultima_vacunacion, vacunas_ficha
+from .estadisticas import EstadisticasEventos
+from .recordatorios import programar_recordatorios
+from .imagenes import url_derivada
+from .adjuntos import adjuntos_validos, guardar_adjuntos
+from .altas import crear_mascota, microchip_provisorio
+from .microchips import MAX_MICROCHIPS_POR_CONSULTA, asignar_microchip, buscar_microchips, consulta_microchips, ficha_microchip, normalizar_microchip
+from .descargas import servir_archivo, es_ruta_publica, normalizar_ruta
+from .exportacion import exportar_ficha_zip, nombre_exportacion
+from .importacion import ErrorImportacion, TAMANO_MAXIMO_IMPORTACION, importar_archivo
+from .vistas_mascota import vista_mascota
+from .calendario import CALENDAR_HEADERS, MESES_ES, grilla_mes, fecha_calendario_desde_request, contar_por_semana
 from django.db.models import Q
 
 
@@ -27,12 +51,8 @@ def perfil_completo_required(view_func):
         if not request.user.is_authenticated:
             return redirect('login')
         
-        try:
-            perfil = PerfilTutor.objects.only('telefono', 'ocupacion').get(user=request.user)
-        except PerfilTutor.DoesNotExist:
-            perfil = PerfilTutor.objects.create(user=request.user)
-        
-        if not perfil.perfil_completo:
+        # El indicador se lee del caché; el perfil solo se consulta si hace falta
+        if not perfil_completo(request):
             messages.info(request, 'Por favor, completa tu perfil para continuar.')
             # No redirigir forzadamente, permitir que el usuario navegue libremente
         
@@ -62,13 +82,8 @@ def login_view(request):
             if user is not None:
                 login(request, user)
                 # Primero verificar si el perfil está completo
-                try:
-                    perfil = PerfilTutor.objects.only('telefono', 'ocupacion').get(user=user)
-                except PerfilTutor.DoesNotExist:
-                    perfil = PerfilTutor.objects.create(user=user)
-                
                 # Si el perfil no está completo, redirigir a completar_perfil
-                if not perfil.perfil_completo:
+                if not perfil_completo(request):
                     messages.info(request, 'Por favor, completa tu perfil para continuar.')
                     return redirect('completar_perfil')
                 
@@ -197,26 +212,24 @@ def registro_view(request):
 @login_required
 @perfil_completo_required
 def home_view(request):
-    # Obtener el perfil completo incluyendo foto_perfil - siempre recargar desde la BD
-    try:
-        perfil = PerfilTutor.objects.select_related().get(user=request.user)
-        perfil.refresh_from_db()  # Asegurar que tenemos los datos más recientes
-    except PerfilTutor.DoesNotExist:
-        perfil = PerfilTutor.objects.create(user=request.user)
-    except Exception:
-        # Si falla el refresh o la obtención, intentar obtener el perfil nuevamente sin refresh
-        try:
-            perfil = PerfilTutor.objects.get(user=request.user)
-        except PerfilTutor.DoesNotExist:
-            perfil = None # O manejar la creación si es necesario
+    # Obtener el perfil completo incluyendo foto_perfil (una sola consulta por request)
+    perfil = obtener_perfil_tutor(request)
 
-    mascotas_qs = Mascota.objects.filter(tutor=request.user, activa=True).select_related('ficha_clinica').prefetch_related('pesos').order_by('nombre')
-    mascotas_inactivas_qs = Mascota.objects.filter(tutor=request.user, activa=False).order_by('nombre')
+    mascotas_qs = list(Mascota.objects.filter(tutor=request.user, activa=True).select_related('ficha_clinica').order_by('nombre'))
+    mascotas_inactivas_qs = list(Mascota.objects.filter(tutor=request.user, activa=False).select_related('ficha_clinica').order_by('nombre'))
 
-    if not mascotas_qs.exists() and not mascotas_inactivas_qs.exists():
+    if not mascotas_qs and not mascotas_inactivas_qs:
         messages.info(request, 'Necesitas registrar al menos una mascota para ver el panel.')
         return redirect('registro_mascota')
 
+    # El menú de mascotas reutiliza las filas ya consultadas
+    precargar_mascotas_usuario(request, mascotas_qs)
+
+    # Conteos de eventos, última vacuna y pesos de todas las mascotas en consultas agrupadas
+    resumen_panel = resumen_panel_mascotas(mascotas_qs)
+    # Vacunas vencidas y de los próximos días de todas las mascotas activas
+    vacunas_vencidas_panel, proximas_vacunas_panel = alertas_vacunas(mascotas_qs)
+
     mascotas_data = []
     total_perros = 0
     total_gatos = 0
@@ -251,36 +264,12 @@ def home_view(request):
                     'badge_color': '#ed99c5',
                 }
 
-        pesos = list(mascota.pesos.order_by('fecha'))
-        historial = []
-        for registro in pesos:
-            historial.append({
-                'mes': registro.fecha.strftime('%b'),
-                'peso': float(registro.peso),
-                'etiqueta': registro.fecha.strftime('%d %b'),
-            })
-
-        if historial:
-            valores = [p['peso'] for p in historial]
-            max_peso = max(valores)
-            min_peso = min(valores)
-            rango = max_peso - min_peso if max_peso != min_peso else 1
-            puntos_svg = []
-            total = len(historial) - 1 if len(historial) > 1 else 1
-            for index, reg in enumerate(historial):
-                normalizado = (reg['peso'] - min_peso) / rango
-                reg['offset'] = 10 + normalizado * 70
-                x = (index / total) * 100
-                y = 100 - reg['offset']
-                reg['svg_x'] = x
-                reg['svg_y'] = y
-                reg['peso_display'] = f"{reg['peso']:.1f} K"
-                puntos_svg.append(f"{x},{y}")
-            svg_points = ' '.join(puntos_svg)
-            ultimo_peso = historial[-1]['peso']
-        else:
-            svg_points = ''
-            ultimo_peso = '—'
+        resumen = resumen_panel[mascota.id]
+        # Sparkline del peso ya calculado (y cacheado) por el componente de sparkline
+        bloque_peso = resumen['peso']
+        historial = bloque_peso['historial']
+        svg_points = bloque_peso['svg_points']
+        ultimo_peso = resumen['ultimo_peso'] if resumen['ultimo_peso'] is not None else '—'
 
         try:
             ficha = mascota.ficha_clinica
@@ -289,95 +278,9 @@ def home_view(request):
             ficha = None
             microchip = mascota.microchip or 'No registrado'
 
-        # Verificar si la bitácora está completada (peso es obligatorio)
-        bitacora_completada = False
-        if ficha and ficha.peso is not None:
-            bitacora_completada = True
-
-        # Calcular estado de salud basado en la bitácora (0-5)
-        if not bitacora_completada:
-            # Si la bitácora no está completada
-            salud_score = '—'
-            salud_estado = 'Completar'
-            salud_detalle = 'Bitácora'
-        else:
-            # Calcular score de salud (0-5)
-            score = 5  # Empezamos con 5 (máximo)
-            
-            # Reducir score por condiciones crónicas
-            if ficha.condiciones_cronicas and ficha.condiciones_cronicas.strip():
-                score -= 1
-            
-            # Reducir score por alergias
-            if ficha.alergias and ficha.alergias.strip():
-                score -= 0.5
-            
-            # Reducir score si hay medicamentos actuales (puede indicar problemas)
-            if ficha.medicamentos_actuales and ficha.medicamentos_actuales.strip():
-                score -= 0.5
-            
-            # Reducir score por historial de enfermedades
-            if ficha.historial_enfermedades and ficha.historial_enfermedades.strip():
-                score -= 0.5
-            
-            # Verificar eventos clínicos recientes (últimos 30 días)
-            fecha_limite = timezone.now().date() - timedelta(days=30)
-            eventos_recientes = ficha.eventos.filter(
-                fecha_evento__gte=fecha_limite
-            ).exclude(tipo_evento='comentario').count()
-            
-            if eventos_recientes > 3:
-                score -= 0.5
-            elif eventos_recientes > 0:
-                score -= 0.25
-            
-            # Asegurar que el score esté entre 0 y 5
-            score = max(0, min(5, score))
-            
-            # Determinar estado y detalle
-            if score >= 4.5:
-                salud_estado = 'Excelente'
-                salud_detalle = 'Sin alertas'
-            elif score >= 3.5:
-                salud_estado = 'Muy bien'
-                salud_detalle = 'Sin alertas'
-            elif score >= 2.5:
-                salud_estado = 'Bien'
-                salud_detalle = 'Atención'
-            elif score >= 1.5:
-                salud_estado = 'Regular'
-                salud_detalle = 'Atención'
-            else:
-                salud_estado = 'Revisar'
-                salud_detalle = 'Atención'
-            
-            salud_score = f'{int(round(score))}/5'
-
-        # Calcular estado de vacunas basado en la bitácora
-        if not bitacora_completada:
-            # Si la bitácora no está completada
-            vacunas_resumen = '—'
-            vacunas_detalle = 'Completar'
-        else:
-            # Obtener la última vacuna registrada
-            ultima_vacuna = ficha.eventos.filter(tipo_evento='vacuna').order_by('-fecha_evento').first()
-            
-            # Si tiene vacunas_al_dia marcado
-            if ficha.vacunas_al_dia:
-                if ultima_vacuna:
-                    vacunas_resumen = 'Al día'
-                    vacunas_detalle = f'Última: {ultima_vacuna.fecha_evento.strftime("%d/%m/%Y")}'
-                else:
-                    vacunas_resumen = 'Al día'
-                    vacunas_detalle = 'Completo'
-            else:
-                # No tiene vacunas al día
-                if ultima_vacuna:
-                    vacunas_resumen = 'No al día'
-                    vacunas_detalle = f'Última: {ultima_vacuna.fecha_evento.strftime("%d/%m/%Y")}'
-                else:
-                    vacunas_resumen = 'No al día'
-                    vacunas_detalle = 'Sin registro'
+        # Estado de salud (0-5) y de vacunas leídos de las métricas precalculadas de la ficha
+        salud_score, salud_estado, salud_detalle = estado_salud(ficha)
+        vacunas_resumen, vacunas_detalle = estado_vacunas(ficha)
 
         edad_anios_int = int(edad_anios) if edad_anios else None
         edad_display = f"{edad_anios_int} año{'s' if edad_anios_int and edad_anios_int != 1 else ''}" if edad_anios_int is not None else mascota.edad
@@ -407,6 +310,7 @@ def home_view(request):
             'foto': mascota.foto,  # Incluir el campo foto para mostrar la imagen
             'historial_peso': historial,
             'svg_points': svg_points,
+            'svg_sparkline': bloque_peso['svg'],
             'color_dot': color_dot,
             'color_line': color_line,
             'ultimo_peso': ultimo_peso,
@@ -497,80 +401,14 @@ def home_view(request):
     today = timezone.now().date()
     
     # Obtener mes y año desde los parámetros GET o usar el mes actual
-    mes_seleccionado = request.GET.get('mes')
-    anio_seleccionado = request.GET.get('anio')
+    fecha_calendario = fecha_calendario_desde_request(request, today)
     
-    if mes_seleccionado and anio_seleccionado:
-        try:
-            mes = int(mes_seleccionado)
-            anio = int(anio_seleccionado)
-            # Validar rango de mes y año
-            if 1 <= mes <= 12 and 2000 <= anio <= 2100:
-                fecha_calendario = timezone.datetime(anio, mes, 1).date()
-            else:
-                fecha_calendario = today
-        except (ValueError, TypeError):
-            fecha_calendario = today
-    else:
-        fecha_calendario = today
-    
-    calendar_headers = ['L', 'M', 'X', 'J', 'V', 'S', 'D']
-    meses_es = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    calendario = calendar.Calendar(firstweekday=0)
-    semanas_calendario = []
-    semanas_meta = []
-    semana_actual = []
-    first_day = timezone.datetime(fecha_calendario.year, fecha_calendario.month, 1).date()
-    # Construir semanas del mes con rango de fechas
-    week_index = 0
-    for dia in calendario.itermonthdates(fecha_calendario.year, fecha_calendario.month):
-        # Guardar la fecha completa para calcular correctamente las semanas
-        if dia.month == fecha_calendario.month:
-            semana_actual.append(dia)
-        else:
-            semana_actual.append('')
-        
-        if len(semana_actual) == 7:
-            semanas_calendario.append([d.day if d != '' else '' for d in semana_actual])
-            # Meta de semana - usar las fechas reales para el rango
-            fechas_reales = [d for d in semana_actual if d != '']
-            if fechas_reales:
-                inicio_sem = fechas_reales[0]
-                fin_sem = fechas_reales[-1]
-                semanas_meta.append({
-                    'index': week_index + 1,
-                    'inicio': inicio_sem.strftime('%d %b'),
-                    'fin': fin_sem.strftime('%d %b'),
-                })
-            else:
-                semanas_meta.append({
-                    'index': week_index + 1,
-                    'inicio': '',
-                    'fin': '',
-                })
-            semana_actual = []
-            week_index += 1
-    if semana_actual:
-        while len(semana_actual) < 7:
-            semana_actual.append('')
-        semanas_calendario.append([d.day if d != '' else '' for d in semana_actual])
-        fechas_reales = [d for d in semana_actual if d != '']
-        if fechas_reales:
-            inicio_sem = fechas_reales[0]
-            fin_sem = fechas_reales[-1]
-            semanas_meta.append({
-                'index': week_index + 1,
-                'inicio': inicio_sem.strftime('%d %b'),
-                'fin': fin_sem.strftime('%d %b'),
-            })
-        else:
-            semanas_meta.append({
-                'index': week_index + 1,
-                'inicio': '',
-                'fin': '',
-            })
+    # Grilla del mes (cacheada) con semanas, metadata e índice día → semana
+    grilla = grilla_mes(fecha_calendario.year, fecha_calendario.month)
+    semanas_calendario = list(grilla.semanas)
+    semanas_meta = list(grilla.meta)
     # Pares (semana, meta) para el template
-    weeks_paired = list(zip(semanas_calendario, semanas_meta))
+    weeks_paired = list(grilla.pares)
     
     # Obtener todos los eventos del mes seleccionado para todas las mascotas del usuario
     eventos_mes = EventoClinico.objects.filter(
@@ -582,10 +420,11 @@ def home_view(request):
     
     # Crear diccionario de eventos por día
     eventos_por_dia = {}
-    eventos_por_semana = {}  # Para contar TODOS los eventos por semana
+    eventos_por_dia_lista = []  # Día de cada evento, para contar TODOS los eventos por semana
     
     for evento in eventos_mes:
         dia = evento.fecha_evento.day
+        eventos_por_dia_lista.append(dia)
         if dia not in eventos_por_dia:
             eventos_por_dia[dia] = []
         # Obtener hora del evento si existe
@@ -597,22 +436,13 @@ def home_view(request):
             'descripcion': evento.descripcion[:50] if evento.descripcion else '',
             'hora': hora_evento,
         })
-        
-        # Contar TODOS los eventos por semana
-        semana_num = None
-        for idx, (semana, meta) in enumerate(weeks_paired):
-            if dia in semana:
-                semana_num = idx + 1
-                break
-        if semana_num:
-            if semana_num not in eventos_por_semana:
-                eventos_por_semana[semana_num] = 0
-            eventos_por_semana[semana_num] += 1
+    
+    # Contar TODOS los eventos por semana usando el índice día → semana
+    eventos_por_semana = contar_por_semana(grilla, eventos_por_dia_lista)
     
     # Contar eventos por semana para el template - crear diccionario indexado por número de semana
     semanas_con_eventos_dict = {}
-    for idx, (semana, meta) in enumerate(weeks_paired):
-        semana_num = idx + 1
+    for semana_num in range(1, len(weeks_paired) + 1):
         total_eventos = eventos_por_semana.get(semana_num, 0)
         semanas_con_eventos_dict[semana_num] = {
             'total': total_eventos,
@@ -628,34 +458,11 @@ def home_view(request):
             mascota_id = request.POST.get('mascota_id')
             if mascota_id:
                 try:
-                    mascota = Mascota.objects.get(pk=mascota_id, tutor=request.user, activa=True)
-                    ficha, _ = FichaClinica.objects.get_or_create(mascota=mascota)
+                    mascota = Mascota.objects.select_related('ficha_clinica').get(pk=mascota_id, tutor=request.user, activa=True)
+                    ficha = mascota.ficha_clinica
                     
                     # Validar archivos adjuntos
-                    archivos_adjuntos = request.FILES.getlist('archivos')
-                    archivos_validos = []
-                    
-                    if archivos_adjuntos:
-                        formatos_permitidos = ArchivoAdjunto.FORMATOS_PERMITIDOS
-                        tamano_maximo = ArchivoAdjunto.TAMANO_MAXIMO
-                        
-                        for archivo in archivos_adjuntos:
-                            # Validar extensión
-                            nombre_archivo = archivo.name
-                            extension = nombre_archivo.split('.')[-1].lower() if '.' in nombre_archivo else ''
-                            
-                            if extension not in formatos_permitidos:
-                                formatos_str = ', '.join(formatos_permitidos)
-                                messages.error(request, f'El archivo "{nombre_archivo}" tiene un formato no permitido. Formatos permitidos: {formatos_str}')
-                                continue
-                            
-                            # Validar tamaño
-                            if archivo.size > tamano_maximo:
-                                tamano_mb = tamano_maximo / (1024 * 1024)
-                                messages.error(request, f'El archivo "{nombre_archivo}" excede el tamaño máximo permitido ({tamano_mb}MB)')
-                                continue
-                            
-                            archivos_validos.append(archivo)
+                    archivos_validos = adjuntos_validos(request)
                     
                     evento = evento_form.save(commit=False, archivos_adjuntos=archivos_validos)
                     evento.ficha_clinica = ficha
@@ -664,23 +471,15 @@ def home_view(request):
                         evento.hora_evento = evento_form.cleaned_data['hora_evento']
                     evento.save()
                     
-                    # Guardar archivos adjuntos
-                    for archivo in archivos_validos:
-                        extension = archivo.name.split('.')[-1].lower() if '.' in archivo.name else ''
-                        ArchivoAdjunto.objects.create(
-                            evento_clinico=evento,
-                            nombre=archivo.name,
-                            archivo=archivo,
-                            tipo_archivo=extension,
-                            tamano=archivo.size
-                        )
+                    guardar_adjuntos(evento, archivos_validos)
                     
                     # Guardar información en sesión para mostrar el modal de éxito
                     request.session['evento_agregado'] = True
                     request.session['evento_mascota_nombre'] = mascota.nombre
-                    # Calcular número de recordatorios (si está activado el checkbox)
-                    activar_recordatorios = request.POST.get('activar_recordatorios') == 'on'
-                    num_recordatorios = 3 if activar_recordatorios else 0
+                    # Programar recordatorios (si está activado el checkbox); se envían con enviar_recordatorios
+                    num_recordatorios = 0
+                    if request.POST.get('activar_recordatorios') == 'on':
+                        num_recordatorios = programar_recordatorios(evento, mascota, request.user)
                     request.session['evento_num_recordatorios'] = num_recordatorios
                     
                     # No mostrar mensajes de éxito tradicionales, solo el modal
@@ -707,13 +506,15 @@ def home_view(request):
         'mascotas': mascotas_data,
         'mascotas_inactivas': mascotas_inactivas_data,
         'proximas_citas': [],
+        'vacunas_vencidas': vacunas_vencidas_panel,
+        'proximas_vacunas': proximas_vacunas_panel,
         'etapas_vida': etapas_vida,
         'stats': stats,
-        'calendar_headers': calendar_headers,
+        'calendar_headers': CALENDAR_HEADERS,
         'calendar_weeks': semanas_calendario,
         'weeks_paired': weeks_paired,
         'weeks_meta': semanas_meta,
-        'current_month': f"{meses_es[fecha_calendario.month - 1]} {fecha_calendario.year}",
+        'current_month': f"{MESES_ES[fecha_calendario.month - 1]} {fecha_calendario.year}",
         'today': today,
         'fecha_calendario': fecha_calendario,
         'mes_calendario': fecha_calendario.month,
@@ -730,7 +531,7 @@ def home_view(request):
     }
     
     # Obtener el nombre del usuario y foto para el banner
-    # Asegurarse de que el perfil esté actualizado (ya se hizo refresh_from_db al inicio)
+    # El perfil se cargó desde la BD en este mismo request
     user_name = request.user.first_name or request.user.username
     foto_perfil_url = None
     
@@ -742,13 +543,13 @@ def home_view(request):
         if perfil.foto_perfil:
             try:
                 # Asegurarse de que el archivo existe antes de obtener la URL
-                foto_perfil_url = perfil.foto_perfil.url
+                foto_perfil_url = url_derivada(perfil.foto_perfil, 'tarjeta')
             except (ValueError, AttributeError) as e:
                 # Si hay un error, intentar recargar el perfil una vez más
                 try:
                     perfil.refresh_from_db()
                     if perfil.foto_perfil:
-                        foto_perfil_url = perfil.foto_perfil.url
+                        foto_perfil_url = url_derivada(perfil.foto_perfil, 'tarjeta')
                     else:
                         foto_perfil_url = None
                 except:
@@ -764,12 +565,7 @@ def home_view(request):
 
 @login_required
 def completar_perfil_view(request):
-    try:
-        perfil = PerfilTutor.objects.get(user=request.user)
-    except PerfilTutor.DoesNotExist:
-        # Crear perfil sin acceder a campos que pueden no existir
-        perfil = PerfilTutor(user=request.user)
-        perfil.save()
+    perfil = obtener_perfil_tutor(request)
 
     if perfil.perfil_completo:
         return redirect('registro_mascota')
@@ -803,24 +599,11 @@ def completar_perfil_view(request):
                 update_fields.append('foto_perfil')
             
             # Intentar guardar campos adicionales solo si existen en la base de datos
-            # Usar SQL directo para evitar errores si las columnas no existen
-            from django.db import connection
-            with connection.cursor() as cursor:
-                cursor.execute("PRAGMA table_info(registro_perfiltutor)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                if 'calle' in columns and 'calle' in form.cleaned_data:
-                    perfil.calle = form.cleaned_data.get('calle') or ''
-                    update_fields.append('calle')
-                if 'numero' in columns and 'numero' in form.cleaned_data:
-                    perfil.numero = form.cleaned_data.get('numero') or ''
-                    update_fields.append('numero')
-                if 'ciudad' in columns and 'ciudad' in form.cleaned_data:
-                    perfil.ciudad = form.cleaned_data.get('ciudad') or ''
-                    update_fields.append('ciudad')
-                if 'comuna' in columns and 'comuna' in form.cleaned_data:
-                    perfil.comuna = form.cleaned_data.get('comuna') or ''
-                    update_fields.append('comuna')
+            # (el registro de esquema se construye una vez por proceso)
+            for campo in campos_disponibles(PerfilTutor, ('calle', 'numero', 'ciudad', 'comuna')):
+                if campo in form.cleaned_data:
+                    setattr(perfil, campo, form.cleaned_data.get(campo) or '')
+                    update_fields.append(campo)
             
             # Guardar solo los campos especificados
             perfil.save(update_fields=update_fields)
@@ -851,7 +634,7 @@ def completar_perfil_view(request):
 @login_required
 @perfil_completo_required
 def perfil_view(request):
-    perfil, created = PerfilTutor.objects.get_or_create(user=request.user)
+    perfil = obtener_perfil_tutor(request)
     
     if request.method == 'POST':
         # Si solo se envía la foto desde el banner (sin otros campos del formulario)
@@ -913,8 +696,9 @@ def perfil_view(request):
     # Verificar si se debe mostrar el modal de éxito
     mostrar_modal = request.session.pop('mostrar_modal_perfil_actualizado', False)
     
-    # Asegurarse de que el perfil esté actualizado desde la base de datos (incluyendo la foto)
-    perfil = PerfilTutor.objects.get(pk=perfil.pk)
+    # Si el POST no fue válido, descartar los valores que el formulario asignó a la instancia
+    if request.method == 'POST':
+        perfil = PerfilTutor.objects.get(pk=perfil.pk)
     
     # Actualizar el formulario con la instancia actualizada
     perfil_form = PerfilTutorForm(instance=perfil)
@@ -933,11 +717,7 @@ def perfil_view(request):
 @login_required
 @perfil_completo_required
 def registro_mascota_view(request):
-    # Usar .only() para evitar acceder a campos que pueden no existir
-    try:
-        perfil = PerfilTutor.objects.only('id', 'user_id').get(user=request.user)
-    except PerfilTutor.DoesNotExist:
-        perfil = PerfilTutor.objects.create(user=request.user)
+    perfil = obtener_perfil_tutor(request)
 
     mascotas = Mascota.objects.filter(tutor=request.user, activa=True).order_by('nombre')
     mascotas_totales = Mascota.objects.filter(tutor=request.user).count()
@@ -962,17 +742,8 @@ def registro_mascota_view(request):
             if form.is_valid():
                 mascota = form.save(commit=False)
                 mascota.tutor = request.user
-                mascota.save()
-                
-                if not mascota.microchip:
-                    mascota.microchip = f"M{mascota.id:06d}"
-                    Mascota.objects.filter(pk=mascota.pk).update(microchip=mascota.microchip)
-                    mascota.refresh_from_db()
-                
-                ficha, _ = FichaClinica.objects.get_or_create(mascota=mascota)
-                if not ficha.microchip and mascota.microchip:
-                    ficha.microchip = mascota.microchip
-                    ficha.save(update_fields=['microchip'])
+                # Mascota y ficha clínica en una transacción (ver altas.py)
+                crear_mascota(mascota, con_microchip_provisorio=True)
                 
                 messages.success(request, f"Mascota '{mascota.nombre}' registrada correctamente con ID: {mascota.microchip}.")
                 
@@ -1014,46 +785,27 @@ def logout_view(request):
 def bitacora_mascota_view(request, mascota_id):
     # Manejar caso en que el id no exista o no pertenezca al usuario, evitando 404 crudo
     try:
-        mascota = Mascota.objects.prefetch_related('pesos').get(pk=mascota_id, tutor=request.user, activa=True)
+        mascota = Mascota.objects.select_related('ficha_clinica').get(pk=mascota_id, tutor=request.user, activa=True)
     except Mascota.DoesNotExist:
         messages.error(request, 'No existe ninguna mascota con esa referencia o no tienes permiso para verla.')
         return redirect('home')
-    ficha, _ = FichaClinica.objects.get_or_create(mascota=mascota)
+    ficha = mascota.ficha_clinica
     
     # Filtrado de historial clínico
     filtro_fecha_desde = request.GET.get('fecha_desde', '')
     filtro_fecha_hasta = request.GET.get('fecha_hasta', '')
     filtro_tipo_evento = request.GET.get('tipo_evento', '')
     
-    # Eventos clínicos asociados a la ficha
-    eventos = ficha.eventos.all()
-    
+    # Eventos clínicos asociados a la ficha.
     # Solo consideramos eventos que ya ocurrieron (historial),
     # las próximas citas se visualizan en el calendario.
     hoy = timezone.now().date()
-    eventos = eventos.filter(fecha_evento__lte=hoy)
-    
-    # Aplicar filtros
-    if filtro_fecha_desde:
-        try:
-            from datetime import datetime
-            fecha_desde = datetime.strptime(filtro_fecha_desde, '%Y-%m-%d').date()
-            eventos = eventos.filter(fecha_evento__gte=fecha_desde)
-        except ValueError:
-            pass
-    
-    if filtro_fecha_hasta:
-        try:
-            from datetime import datetime
-            fecha_hasta = datetime.strptime(filtro_fecha_hasta, '%Y-%m-%d').date()
-            eventos = eventos.filter(fecha_evento__lte=fecha_hasta)
-        except ValueError:
-            pass
-    
-    if filtro_tipo_evento:
-        eventos = eventos.filter(tipo_evento=filtro_tipo_evento)
+    eventos = filtrar_eventos(ficha.eventos.filter(fecha_evento__lte=hoy), {
+        'fecha_desde': filtro_fecha_desde,
+        'fecha_hasta': filtro_fecha_hasta,
+        'tipo_evento': filtro_tipo_evento,
+    })
     
-    eventos = eventos.order_by('-fecha_evento')
     # Verificar si se solicita editar
     mostrar_formulario = request.GET.get('editar') == '1'
     
@@ -1073,43 +825,13 @@ def bitacora_mascota_view(request, mascota_id):
             evento_form = EventoClinicoForm(request.POST, request.FILES)
             if evento_form.is_valid():
                 # Validar archivos adjuntos
-                archivos_adjuntos = request.FILES.getlist('archivos')
-                archivos_validos = []
-                
-                if archivos_adjuntos:
-                    formatos_permitidos = ArchivoAdjunto.FORMATOS_PERMITIDOS
-                    tamano_maximo = ArchivoAdjunto.TAMANO_MAXIMO
-                    
-                    for archivo in archivos_adjuntos:
-                        nombre_archivo = archivo.name
-                        extension = nombre_archivo.split('.')[-1].lower() if '.' in nombre_archivo else ''
-                        
-                        if extension not in formatos_permitidos:
-                            formatos_str = ', '.join(formatos_permitidos)
-                            messages.error(request, f'El archivo "{nombre_archivo}" tiene un formato no permitido. Formatos permitidos: {formatos_str}')
-                            continue
-                        
-                        if archivo.size > tamano_maximo:
-                            tamano_mb = tamano_maximo / (1024 * 1024)
-                            messages.error(request, f'El archivo "{nombre_archivo}" excede el tamaño máximo permitido ({tamano_mb}MB)')
-                            continue
-                        
-                        archivos_validos.append(archivo)
+                archivos_validos = adjuntos_validos(request)
                 
                 evento = evento_form.save(commit=False, archivos_adjuntos=archivos_validos)
                 evento.ficha_clinica = ficha
                 evento.save()
                 
-                # Guardar archivos adjuntos
-                for archivo in archivos_validos:
-                    extension = archivo.name.split('.')[-1].lower() if '.' in archivo.name else ''
-                    ArchivoAdjunto.objects.create(
-                        evento_clinico=evento,
-                        nombre=archivo.name,
-                        archivo=archivo,
-                        tipo_archivo=extension,
-                        tamano=archivo.size
-                    )
+                guardar_adjuntos(evento, archivos_validos)
                 
                 if archivos_validos:
                     messages.success(request, f'Evento registrado exitosamente con {len(archivos_validos)} archivo(s) adjunto(s).')
@@ -1124,29 +846,23 @@ def bitacora_mascota_view(request, mascota_id):
             fecha_aplicacion = request.POST.get('fecha_aplicacion', '')
             proxima_dosis = request.POST.get('proxima_dosis', '')
             veterinario = request.POST.get('veterinario_vacuna', '').strip()
+            lote = request.POST.get('lote_vacuna', '').strip()
             
             if nombre_vacuna and fecha_aplicacion:
                 try:
                     from datetime import datetime
                     fecha_apl = datetime.strptime(fecha_aplicacion, '%Y-%m-%d').date()
                     
-                    # Crear descripción con el nombre de la vacuna y próxima dosis si existe
-                    descripcion = nombre_vacuna
+                    # Sin próxima dosis (o inválida) se usa el refuerzo por defecto
+                    fecha_prox = None
                     if proxima_dosis:
                         try:
                             fecha_prox = datetime.strptime(proxima_dosis, '%Y-%m-%d').date()
-                            descripcion += f"\nPróxima dosis: {fecha_prox.strftime('%d/%m/%Y')}"
                         except ValueError:
                             pass
                     
-                    # Crear evento de tipo vacuna
-                    evento_vacuna = EventoClinico.objects.create(
-                        ficha_clinica=ficha,
-                        fecha_evento=fecha_apl,
-                        tipo_evento='vacuna',
-                        descripcion=descripcion,
-                        veterinario=veterinario if veterinario else None,
-                    )
+                    # Evento de tipo vacuna y su Vacunacion con los datos del formulario (ver vacunas.py)
+                    registrar_vacuna(ficha, nombre_vacuna, fecha_apl, proxima_dosis=fecha_prox, lote=lote[:100], veterinario=veterinario)
                     messages.success(request, f'Vacuna "{nombre_vacuna}" registrada exitosamente.')
                     return redirect('bitacora_mascota', mascota_id=mascota.id)
                 except ValueError:
@@ -1188,101 +904,63 @@ def bitacora_mascota_view(request, mascota_id):
             es_nuevo_registro_post = ficha.tiene_datos
             ficha_form = FichaClinicaForm(request.POST, request.FILES, instance=ficha, mascota=mascota, es_nuevo_registro=es_nuevo_registro_post)
             if ficha_form.is_valid():
-                # Guardar foto de la mascota si se subió una
-                if 'foto_mascota' in request.FILES:
-                    mascota.foto = request.FILES['foto_mascota']
-                    mascota.save(update_fields=['foto'])
+                microchip = ficha_form.cleaned_data.get('microchip')
+                with transaction.atomic():
+                    # El chip se registra antes de guardar nada: si otra mascota lo registró después
+                    # de validar el formulario, no se guarda la ficha
+                    if microchip and microchip != mascota.microchip and not asignar_microchip(mascota, microchip, ficha):
+                        ficha_form.add_error('microchip', 'Este microchip ya está registrado en otra mascota.')
+                    else:
+                        # Guardar foto de la mascota si se subió una
+                        if 'foto_mascota' in request.FILES:
+                            mascota.foto = request.FILES['foto_mascota']
+                            mascota.save(update_fields=['foto'])
                 
-                # Guardar fecha_nacimiento y color_pelaje de la mascota
-                if 'fecha_nacimiento' in request.POST and request.POST['fecha_nacimiento']:
-                    from datetime import datetime
-                    try:
-                        fecha_nac = datetime.strptime(request.POST['fecha_nacimiento'], '%Y-%m-%d').date()
-                        mascota.fecha_nacimiento = fecha_nac
-                        mascota.save(update_fields=['fecha_nacimiento'])
-                    except ValueError:
-                        pass
+                        # Guardar fecha_nacimiento y color_pelaje de la mascota
+                        if 'fecha_nacimiento' in request.POST and request.POST['fecha_nacimiento']:
+                            from datetime import datetime
+                            try:
+                                fecha_nac = datetime.strptime(request.POST['fecha_nacimiento'], '%Y-%m-%d').date()
+                                mascota.fecha_nacimiento = fecha_nac
+                                mascota.save(update_fields=['fecha_nacimiento'])
+                            except ValueError:
+                                pass
                 
-                if 'color_pelaje' in request.POST:
-                    mascota.color_pelaje = request.POST['color_pelaje']
-                    mascota.save(update_fields=['color_pelaje'])
-                # Guardar snapshot del estado anterior antes de actualizar
-                if ficha.tiene_datos:
-                    # Extraer información de vacuna del comentario anterior
-                    ultima_vacuna_nombre_anterior = None
-                    ultima_vacuna_fecha_anterior = None
-                    if ficha.comentarios and 'Última vacuna:' in ficha.comentarios:
-                        import re
-                        match = re.search(r'Última vacuna: ([^-]+)(?: - Fecha: (\d{2}/\d{2}/\d{4}))?', ficha.comentarios)
-                        if match:
-                            ultima_vacuna_nombre_anterior = match.group(1).strip()
-                            if match.group(2):
-                                from datetime import datetime
-                                try:
-                                    ultima_vacuna_fecha_anterior = datetime.strptime(match.group(2), '%d/%m/%Y').date()
-                                except:
-                                    pass
+                        if 'color_pelaje' in request.POST:
+                            mascota.color_pelaje = request.POST['color_pelaje']
+                            mascota.save(update_fields=['color_pelaje'])
+                        # Guardar snapshot del estado anterior antes de actualizar
+                        if ficha.tiene_datos:
+                            # Última vacuna registrada antes de guardar la ficha
+                            ultima_vacuna_anterior = ultima_vacunacion(ficha)
                     
-                    # Crear registro histórico
-                    HistorialFichaClinica.objects.create(
-                        ficha_clinica=ficha,
-                        tipo_sangre=ficha.tipo_sangre,
-                        peso=ficha.peso,
-                        temperatura=ficha.temperatura,
-                        esterilizado=ficha.esterilizado,
-                        vacunas_al_dia=ficha.vacunas_al_dia,
-                        vacuna_nombre=ultima_vacuna_nombre_anterior,
-                        vacuna_fecha=ultima_vacuna_fecha_anterior,
-                        alergias=ficha.alergias,
-                        condiciones_cronicas=ficha.condiciones_cronicas,
-                        medicamentos_actuales=ficha.medicamentos_actuales,
-                        historial_enfermedades=ficha.historial_enfermedades,
-                        comentarios=ficha.comentarios,
-                    )
+                            # Crear registro histórico (solo guarda los campos de texto que cambiaron, ver historial.py)
+                            registrar_revision(
+                                ficha,
+                                vacuna_nombre=ultima_vacuna_anterior.vacuna if ultima_vacuna_anterior else None,
+                                vacuna_fecha=ultima_vacuna_anterior.fecha_aplicacion if ultima_vacuna_anterior else None,
+                            )
                 
-                ficha = ficha_form.save()
-                # Manejar el campo no_tengo_temperatura (no está en el modelo)
-                if request.POST.get('no_tengo_temperatura'):
-                    ficha.temperatura = None
-                    ficha.save(update_fields=['temperatura'])
-                # Manejar el campo no_tengo_vacunas
-                if request.POST.get('no_tengo_vacunas'):
-                    ficha.vacunas_al_dia = False
-                    ficha.save(update_fields=['vacunas_al_dia'])
-                # Los campos ultima_vacuna_nombre y ultima_vacuna_fecha se guardan en comentarios
-                # (no están en el modelo, se procesan en clean())
-                if ficha.microchip and mascota.microchip != ficha.microchip:
-                    mascota.microchip = ficha.microchip
-                    mascota.save(update_fields=['microchip'])
-                messages.success(request, 'Ficha clínica guardada exitosamente.')
-                return redirect('bitacora_mascota', mascota_id=mascota.id)
-            else:
-                messages.error(request, 'Revisa los datos de la bitácora.')
-                mostrar_formulario = True
+                        ficha = ficha_form.save()
+                        # Manejar el campo no_tengo_temperatura (no está en el modelo)
+                        if request.POST.get('no_tengo_temperatura'):
+                            ficha.temperatura = None
+                            ficha.save(update_fields=['temperatura'])
+                        # Manejar el campo no_tengo_vacunas
+                        if request.POST.get('no_tengo_vacunas'):
+                            ficha.vacunas_al_dia = False
+                            ficha.save(update_fields=['vacunas_al_dia'])
+                        # La vacuna indicada (ultima_vacuna_nombre y ultima_vacuna_fecha) ya quedó registrada
+                        # como Vacunacion en ficha_form.save()
+                        messages.success(request, 'Ficha clínica guardada exitosamente.')
+                        return redirect('bitacora_mascota', mascota_id=mascota.id)
+            # Formulario inválido o microchip ya registrado
+            messages.error(request, 'Revisa los datos de la bitácora.')
+            mostrar_formulario = True
         elif 'subir_archivo_ficha' in request.POST:
             # Manejar subida de archivos desde la sección de archivos adjuntos
-            archivos_adjuntos = request.FILES.getlist('archivos_ficha')
-            archivos_validos = []
-            
-            if archivos_adjuntos:
-                formatos_permitidos = ArchivoAdjunto.FORMATOS_PERMITIDOS
-                tamano_maximo = ArchivoAdjunto.TAMANO_MAXIMO
-                
-                for archivo in archivos_adjuntos:
-                    nombre_archivo = archivo.name
-                    extension = nombre_archivo.split('.')[-1].lower() if '.' in nombre_archivo else ''
-                    
-                    if extension not in formatos_permitidos:
-                        formatos_str = ', '.join(formatos_permitidos)
-                        messages.error(request, f'El archivo "{nombre_archivo}" tiene un formato no permitido. Formatos permitidos: {formatos_str}')
-                        continue
-                    
-                    if archivo.size > tamano_maximo:
-                        tamano_mb = tamano_maximo / (1024 * 1024)
-                        messages.error(request, f'El archivo "{nombre_archivo}" excede el tamaño máximo permitido ({tamano_mb}MB)')
-                        continue
-                    
-                    archivos_validos.append(archivo)
+            if request.FILES.getlist('archivos_ficha'):
+                archivos_validos = adjuntos_validos(request, 'archivos_ficha')
                 
                 if archivos_validos:
                     # Crear un evento de tipo comentario para los archivos
@@ -1294,16 +972,7 @@ def bitacora_mascota_view(request, mascota_id):
                         descripcion='Archivos adjuntos a la bitácora'
                     )
                     
-                    # Guardar archivos adjuntos
-                    for archivo in archivos_validos:
-                        extension = archivo.name.split('.')[-1].lower() if '.' in archivo.name else ''
-                        ArchivoAdjunto.objects.create(
-                            evento_clinico=evento_archivos,
-                            nombre=archivo.name,
-                            archivo=archivo,
-                            tipo_archivo=extension,
-                            tamano=archivo.size
-                        )
+                    guardar_adjuntos(evento_archivos, archivos_validos)
                     
                     messages.success(request, f'{len(archivos_validos)} archivo(s) subido(s) correctamente.')
             else:
@@ -1317,9 +986,9 @@ def bitacora_mascota_view(request, mascota_id):
                 if registro_id:
                     registro = ficha.historial_registros.get(pk=registro_id)
                 else:
-                    registro = ficha.historial_registros.order_by('-creado_en').first()
+                    registro = ficha.historial_registros.order_by('-id').first()
                 if registro:
-                    registro.delete()
+                    eliminar_revision(registro)
                     messages.success(request, 'Registro eliminado correctamente.')
                 else:
                     messages.info(request, 'No hay registros para eliminar.')
@@ -1328,14 +997,9 @@ def bitacora_mascota_view(request, mascota_id):
             return redirect('bitacora_mascota', mascota_id=mascota.id)
     else:
         ficha_form = FichaClinicaForm(instance=ficha, mascota=mascota, es_nuevo_registro=es_nuevo_registro)
-        if not mascota.microchip or (isinstance(mascota.microchip, str) and not mascota.microchip.strip()):
-            mascota.microchip = f"M{mascota.id:06d}"
-            Mascota.objects.filter(pk=mascota.pk).update(microchip=mascota.microchip)
-            mascota.refresh_from_db()
-        
-        if not ficha.microchip or (isinstance(ficha.microchip, str) and not ficha.microchip.strip()):
-            ficha.microchip = mascota.microchip
-            ficha.save(update_fields=['microchip'])
+        # Sin identificador: se asigna el provisorio (o el de la mascota, si solo falta en la ficha)
+        if not (mascota.microchip or '').strip() or not (ficha.microchip or '').strip():
+            asignar_microchip(mascota, (mascota.microchip or '').strip() or microchip_provisorio(mascota.id), ficha)
         
         ficha_form.fields['microchip'].initial = mascota.microchip
         
@@ -1343,16 +1007,15 @@ def bitacora_mascota_view(request, mascota_id):
         if ficha.temperatura is None:
             ficha_form.fields['no_tengo_temperatura'].initial = True
     
-    # Extraer información de vacunas de comentarios (para ambos casos: GET y POST)
-    ultima_vacuna_nombre = None
+    # Visitas, controles, eventos del calendario y vacunas en una lectura de eventos y una de vacunaciones
+    estadisticas = EstadisticasEventos(ficha, hoy)
+    
+    # Última vacuna registrada (para ambos casos: GET y POST)
+    ultima_vacuna = estadisticas.ultima_vacuna
+    ultima_vacuna_nombre = ultima_vacuna.vacuna if ultima_vacuna else None
     ultima_vacuna_fecha_str = None
-    if ficha.comentarios and 'Última vacuna:' in ficha.comentarios:
-        import re
-        match = re.search(r'Última vacuna: ([^-]+)(?: - Fecha: (\d{2}/\d{2}/\d{4}))?', ficha.comentarios)
-        if match:
-            ultima_vacuna_nombre = match.group(1).strip()
-            if match.group(2):
-                ultima_vacuna_fecha_str = match.group(2).strip()
+    if ultima_vacuna and ultima_vacuna.fecha_aplicacion:
+        ultima_vacuna_fecha_str = ultima_vacuna.fecha_aplicacion.strftime('%d/%m/%Y')
     
     # Extraer información de esterilizado
     esterilizado_display = 'Desconocido'
@@ -1370,120 +1033,35 @@ def bitacora_mascota_view(request, mascota_id):
     elif not ficha.vacunas_al_dia and ficha.vacunas_al_dia is not None:
         vacunas_display = 'No'
 
-    # Obtener historial de registros en orden ascendente (antiguo arriba, nuevo abajo)
-    historial_registros = ficha.historial_registros.all().order_by('creado_en')[:50]
+    # Historial de registros reconstruido en orden ascendente (antiguo arriba, nuevo abajo),
+    # solo se consulta si el template lo usa
+    historial_registros = SimpleLazyObject(lambda: revisiones_ficha(ficha.pk, limite=50))
 
     # Contar total de registros
     total_registros = ficha.historial_registros.count()
     
     # Último registro histórico (para acciones rápidas como eliminar)
-    ultimo_registro_hist = ficha.historial_registros.order_by('-creado_en').first()
+    ultimo_registro_hist = ficha.historial_registros.order_by('-id').first()
     ultimo_registro_id = ultimo_registro_hist.id if ultimo_registro_hist else None
     
     # Verificar si los campos fijos están ocultos
     tipo_sangre_oculto = isinstance(ficha_form.fields.get('tipo_sangre', None).widget, forms.HiddenInput) if 'tipo_sangre' in ficha_form.fields else False
     esterilizado_oculto = isinstance(ficha_form.fields.get('esterilizado', None).widget, forms.HiddenInput) if 'esterilizado' in ficha_form.fields else False
     
-    # Obtener eventos con archivos adjuntos para mostrar en el historial
-    eventos_con_archivos = []
-    todos_los_archivos = []  # Para la sección de archivos adjuntos
-    for evento in eventos:
-        archivos = evento.archivos_adjuntos.all()
-        eventos_con_archivos.append({
-            'evento': evento,
-            'archivos': archivos,
-        })
-        # Recopilar todos los archivos
-        for archivo in archivos:
-            todos_los_archivos.append({
-                'archivo': archivo,
-                'evento': evento,
-            })
-    
-    # Ordenar archivos por fecha de subida (más recientes primero)
-    todos_los_archivos.sort(key=lambda x: x['archivo'].fecha_subida, reverse=True)
+    # Primera página del historial (las siguientes se cargan desde historial_eventos_mascota)
+    # y galería con todos los archivos de los eventos filtrados
+    eventos_con_archivos, siguiente_cursor = pagina_historial(eventos)
+    todos_los_archivos = archivos_de_eventos(eventos)
     
     # ========== LÓGICA DEL CALENDARIO (similar a home_view) ==========
     today = timezone.now().date()
     
     # Obtener mes y año desde los parámetros GET o usar el mes actual
-    mes_seleccionado = request.GET.get('mes')
-    anio_seleccionado = request.GET.get('anio')
-    
-    if mes_seleccionado and anio_seleccionado:
-        try:
-            mes = int(mes_seleccionado)
-            anio = int(anio_seleccionado)
-            if 1 <= mes <= 12 and 2000 <= anio <= 2100:
-                fecha_calendario = timezone.datetime(anio, mes, 1).date()
-            else:
-                fecha_calendario = today
-        except (ValueError, TypeError):
-            fecha_calendario = today
-    else:
-        fecha_calendario = today
-    
-    meses_es = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    calendario = calendar.Calendar(firstweekday=0)
-    semanas_calendario = []
-    semanas_meta = []
-    semana_actual = []
-    
-    # Construir semanas del mes con rango de fechas
-    week_index = 0
-    for dia in calendario.itermonthdates(fecha_calendario.year, fecha_calendario.month):
-        if dia.month == fecha_calendario.month:
-            semana_actual.append(dia)
-        else:
-            semana_actual.append('')
-        
-        if len(semana_actual) == 7:
-            semanas_calendario.append([d.day if d != '' else '' for d in semana_actual])
-            fechas_reales = [d for d in semana_actual if d != '']
-            if fechas_reales:
-                inicio_sem = fechas_reales[0]
-                fin_sem = fechas_reales[-1]
-                semanas_meta.append({
-                    'index': week_index + 1,
-                    'inicio': inicio_sem.strftime('%d %b'),
-                    'fin': fin_sem.strftime('%d %b'),
-                })
-            else:
-                semanas_meta.append({
-                    'index': week_index + 1,
-                    'inicio': '',
-                    'fin': '',
-                })
-            semana_actual = []
-            week_index += 1
-    if semana_actual:
-        while len(semana_actual) < 7:
-            semana_actual.append('')
-        semanas_calendario.append([d.day if d != '' else '' for d in semana_actual])
-        fechas_reales = [d for d in semana_actual if d != '']
-        if fechas_reales:
-            inicio_sem = fechas_reales[0]
-            fin_sem = fechas_reales[-1]
-            semanas_meta.append({
-                'index': week_index + 1,
-                'inicio': inicio_sem.strftime('%d %b'),
-                'fin': fin_sem.strftime('%d %b'),
-            })
-        else:
-            semanas_meta.append({
-                'index': week_index + 1,
-                'inicio': '',
-                'fin': '',
-            })
+    fecha_calendario = fecha_calendario_desde_request(request, today)
+    weeks_paired = list(grilla_mes(fecha_calendario.year, fecha_calendario.month).pares)
     
-    weeks_paired = list(zip(semanas_calendario, semanas_meta))
-    
-    # Obtener eventos del mes seleccionado solo para esta mascota específica en la bitácora
-    eventos_mes = EventoClinico.objects.filter(
-        ficha_clinica__mascota=mascota,
-        fecha_evento__year=fecha_calendario.year,
-        fecha_evento__month=fecha_calendario.month
-    ).select_related('ficha_clinica__mascota').order_by('fecha_evento', 'hora_evento')
+    # Eventos del mes seleccionado solo para esta mascota específica en la bitácora
+    eventos_mes = estadisticas.eventos_del_mes(fecha_calendario.year, fecha_calendario.month)
     
     # Crear diccionario de eventos por día
     eventos_por_dia = {}
@@ -1496,13 +1074,13 @@ def bitacora_mascota_view(request, mascota_id):
             'id': evento.id,
             'tipo': evento.tipo_evento,
             'tipo_display': evento.get_tipo_evento_display(),
-            'mascota': evento.ficha_clinica.mascota.nombre,
+            'mascota': mascota.nombre,
             'descripcion': evento.descripcion[:50] if evento.descripcion else '',
             'hora': hora_evento,
         })
     
     # Obtener todas las mascotas del usuario para el modal de eventos
-    todas_las_mascotas = Mascota.objects.filter(tutor=request.user, activa=True).order_by('nombre')
+    todas_las_mascotas = obtener_mascotas_usuario(request)
     
     # Manejar formulario de eventos en la bitácora (similar a home)
     mostrar_popup_evento = False
@@ -1514,49 +1092,22 @@ def bitacora_mascota_view(request, mascota_id):
             mascota_id = request.POST.get('mascota_id')
             if mascota_id:
                 try:
-                    mascota_evento = Mascota.objects.get(pk=mascota_id, tutor=request.user, activa=True)
-                    ficha_evento, _ = FichaClinica.objects.get_or_create(mascota=mascota_evento)
+                    mascota_evento = Mascota.objects.select_related('ficha_clinica').get(pk=mascota_id, tutor=request.user, activa=True)
+                    ficha_evento = mascota_evento.ficha_clinica
                     
-                    archivos_adjuntos = request.FILES.getlist('archivos')
-                    archivos_validos = []
-                    
-                    if archivos_adjuntos:
-                        formatos_permitidos = ArchivoAdjunto.FORMATOS_PERMITIDOS
-                        tamano_maximo = ArchivoAdjunto.TAMANO_MAXIMO
-                        
-                        for archivo in archivos_adjuntos:
-                            nombre_archivo = archivo.name
-                            extension = nombre_archivo.split('.')[-1].lower() if '.' in nombre_archivo else ''
-                            
-                            if extension not in formatos_permitidos:
-                                formatos_str = ', '.join(formatos_permitidos)
-                                messages.error(request, f'El archivo "{nombre_archivo}" tiene un formato no permitido. Formatos permitidos: {formatos_str}')
-                                continue
-                            
-                            if archivo.size > tamano_maximo:
-                                tamano_mb = tamano_maximo / (1024 * 1024)
-                                messages.error(request, f'El archivo "{nombre_archivo}" excede el tamaño máximo permitido ({tamano_mb}MB)')
-                                continue
-                            
-                            archivos_validos.append(archivo)
+                    archivos_validos = adjuntos_validos(request)
                     
                     evento = evento_form.save(commit=False, archivos_adjuntos=archivos_validos)
                     evento.ficha_clinica = ficha_evento
                     evento.save()
                     
-                    for archivo in archivos_validos:
-                        extension = archivo.name.split('.')[-1].lower() if '.' in archivo.name else ''
-                        ArchivoAdjunto.objects.create(
-                            evento_clinico=evento,
-                            nombre=archivo.name,
-                            archivo=archivo,
-                            tipo_archivo=extension,
-                            tamano=archivo.size
-                        )
+                    guardar_adjuntos(evento, archivos_validos)
                     
                     mostrar_popup_evento = True
                     evento_mascota_nombre = mascota_evento.nombre
-                    evento_num_recordatorios = 0  # Por ahora, no hay recordatorios implementados
+                    # Recordatorios como en home_view, si el formulario trae el checkbox
+                    if request.POST.get('activar_recordatorios') == 'on':
+                        evento_num_recordatorios = programar_recordatorios(evento, mascota_evento, request.user)
                     
                     # Redirigir para recargar el calendario con el nuevo evento
                     return redirect('bitacora_mascota', mascota_id=mascota.id)
@@ -1573,118 +1124,22 @@ def bitacora_mascota_view(request, mascota_id):
     # ========== FIN LÓGICA DEL CALENDARIO ==========
     
     # ========== LÓGICA DE EVOLUCIÓN DEL PESO ==========
-    # Mapeo de meses en español
-    meses_es_peso = {
-        1: 'Ene', 2: 'Feb', 3: 'Mar', 4: 'Abr', 5: 'May', 6: 'Jun',
-        7: 'Jul', 8: 'Ago', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dic'
-    }
-    
-    # Historial de peso desde registros de peso
-    historial_peso = []
-    historial_peso_json = []
-    pesos = mascota.pesos.order_by('fecha')
-    for registro in pesos:
-        historial_peso.append({
-            'id': registro.id,
-            'fecha': registro.fecha,
-            'fecha_display': registro.fecha.strftime('%d/%m/%Y'),
-            'mes_abrev': meses_es_peso.get(registro.fecha.month, registro.fecha.strftime('%b')),
-            'peso': float(registro.peso),
-        })
-        historial_peso_json.append({
-            'fecha': registro.fecha.strftime('%Y-%m-%d'),
-            'peso': float(registro.peso),
-        })
-    
-    # Agregar peso del historial de registros clínicos
-    historial_registros_qs = ficha.historial_registros.all().order_by('creado_en')
-    for registro in historial_registros_qs:
-        if registro.peso:
-            fecha_registro = registro.creado_en.date()
-            historial_peso.append({
-                'id': None,
-                'fecha': fecha_registro,
-                'fecha_display': fecha_registro.strftime('%d/%m/%Y'),
-                'mes_abrev': meses_es_peso.get(fecha_registro.month, fecha_registro.strftime('%b')),
-                'peso': float(registro.peso),
-            })
-            historial_peso_json.append({
-                'fecha': fecha_registro.strftime('%Y-%m-%d'),
-                'peso': float(registro.peso),
-            })
-    
-    # Agregar peso actual si existe
-    if ficha.peso:
-        fecha_actual = ficha.actualizado_en.date()
-        historial_peso.append({
-            'id': None,
-            'fecha': fecha_actual,
-            'fecha_display': fecha_actual.strftime('%d/%m/%Y'),
-            'mes_abrev': meses_es_peso.get(fecha_actual.month, fecha_actual.strftime('%b')),
-            'peso': float(ficha.peso),
-        })
-        historial_peso_json.append({
-            'fecha': fecha_actual.strftime('%Y-%m-%d'),
-            'peso': float(ficha.peso),
-        })
-    
-    # Ordenar por fecha (ascendente para el gráfico)
-    historial_peso.sort(key=lambda x: x['fecha'])
-    historial_peso_json.sort(key=lambda x: x['fecha'])
-    
-    # Crear lista de últimos registros ordenada descendente (más reciente primero)
-    ultimos_registros_peso = sorted(historial_peso, key=lambda x: x['fecha'], reverse=True)
-    historial_peso_json = json.dumps(historial_peso_json)
-    
-    # Cambio total de peso
-    cambio_peso_display = None
-    if len(historial_peso) >= 2:
-        peso_inicial = historial_peso[0]['peso']
-        peso_final = historial_peso[-1]['peso']
-        delta = peso_final - peso_inicial
-        signo = '+' if delta > 0 else ('-' if delta < 0 else '±')
-        cambio_peso_display = f"{signo}{abs(delta):.1f} kg ({peso_inicial:.1f} kg → {peso_final:.1f} kg)"
+    # Serie unificada (PesoMascota + historial + ficha) precalculada y mantenida por señales
+    serie_peso = serie_peso_mascota(mascota.id)
+    historial_peso_json = serie_peso['historial_peso_json']
+    ultimos_registros_peso = serie_peso['ultimos_registros_peso']
+    cambio_peso_display = serie_peso['cambio_peso_display']
     # ========== FIN LÓGICA DE EVOLUCIÓN DEL PESO ==========
     
-    # Obtener última vacuna y próxima visita
-    ultima_vacuna = ficha.eventos.filter(tipo_evento='vacuna').order_by('-fecha_evento').first()
-    proximas_visitas = ficha.eventos.filter(
-        tipo_evento__in=['cita_general', 'cita_especialista'],
-        fecha_evento__gte=hoy
-    ).order_by('fecha_evento')
-    proxima_visita = proximas_visitas.first()
+    # Obtener próxima visita
+    proxima_visita = estadisticas.proxima_visita
     
     # ========== LÓGICA DE REGISTRO DE VACUNAS ==========
-    eventos_vacunas_raw = ficha.eventos.filter(tipo_evento='vacuna').order_by('-fecha_evento')
-    eventos_vacunas = []
-    hoy_date = timezone.now().date()
-    
-    for evento in eventos_vacunas_raw:
-        # Extraer nombre de la vacuna de la descripción o usar "Vacuna" por defecto
-        nombre_vacuna = evento.descripcion.split('\n')[0].strip() if evento.descripcion else 'Vacuna'
-        if not nombre_vacuna or nombre_vacuna == '':
-            nombre_vacuna = 'Vacuna'
-        
-        # Calcular próxima fecha (asumiendo 1 año después de la aplicación)
-        fecha_aplicada = evento.fecha_evento
-        from datetime import timedelta
-        proxima_fecha = fecha_aplicada + timedelta(days=365)
-        es_proxima = proxima_fecha > hoy_date
-        
-        eventos_vacunas.append({
-            'id': evento.id,
-            'nombre': nombre_vacuna,
-            'fecha_aplicada': fecha_aplicada,
-            'proxima_fecha': proxima_fecha if es_proxima else None,
-            'veterinario': evento.veterinario or '',
-            'es_proxima': es_proxima,
-        })
+    eventos_vacunas = vacunas_ficha(ficha, hoy, estadisticas.vacunaciones)
     # ========== FIN LÓGICA DE REGISTRO DE VACUNAS ==========
     
     # ========== LÓGICA DE CONTROLES VETERINARIOS ==========
-    eventos_controles_raw = ficha.eventos.filter(
-        tipo_evento__in=['cita_general', 'cita_especialista']
-    ).order_by('-fecha_evento')
+    eventos_controles_raw = estadisticas.controles
     eventos_controles = []
     
     for evento in eventos_controles_raw:
@@ -1719,6 +1174,7 @@ def bitacora_mascota_view(request, mascota_id):
         'total_registros': total_registros,
         'ultimo_registro_id': ultimo_registro_id,
         'eventos_con_archivos': eventos_con_archivos,
+        'siguiente_cursor': siguiente_cursor,
         'todos_los_archivos': todos_los_archivos,
         'filtro_fecha_desde': filtro_fecha_desde,
         'filtro_fecha_hasta': filtro_fecha_hasta,
@@ -1726,7 +1182,7 @@ def bitacora_mascota_view(request, mascota_id):
         'tipos_evento_choices': EventoClinico.TIPO_EVENTO_CHOICES,
         # Variables del calendario
         'weeks_paired': weeks_paired,
-        'current_month': f"{meses_es[fecha_calendario.month - 1]} {fecha_calendario.year}",
+        'current_month': f"{MESES_ES[fecha_calendario.month - 1]} {fecha_calendario.year}",
         'fecha_calendario': fecha_calendario,
         'eventos_por_dia': eventos_por_dia,
         'total_eventos_mes': len(eventos_mes),
@@ -1746,15 +1202,174 @@ def bitacora_mascota_view(request, mascota_id):
     })
 
 
+def _datos_perfil_mascota(mascota, ficha, today, fecha_calendario, grilla, con_historial):
+    """
+    Datos del perfil de la mascota que solo dependen de sus registros, del día y del mes del
+    calendario (la vista los guarda en caché por versión de la mascota). Con con_historial
+    incluye la primera página del historial sin filtros.
+    """
+    # Conteos en una consulta agrupada, eventos y vacunaciones en una lectura cada uno
+    estadisticas = EstadisticasEventos(ficha, today)
+    
+    # Última visita veterinario (excluyendo comentarios) y próxima (cita futura más cercana)
+    ultima_visita_veterinario = estadisticas.ultima_visita
+    proxima_visita_veterinario = estadisticas.proxima_visita
+    
+    # Última vacuna registrada y próxima dosis pendiente
+    ultima_vacuna = estadisticas.ultima_vacuna
+    ultima_vacuna_nombre = ultima_vacuna.vacuna if ultima_vacuna else None
+    ultima_vacuna_fecha_str = None
+    if ultima_vacuna and ultima_vacuna.fecha_aplicacion:
+        ultima_vacuna_fecha_str = ultima_vacuna.fecha_aplicacion.strftime('%d/%m/%Y')
+    proxima_vacuna = estadisticas.siguiente_dosis if ultima_vacuna else None
+    dias_proxima_vacuna = (proxima_vacuna.proxima_dosis - today).days if proxima_vacuna else None
+    proxima_vacuna_vencida = dias_proxima_vacuna is not None and dias_proxima_vacuna < 0
+    if proxima_vacuna_vencida:
+        dias_proxima_vacuna = -dias_proxima_vacuna
+    
+    # Serie unificada de peso (PesoMascota + historial + ficha) precalculada y mantenida por señales
+    serie_peso = serie_peso_mascota(mascota.id)
+    
+    # Historial de registros clínicos reconstruido (del más reciente al más antiguo) en una consulta
+    historial_registros_list = revisiones_ficha(ficha.pk, recientes_primero=True)
+    
+    # Historial de temperatura para gráficos
+    historial_temperatura = []
+    historial_temperatura_json = []
+    for registro in historial_registros_list:
+        if registro.temperatura:
+            fecha_registro = registro.creado_en.date()
+            historial_temperatura.append({
+                'fecha': fecha_registro,
+                'fecha_display': fecha_registro.strftime('%d/%m/%Y'),
+                'temperatura': float(registro.temperatura),
+            })
+            historial_temperatura_json.append({
+                'fecha': fecha_registro.strftime('%Y-%m-%d'),
+                'temperatura': float(registro.temperatura),
+            })
+    
+    if ficha.temperatura:
+        fecha_actual = ficha.actualizado_en.date()
+        historial_temperatura.append({
+            'fecha': fecha_actual,
+            'fecha_display': fecha_actual.strftime('%d/%m/%Y'),
+            'temperatura': float(ficha.temperatura),
+        })
+        historial_temperatura_json.append({
+            'fecha': fecha_actual.strftime('%Y-%m-%d'),
+            'temperatura': float(ficha.temperatura),
+        })
+    
+    historial_temperatura.sort(key=lambda x: x['fecha'])
+    historial_temperatura_json.sort(key=lambda x: x['fecha'])
+    historial_temperatura_json = json.dumps(historial_temperatura_json)
+    
+    # Total de visitas (eventos clínicos)
+    total_visitas = estadisticas.total_visitas
+    
+    # ========== LÓGICA DEL CALENDARIO CON NAVEGACIÓN DE MESES ==========
+    # Eventos del mes seleccionado solo para esta mascota específica
+    eventos_mes = estadisticas.eventos_del_mes(fecha_calendario.year, fecha_calendario.month)
+    
+    # Crear diccionario de eventos por día
+    eventos_por_dia = {}
+    for evento in eventos_mes:
+        dia = evento.fecha_evento.day
+        if dia not in eventos_por_dia:
+            eventos_por_dia[dia] = []
+        hora_evento = evento.hora_evento.strftime('%H:%M') if evento.hora_evento else None
+        eventos_por_dia[dia].append({
+            'id': evento.id,
+            'tipo': evento.tipo_evento,
+            'tipo_display': evento.get_tipo_evento_display(),
+            'mascota': mascota.nombre,
+            'descripcion': evento.descripcion[:50] if evento.descripcion else '',
+            'hora': hora_evento,
+        })
+    # ========== FIN LÓGICA DEL CALENDARIO ==========
+    
+    # Agrupar eventos por fecha para pintar en el calendario
+    eventos_por_fecha = {}
+    for ev in estadisticas.eventos:
+        eventos_por_fecha.setdefault(ev.fecha_evento.strftime('%Y-%m-%d'), []).append(ev)
+    eventos_medicacion_por_fecha = {
+        fecha.strftime('%Y-%m-%d'): dosis for fecha, dosis in estadisticas.medicacion_por_dia.items()
+    }
+    
+    # Dosis por semana y días con medicación del mes actual para el calendario
+    dosis_por_semana = [0] * len(grilla.pares)
+    dias_con_medicacion = set()
+    for fecha, dosis in estadisticas.medicacion_por_dia.items():
+        if fecha.year == today.year and fecha.month == today.month:
+            dias_con_medicacion.add(fecha.day)
+            semana_num = grilla.semana_por_dia[fecha.day] if fecha.day < len(grilla.semana_por_dia) else 0
+            if semana_num:
+                dosis_por_semana[semana_num - 1] += dosis
+    
+    # Eventos por tipo (para estadísticas, sin filtros)
+    eventos_por_tipo = estadisticas.por_tipo_display
+    
+    # Calcular resumen del tratamiento
+    resumen_tratamiento = {
+        'medicamento': ficha.medicamentos_actuales or '—',
+        'total_dosis': estadisticas.total_medicacion,
+        'dosis_administradas': estadisticas.total_medicacion,  # Por ahora igual al total
+        'controles_medicos': estadisticas.total_controles,
+        'duracion': '—',  # Se puede calcular si hay fechas de inicio y fin
+        'recomendaciones': ficha.comentarios or '—',
+    }
+    
+    # Calcular duración si hay eventos de medicación
+    if estadisticas.periodo_medicacion:
+        primera_fecha, ultima_fecha = estadisticas.periodo_medicacion
+        dias = (ultima_fecha - primera_fecha).days
+        semanas = dias // 7
+        if semanas > 0:
+            resumen_tratamiento['duracion'] = f"{semanas} semana{'s' if semanas != 1 else ''}"
+        else:
+            resumen_tratamiento['duracion'] = f"{dias} día{'s' if dias != 1 else ''}"
+    
+    datos = {
+        'ultima_vacuna': ultima_vacuna,
+        'ultima_vacuna_nombre': ultima_vacuna_nombre,
+        'ultima_vacuna_fecha_str': ultima_vacuna_fecha_str,
+        'proxima_vacuna': proxima_vacuna,
+        'dias_proxima_vacuna': dias_proxima_vacuna,
+        'proxima_vacuna_vencida': proxima_vacuna_vencida,
+        'ultima_visita_veterinario': ultima_visita_veterinario,
+        'proxima_visita_veterinario': proxima_visita_veterinario,
+        'historial_peso': serie_peso['historial_peso'],
+        'historial_peso_json': serie_peso['historial_peso_json'],
+        'ultimos_registros_peso': serie_peso['ultimos_registros_peso'],
+        'cambio_peso_display': serie_peso['cambio_peso_display'],
+        'historial_temperatura': historial_temperatura,
+        'historial_temperatura_json': historial_temperatura_json,
+        'revisiones': historial_registros_list,
+        'eventos_por_tipo': eventos_por_tipo,
+        'total_visitas': total_visitas,
+        'eventos_por_dia': eventos_por_dia,
+        'total_eventos_mes': len(eventos_mes),
+        'eventos_por_fecha': eventos_por_fecha,
+        'eventos_medicacion_por_fecha': eventos_medicacion_por_fecha,
+        'dosis_por_semana': dosis_por_semana,
+        'dias_con_medicacion': dias_con_medicacion,
+        'resumen_tratamiento': resumen_tratamiento,
+    }
+    if con_historial:
+        datos['eventos_con_archivos'], datos['siguiente_cursor'] = pagina_historial(ficha.eventos.all())
+    return datos
+
+
 @login_required
 @perfil_completo_required
 def perfil_mascota_view(request, mascota_id):
     try:
-        mascota = Mascota.objects.prefetch_related('pesos').get(pk=mascota_id, tutor=request.user, activa=True)
+        mascota = Mascota.objects.select_related('ficha_clinica').get(pk=mascota_id, tutor=request.user, activa=True)
     except Mascota.DoesNotExist:
         messages.error(request, 'No existe ninguna mascota con esa referencia o no tienes permiso para verla.')
         return redirect('home')
-    ficha, _ = FichaClinica.objects.get_or_create(mascota=mascota)
+    ficha = mascota.ficha_clinica
     
     # Crear evento desde el calendario (modal)
     if request.method == 'POST':
@@ -1767,39 +1382,14 @@ def perfil_mascota_view(request, mascota_id):
                     fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
                     
                     # Validar archivos adjuntos
-                    archivos_adjuntos = request.FILES.getlist('archivos')
-                    archivos_validos = []
-                    
-                    if archivos_adjuntos:
-                        formatos_permitidos = ArchivoAdjunto.FORMATOS_PERMITIDOS
-                        tamano_maximo = ArchivoAdjunto.TAMANO_MAXIMO
-                        
-                        for archivo in archivos_adjuntos:
-                            nombre_archivo = archivo.name
-                            extension = nombre_archivo.split('.')[-1].lower() if '.' in nombre_archivo else ''
-                            
-                            if extension not in formatos_permitidos:
-                                continue
-                            if archivo.size > tamano_maximo:
-                                continue
-                            
-                            archivos_validos.append(archivo)
+                    archivos_validos = adjuntos_validos(request)
                     
                     evento = evento_form_perfil.save(commit=False, archivos_adjuntos=archivos_validos)
                     evento.ficha_clinica = ficha
                     evento.fecha_evento = fecha
                     evento.save()
                     
-                    # Guardar archivos adjuntos
-                    for archivo in archivos_validos:
-                        extension = archivo.name.split('.')[-1].lower() if '.' in archivo.name else ''
-                        ArchivoAdjunto.objects.create(
-                            evento_clinico=evento,
-                            nombre=archivo.name,
-                            archivo=archivo,
-                            tipo_archivo=extension,
-                            tamano=archivo.size
-                        )
+                    guardar_adjuntos(evento, archivos_validos)
                     
                     messages.success(request, 'Evento agregado al calendario.')
                 except Exception:
@@ -1811,43 +1401,13 @@ def perfil_mascota_view(request, mascota_id):
             evento_form = EventoClinicoForm(request.POST, request.FILES)
             if evento_form.is_valid():
                 # Validar archivos adjuntos
-                archivos_adjuntos = request.FILES.getlist('archivos')
-                archivos_validos = []
-                
-                if archivos_adjuntos:
-                    formatos_permitidos = ArchivoAdjunto.FORMATOS_PERMITIDOS
-                    tamano_maximo = ArchivoAdjunto.TAMANO_MAXIMO
-                    
-                    for archivo in archivos_adjuntos:
-                        nombre_archivo = archivo.name
-                        extension = nombre_archivo.split('.')[-1].lower() if '.' in nombre_archivo else ''
-                        
-                        if extension not in formatos_permitidos:
-                            formatos_str = ', '.join(formatos_permitidos)
-                            messages.error(request, f'El archivo "{nombre_archivo}" tiene un formato no permitido. Formatos permitidos: {formatos_str}')
-                            continue
-                        
-                        if archivo.size > tamano_maximo:
-                            tamano_mb = tamano_maximo / (1024 * 1024)
-                            messages.error(request, f'El archivo "{nombre_archivo}" excede el tamaño máximo permitido ({tamano_mb}MB)')
-                            continue
-                        
-                        archivos_validos.append(archivo)
+                archivos_validos = adjuntos_validos(request)
                 
                 evento = evento_form.save(commit=False, archivos_adjuntos=archivos_validos)
                 evento.ficha_clinica = ficha
                 evento.save()
                 
-                # Guardar archivos adjuntos
-                for archivo in archivos_validos:
-                    extension = archivo.name.split('.')[-1].lower() if '.' in archivo.name else ''
-                    ArchivoAdjunto.objects.create(
-                        evento_clinico=evento,
-                        nombre=archivo.name,
-                        archivo=archivo,
-                        tipo_archivo=extension,
-                        tamano=archivo.size
-                    )
+                guardar_adjuntos(evento, archivos_validos)
                 
                 if archivos_validos:
                     messages.success(request, f'Evento registrado exitosamente con {len(archivos_validos)} archivo(s) adjunto(s).')
@@ -1857,16 +1417,7 @@ def perfil_mascota_view(request, mascota_id):
             else:
                 messages.error(request, 'Revisa los datos del evento.')
     
-    # Última visita veterinario (excluyendo comentarios)
-    ultima_visita_veterinario = ficha.eventos.exclude(tipo_evento='comentario').order_by('-fecha_evento').first()
-    
-    # Próxima visita veterinario (eventos futuros más cercanos)
     today = timezone.now().date()
-    proximas_visitas = ficha.eventos.filter(
-        tipo_evento__in=[EventoClinico.TIPO_CITA_GENERAL, EventoClinico.TIPO_CITA_ESPECIALISTA],
-        fecha_evento__gte=today
-    ).order_by('fecha_evento', 'hora_evento')
-    proxima_visita_veterinario = proximas_visitas.first()
     
     # Calcular datos para el perfil
     bitacora_completada = ficha.tiene_datos
@@ -1884,20 +1435,6 @@ def perfil_mascota_view(request, mascota_id):
     if not ficha.alergias and not ficha.condiciones_cronicas:
         salud_score += 1
     
-    # Última vacuna
-    ultima_vacuna = ficha.eventos.filter(tipo_evento=EventoClinico.TIPO_VACUNA).order_by('-fecha_evento').first()
-    
-    # Extraer información de vacunas de comentarios
-    ultima_vacuna_nombre = None
-    ultima_vacuna_fecha_str = None
-    if ficha.comentarios and 'Última vacuna:' in ficha.comentarios:
-        import re
-        match = re.search(r'Última vacuna: ([^-]+)(?: - Fecha: (\d{2}/\d{2}/\d{4}))?', ficha.comentarios)
-        if match:
-            ultima_vacuna_nombre = match.group(1).strip()
-            if match.group(2):
-                ultima_vacuna_fecha_str = match.group(2).strip()
-    
     # Calcular etapa de vida
     edad_anios = mascota.edad_en_anios
     if edad_anios is None:
@@ -1909,122 +1446,34 @@ def perfil_mascota_view(request, mascota_id):
     else:
         etapa_label = 'Senior'
     
-    # Mapeo de meses en español
-    meses_es = {
-        1: 'Ene', 2: 'Feb', 3: 'Mar', 4: 'Abr', 5: 'May', 6: 'Jun',
-        7: 'Jul', 8: 'Ago', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dic'
-    }
-    
-    # Historial de peso desde registros de peso
-    historial_peso = []
-    historial_peso_json = []
-    pesos = mascota.pesos.order_by('fecha')
-    for registro in pesos:
-        historial_peso.append({
-            'id': registro.id,
-            'fecha': registro.fecha,
-            'fecha_display': registro.fecha.strftime('%d/%m/%Y'),
-            'mes_abrev': meses_es.get(registro.fecha.month, registro.fecha.strftime('%b')),
-            'peso': float(registro.peso),
-        })
-        historial_peso_json.append({
-            'fecha': registro.fecha.strftime('%Y-%m-%d'),
-            'peso': float(registro.peso),
-        })
-    
-    # Obtener historial de registros clínicos (QuerySet primero para cálculos)
-    historial_registros_qs = ficha.historial_registros.all().order_by('creado_en')
-    
-    # Mapeo de meses en español
-    meses_es = {
-        1: 'Ene', 2: 'Feb', 3: 'Mar', 4: 'Abr', 5: 'May', 6: 'Jun',
-        7: 'Jul', 8: 'Ago', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dic'
-    }
-    
-    # Agregar peso del historial de registros clínicos
-    for registro in historial_registros_qs:
-        if registro.peso:
-            fecha_registro = registro.creado_en.date()
-            historial_peso.append({
-                'id': None,  # No tiene ID porque viene de historial clínico
-                'fecha': fecha_registro,
-                'fecha_display': fecha_registro.strftime('%d/%m/%Y'),
-                'mes_abrev': meses_es.get(fecha_registro.month, fecha_registro.strftime('%b')),
-                'peso': float(registro.peso),
-            })
-            historial_peso_json.append({
-                'fecha': fecha_registro.strftime('%Y-%m-%d'),
-                'peso': float(registro.peso),
-            })
-    
-    # Agregar peso actual si existe
-    if ficha.peso:
-        fecha_actual = ficha.actualizado_en.date()
-        historial_peso.append({
-            'id': None,  # No tiene ID porque viene de ficha clínica
-            'fecha': fecha_actual,
-            'fecha_display': fecha_actual.strftime('%d/%m/%Y'),
-            'mes_abrev': meses_es.get(fecha_actual.month, fecha_actual.strftime('%b')),
-            'peso': float(ficha.peso),
-        })
-        historial_peso_json.append({
-            'fecha': fecha_actual.strftime('%Y-%m-%d'),
-            'peso': float(ficha.peso),
-        })
-    
-    # Ordenar por fecha (ascendente para el gráfico)
-    historial_peso.sort(key=lambda x: x['fecha'])
-    historial_peso_json.sort(key=lambda x: x['fecha'])
-    
-    # Crear lista de últimos registros ordenada descendente (más reciente primero)
-    ultimos_registros_peso = sorted(historial_peso, key=lambda x: x['fecha'], reverse=True)
-    historial_peso_json = json.dumps(historial_peso_json)
-    # Cambio total de peso
-    cambio_peso_display = None
-    if len(historial_peso) >= 2:
-        peso_inicial = historial_peso[0]['peso']
-        peso_final = historial_peso[-1]['peso']
-        delta = peso_final - peso_inicial
-        signo = '+' if delta > 0 else ('-' if delta < 0 else '±')
-        cambio_peso_display = f"{signo}{abs(delta):.1f} kg  ({peso_inicial:.1f} kg → {peso_final:.1f} kg)"
-    
-    # Historial de temperatura para gráficos
-    historial_temperatura = []
-    historial_temperatura_json = []
-    for registro in historial_registros_qs:
-        if registro.temperatura:
-            fecha_registro = registro.creado_en.date()
-            historial_temperatura.append({
-                'fecha': fecha_registro,
-                'fecha_display': fecha_registro.strftime('%d/%m/%Y'),
-                'temperatura': float(registro.temperatura),
-            })
-            historial_temperatura_json.append({
-                'fecha': fecha_registro.strftime('%Y-%m-%d'),
-                'temperatura': float(registro.temperatura),
-            })
+    # Obtener mes y año desde los parámetros GET o usar el mes actual
+    fecha_calendario = fecha_calendario_desde_request(request, today)
+    grilla = grilla_mes(fecha_calendario.year, fecha_calendario.month, quitar_puntos=True)
     
-    if ficha.temperatura:
-        fecha_actual = ficha.actualizado_en.date()
-        historial_temperatura.append({
-            'fecha': fecha_actual,
-            'fecha_display': fecha_actual.strftime('%d/%m/%Y'),
-            'temperatura': float(ficha.temperatura),
-        })
-        historial_temperatura_json.append({
-            'fecha': fecha_actual.strftime('%Y-%m-%d'),
-            'temperatura': float(ficha.temperatura),
+    # Filtrado de historial clínico (CU14)
+    filtro_fecha_desde = request.GET.get('fecha_desde', '')
+    filtro_fecha_hasta = request.GET.get('fecha_hasta', '')
+    filtro_tipo_evento = request.GET.get('tipo_evento', '')
+    filtro_buscar = request.GET.get('buscar', '')
+    con_filtros = any([filtro_fecha_desde, filtro_fecha_hasta, filtro_tipo_evento, filtro_buscar])
+    
+    # Calendario, series, estadísticas e historial sin filtros: en caché hasta que cambie la mascota
+    datos = vista_mascota(
+        mascota.id, 'perfil', [today.isoformat(), fecha_calendario.year, fecha_calendario.month, int(not con_filtros)],
+        lambda: _datos_perfil_mascota(mascota, ficha, today, fecha_calendario, grilla, con_historial=not con_filtros),
+    )
+    
+    if con_filtros:
+        # Primera página del historial filtrado (las siguientes se cargan desde historial_eventos_mascota)
+        eventos = filtrar_eventos(ficha.eventos.all(), {
+            'fecha_desde': filtro_fecha_desde,
+            'fecha_hasta': filtro_fecha_hasta,
+            'tipo_evento': filtro_tipo_evento,
+            'buscar': filtro_buscar,
         })
+        datos['eventos_con_archivos'], datos['siguiente_cursor'] = pagina_historial(eventos)
     
-    historial_temperatura.sort(key=lambda x: x['fecha'])
-    historial_temperatura_json.sort(key=lambda x: x['fecha'])
-    historial_temperatura_json = json.dumps(historial_temperatura_json)
-    
-    # Total de visitas (eventos clínicos)
-    total_visitas = ficha.eventos.exclude(tipo_evento='comentario').count()
-    
-    # Convertir historial_registros a lista e incluir registro actual si existe
-    historial_registros_list = list(historial_registros_qs.order_by('-creado_en'))
+    historial_registros = datos.pop('revisiones')
     
     # Si la ficha tiene datos, agregar el registro actual al historial
     if ficha.tiene_datos:
@@ -2033,266 +1482,35 @@ def perfil_mascota_view(request, mascota_id):
                 self.creado_en = ficha.actualizado_en
                 self.peso = ficha.peso
                 self.temperatura = ficha.temperatura
-                self.vacuna_nombre = ultima_vacuna_nombre
-                self.vacuna_fecha = ultima_vacuna_fecha_str
+                self.vacuna_nombre = datos['ultima_vacuna_nombre']
+                self.vacuna_fecha = datos['ultima_vacuna_fecha_str']
                 self.alergias = ficha.alergias
                 self.condiciones_cronicas = ficha.condiciones_cronicas
                 self.medicamentos_actuales = ficha.medicamentos_actuales
         
-        registro_actual = RegistroActual()
-        historial_registros_list.insert(0, registro_actual)
+        historial_registros = [RegistroActual()] + historial_registros
     
-    historial_registros = historial_registros_list
     ultimo_registro = historial_registros[0] if historial_registros else None
     total_registros = len(historial_registros)
     
-    # ========== LÓGICA DEL CALENDARIO CON NAVEGACIÓN DE MESES ==========
-    today = timezone.now().date()
-    
-    # Obtener mes y año desde los parámetros GET o usar el mes actual
-    mes_seleccionado = request.GET.get('mes')
-    anio_seleccionado = request.GET.get('anio')
-    
-    if mes_seleccionado and anio_seleccionado:
-        try:
-            mes = int(mes_seleccionado)
-            anio = int(anio_seleccionado)
-            if 1 <= mes <= 12 and 2000 <= anio <= 2100:
-                fecha_calendario = timezone.datetime(anio, mes, 1).date()
-            else:
-                fecha_calendario = today
-        except (ValueError, TypeError):
-            fecha_calendario = today
-    else:
-        fecha_calendario = today
-    
-    calendar_headers = ['L', 'M', 'X', 'J', 'V', 'S', 'D']
-    meses_es = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    calendario = calendar.Calendar(firstweekday=0)
-    semanas_calendario = []
-    semanas_meta = []
-    semana_actual = []
-    
-    # Construir semanas del mes con rango de fechas
-    week_index = 0
-    for dia in calendario.itermonthdates(fecha_calendario.year, fecha_calendario.month):
-        if dia.month == fecha_calendario.month:
-            semana_actual.append(dia)
-        else:
-            semana_actual.append('')
-        
-        if len(semana_actual) == 7:
-            semanas_calendario.append([d.day if d != '' else '' for d in semana_actual])
-            fechas_reales = [d for d in semana_actual if d != '']
-            if fechas_reales:
-                inicio_sem = fechas_reales[0]
-                fin_sem = fechas_reales[-1]
-                semanas_meta.append({
-                    'index': week_index + 1,
-                    'inicio': inicio_sem.strftime('%d %b').replace('.', ''),
-                    'fin': fin_sem.strftime('%d %b').replace('.', ''),
-                })
-            else:
-                semanas_meta.append({
-                    'index': week_index + 1,
-                    'inicio': '',
-                    'fin': '',
-                })
-            semana_actual = []
-            week_index += 1
-    if semana_actual:
-        while len(semana_actual) < 7:
-            semana_actual.append('')
-        semanas_calendario.append([d.day if d != '' else '' for d in semana_actual])
-        fechas_reales = [d for d in semana_actual if d != '']
-        if fechas_reales:
-            inicio_sem = fechas_reales[0]
-            fin_sem = fechas_reales[-1]
-            semanas_meta.append({
-                'index': week_index + 1,
-                'inicio': inicio_sem.strftime('%d %b').replace('.', ''),
-                'fin': fin_sem.strftime('%d %b').replace('.', ''),
-            })
-        else:
-            semanas_meta.append({
-                'index': week_index + 1,
-                'inicio': '',
-                'fin': '',
-            })
-    
-    weeks_paired = list(zip(semanas_calendario, semanas_meta))
-    
-    # Obtener eventos del mes seleccionado solo para esta mascota específica
-    eventos_mes = EventoClinico.objects.filter(
-        ficha_clinica__mascota=mascota,
-        fecha_evento__year=fecha_calendario.year,
-        fecha_evento__month=fecha_calendario.month
-    ).select_related('ficha_clinica__mascota').order_by('fecha_evento', 'hora_evento')
-    
-    # Crear diccionario de eventos por día
-    eventos_por_dia = {}
-    for evento in eventos_mes:
-        dia = evento.fecha_evento.day
-        if dia not in eventos_por_dia:
-            eventos_por_dia[dia] = []
-        hora_evento = evento.hora_evento.strftime('%H:%M') if evento.hora_evento else None
-        eventos_por_dia[dia].append({
-            'id': evento.id,
-            'tipo': evento.tipo_evento,
-            'tipo_display': evento.get_tipo_evento_display(),
-            'mascota': evento.ficha_clinica.mascota.nombre,
-            'descripcion': evento.descripcion[:50] if evento.descripcion else '',
-            'hora': hora_evento,
-        })
-    # ========== FIN LÓGICA DEL CALENDARIO ==========
-    
-    # Agrupar eventos por fecha para pintar en el calendario
-    eventos_por_fecha = {}
-    eventos_medicacion_por_fecha = {}
-    for ev in ficha.eventos.all():
-        if ev.fecha_evento:
-            key = ev.fecha_evento.strftime('%Y-%m-%d')
-            eventos_por_fecha.setdefault(key, []).append(ev)
-            if ev.tipo_evento == 'medicacion':
-                eventos_medicacion_por_fecha[key] = eventos_medicacion_por_fecha.get(key, 0) + 1
-    
-    # Calcular dosis por semana para el calendario
-    dosis_por_semana = []
-    for semana, meta in weeks_paired:
-        dosis_semana = 0
-        for d in semana:
-            if d:
-                fecha_key = f"{today.year}-{today.month:02d}-{d:02d}"
-                if fecha_key in eventos_medicacion_por_fecha:
-                    dosis_semana += eventos_medicacion_por_fecha[fecha_key]
-        dosis_por_semana.append(dosis_semana)
-    
-    # Crear diccionario de días con medicación para el calendario
-    dias_con_medicacion = set()
-    for fecha_key in eventos_medicacion_por_fecha.keys():
-        try:
-            from datetime import datetime
-            fecha = datetime.strptime(fecha_key, '%Y-%m-%d').date()
-            if fecha.month == today.month and fecha.year == today.year:
-                dias_con_medicacion.add(fecha.day)
-        except:
-            pass
-    
-    # Filtrado de historial clínico (CU14)
-    filtro_fecha_desde = request.GET.get('fecha_desde', '')
-    filtro_fecha_hasta = request.GET.get('fecha_hasta', '')
-    filtro_tipo_evento = request.GET.get('tipo_evento', '')
-    filtro_buscar = request.GET.get('buscar', '')
-    
-    eventos = ficha.eventos.all()
-    
-    # Aplicar filtros
-    if filtro_fecha_desde:
-        try:
-            from datetime import datetime
-            fecha_desde = datetime.strptime(filtro_fecha_desde, '%Y-%m-%d').date()
-            eventos = eventos.filter(fecha_evento__gte=fecha_desde)
-        except ValueError:
-            pass
-    
-    if filtro_fecha_hasta:
-        try:
-            from datetime import datetime
-            fecha_hasta = datetime.strptime(filtro_fecha_hasta, '%Y-%m-%d').date()
-            eventos = eventos.filter(fecha_evento__lte=fecha_hasta)
-        except ValueError:
-            pass
-    
-    if filtro_tipo_evento:
-        eventos = eventos.filter(tipo_evento=filtro_tipo_evento)
-    
-    # Filtro de búsqueda por descripción o veterinario
-    if filtro_buscar:
-        eventos = eventos.filter(
-            Q(descripcion__icontains=filtro_buscar) |
-            Q(veterinario__icontains=filtro_buscar)
-        )
-    
-    eventos = eventos.order_by('-fecha_evento')
-    
-    # Obtener archivos adjuntos para cada evento
-    eventos_con_archivos = []
-    for evento in eventos:
-        archivos = evento.archivos_adjuntos.all()
-        eventos_con_archivos.append({
-            'evento': evento,
-            'archivos': archivos,
-        })
-    
-    # Eventos por tipo (para estadísticas, sin filtros)
-    eventos_por_tipo = {}
-    for evento in ficha.eventos.all():
-        tipo_display = evento.get_tipo_evento_display()
-        eventos_por_tipo[tipo_display] = eventos_por_tipo.get(tipo_display, 0) + 1
-    
-    # Calcular resumen del tratamiento
-    eventos_medicacion = ficha.eventos.filter(tipo_evento='medicacion').order_by('fecha_evento')
-    eventos_controles = ficha.eventos.filter(tipo_evento__in=['cita_general', 'cita_especialista']).count()
-    
-    resumen_tratamiento = {
-        'medicamento': ficha.medicamentos_actuales or '—',
-        'total_dosis': eventos_medicacion.count(),
-        'dosis_administradas': eventos_medicacion.count(),  # Por ahora igual al total
-        'controles_medicos': eventos_controles,
-        'duracion': '—',  # Se puede calcular si hay fechas de inicio y fin
-        'recomendaciones': ficha.comentarios or '—',
-    }
-    
-    # Calcular duración si hay eventos de medicación
-    if eventos_medicacion.exists():
-        primera_fecha = eventos_medicacion.first().fecha_evento
-        ultima_fecha = eventos_medicacion.last().fecha_evento
-        if primera_fecha and ultima_fecha:
-            dias = (ultima_fecha - primera_fecha).days
-            semanas = dias // 7
-            if semanas > 0:
-                resumen_tratamiento['duracion'] = f"{semanas} semana{'s' if semanas != 1 else ''}"
-            else:
-                resumen_tratamiento['duracion'] = f"{dias} día{'s' if dias != 1 else ''}"
-    
     return render(request, 'registro/perfil_mascota.html', {
+        **datos,
         'mascota': mascota,
         'ficha': ficha,
         'bitacora_completada': bitacora_completada,
         'salud_score': salud_score,
-        'ultima_vacuna': ultima_vacuna,
-        'ultima_vacuna_nombre': ultima_vacuna_nombre,
-        'ultima_vacuna_fecha_str': ultima_vacuna_fecha_str,
-        'ultima_visita_veterinario': ultima_visita_veterinario,
-        'proxima_visita_veterinario': proxima_visita_veterinario,
-        'historial_peso': historial_peso,
-        'historial_peso_json': historial_peso_json,
-        'ultimos_registros_peso': ultimos_registros_peso,
-        'cambio_peso_display': cambio_peso_display,
-        'historial_temperatura': historial_temperatura,
-        'historial_temperatura_json': historial_temperatura_json,
-        'eventos_por_tipo': eventos_por_tipo,
         'etapa_label': etapa_label,
-        'total_visitas': total_visitas,
         'ultimo_registro': ultimo_registro,
         'total_registros': total_registros,
         'historial_registros': historial_registros,
-        'calendar_headers': calendar_headers,
-        'weeks_paired': weeks_paired,
-        'current_month': f"{meses_es[fecha_calendario.month - 1].capitalize()} {fecha_calendario.year}",
+        'calendar_headers': CALENDAR_HEADERS,
+        'weeks_paired': list(grilla.pares),
+        'current_month': f"{MESES_ES[fecha_calendario.month - 1].capitalize()} {fecha_calendario.year}",
         'fecha_calendario': fecha_calendario,
         'mes_calendario': fecha_calendario.month,
         'anio_calendario': fecha_calendario.year,
-        'eventos_por_dia': eventos_por_dia,
-        'total_eventos_mes': len(eventos_mes),
-        'eventos_por_fecha': eventos_por_fecha,
-        'eventos_medicacion_por_fecha': eventos_medicacion_por_fecha,
-        'dosis_por_semana': dosis_por_semana,
-        'dias_con_medicacion': dias_con_medicacion,
         'today': today,
         'evento_form_perfil': EventoClinicoForm(),
-        'resumen_tratamiento': resumen_tratamiento,
-        'eventos_con_archivos': eventos_con_archivos,
         'filtro_fecha_desde': filtro_fecha_desde,
         'filtro_fecha_hasta': filtro_fecha_hasta,
         'filtro_tipo_evento': filtro_tipo_evento,
@@ -2323,7 +1541,7 @@ def desactivar_mascota_view(request, mascota_id):
 def actualizar_foto_perfil_banner_view(request):
     """Vista para actualizar la foto de perfil desde el banner"""
     if request.method == 'POST':
-        perfil, created = PerfilTutor.objects.get_or_create(user=request.user)
+        perfil = obtener_perfil_tutor(request)
         
         if 'foto_perfil' in request.FILES:
             perfil.foto_perfil = request.FILES['foto_perfil']
@@ -2413,3 +1631,238 @@ def agregar_peso_mascota_view(request, mascota_id):
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+
+@login_required
+@perfil_completo_required
+def historial_eventos_mascota_view(request, mascota_id):
+    """
+    Historial de eventos clínicos paginado por cursor (fecha_evento, id), del más reciente al más antiguo.
+    Acepta los filtros del historial, cursor, limite, hasta_hoy=1 y orden=relevancia (junto con buscar,
+    retorna una sola página ordenada por relevancia); responde JSON o, con formato=html,
+    el fragmento de tarjetas para el scroll infinito (con el cursor siguiente en X-Siguiente-Cursor).
+    """
+    try:
+        mascota = Mascota.objects.select_related('ficha_clinica').get(pk=mascota_id, tutor=request.user, activa=True)
+    except Mascota.DoesNotExist:
+        return JsonResponse({'error': 'Mascota no encontrada'}, status=404)
+    
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        ficha_ids = [mascota.ficha_clinica.pk]
+        eventos = mascota.ficha_clinica.eventos.all()
+    except FichaClinica.DoesNotExist:
+        ficha_ids = []
+        eventos = EventoClinico.objects.none()
+    
+    if request.GET.get('hasta_hoy') == '1':
+        eventos = eventos.filter(fecha_evento__lte=timezone.now().date())
+    eventos = filtrar_eventos(eventos, request.GET)
+    
+    limite = tamano_pagina(request.GET.get('limite'))
+    if request.GET.get('orden') == 'relevancia' and request.GET.get('buscar'):
+        # Resultados de la búsqueda de texto ordenados por relevancia (una sola página)
+        ids = buscar_eventos(request.GET['buscar'], ficha_ids=ficha_ids, limite=limite)
+        posicion = {evento_id: indice for indice, evento_id in enumerate(ids)}
+        ranking = sorted(eventos.filter(pk__in=ids), key=lambda evento: posicion[evento.pk])
+        eventos_con_archivos, _ = listar_eventos_con_archivos(ranking)
+        siguiente_cursor = None
+    else:
+        try:
+            eventos_con_archivos, siguiente_cursor = pagina_historial(
+                eventos,
+                cursor=request.GET.get('cursor'),
+                limite=limite,
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Cursor inválido'}, status=400)
+    
+    if request.GET.get('formato') == 'html':
+        response = render(request, 'registro/historial_eventos_parcial.html', {
+            'eventos_con_archivos': eventos_con_archivos,
+        })
+        response['X-Siguiente-Cursor'] = siguiente_cursor or ''
+        return response
+    
+    return JsonResponse({
+        'eventos': [evento_a_dict(item['evento'], item['archivos']) for item in eventos_con_archivos],
+        'siguiente_cursor': siguiente_cursor,
+        'hay_mas': siguiente_cursor is not None,
+    })
+
+
+MAX_RESULTADOS_BUSQUEDA_TUTOR = 500
+MAX_RESULTADOS_POR_MASCOTA = 20
+
+
+def _fecha_iso(valor):
+    # SQLite entrega las fechas de consultas crudas como texto
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor) if valor is not None else None
+
+
+def _lineas_busqueda_tutor(texto, tutor_id):
+    """Genera una línea JSON por mascota con sus resultados, a medida que se leen de la consulta"""
+    tipos_evento = dict(EventoClinico.TIPO_EVENTO_CHOICES)
+    grupo = None
+    total = 0
+    # El tope por mascota se aplica en la consulta, antes del límite global
+    for mascota_id, mascota_nombre, origen, objeto_id, fecha, tipo_evento, _ in resultados_tutor(
+        texto, tutor_id, limite=MAX_RESULTADOS_BUSQUEDA_TUTOR, por_mascota=MAX_RESULTADOS_POR_MASCOTA
+    ):
+        if grupo is None or grupo['mascota']['id'] != mascota_id:
+            if grupo is not None:
+                yield json.dumps(grupo) + '\n'
+            grupo = {
+                'mascota': {
+                    'id': mascota_id,
+                    'nombre': mascota_nombre,
+                    'url': reverse('bitacora_mascota', args=[mascota_id]),
+                },
+                'resultados': [],
+            }
+        grupo['resultados'].append({
+            'origen': origen,
+            'id': objeto_id,
+            'fecha': _fecha_iso(fecha),
+            'tipo_evento': tipo_evento,
+            'tipo_evento_display': tipos_evento.get(tipo_evento),
+        })
+        total += 1
+    if grupo is not None:
+        yield json.dumps(grupo) + '\n'
+    yield json.dumps({'fin': True, 'total': total}) + '\n'
+
+
+@login_required
+@perfil_completo_required
+def buscar_historial_tutor_view(request):
+    """
+    Búsqueda de texto en eventos (incluidos los nombres de sus adjuntos) y registros históricos de
+    todas las mascotas activas del tutor. Responde NDJSON: una línea por mascota (en orden alfabético,
+    resultados por relevancia) que se envía apenas se completa, y una línea final con el total.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    texto = request.GET.get('q', '').strip()
+    if not terminos_busqueda(texto):
+        return JsonResponse({'error': 'Ingresa un texto para buscar'}, status=400)
+    
+    response = StreamingHttpResponse(
+        _lineas_busqueda_tutor(texto, request.user.pk),
+        content_type='application/x-ndjson',
+    )
+    response['Cache-Control'] = 'no-store'
+    # Evitar que un proxy acumule la respuesta antes de enviarla
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def descargar_adjunto_view(request, adjunto_id):
+    """Entrega un archivo adjunto solo al tutor de la mascota (Range y ETag en descargas.py)"""
+    adjunto = get_object_or_404(
+        ArchivoAdjunto.objects.only('id', 'nombre', 'archivo', 'sha256'),
+        pk=adjunto_id,
+        evento_clinico__ficha_clinica__mascota__tutor=request.user,
+    )
+    return servir_archivo(
+        request,
+        adjunto.archivo.storage,
+        adjunto.archivo.name,
+        nombre_descarga=adjunto.nombre,
+        etag=adjunto.sha256 or None,
+        descargar='descargar' in request.GET,
+    )
+
+
+@login_required
+@perfil_completo_required
+def exportar_ficha_view(request, mascota_id):
+    """Descarga un ZIP con la ficha clínica completa (eventos, pesos, historial y adjuntos), generado mientras se envía"""
+    mascota = get_object_or_404(Mascota, pk=mascota_id, tutor=request.user)
+    response = StreamingHttpResponse(exportar_ficha_zip(mascota), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_exportacion(mascota)}"'
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@perfil_completo_required
+@csrf_protect
+def importar_mascotas_view(request):
+    """
+    Importa mascotas, pesos y eventos desde un CSV o JSON (campo archivo; simular=1 solo valida).
+    Responde JSON con las cantidades importadas y los errores por fila.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return JsonResponse({'error': 'Selecciona un archivo CSV o JSON'}, status=400)
+    if archivo.size > TAMANO_MAXIMO_IMPORTACION:
+        tamano_mb = TAMANO_MAXIMO_IMPORTACION / (1024 * 1024)
+        return JsonResponse({'error': f'El archivo excede el tamaño máximo permitido ({tamano_mb:.0f}MB)'}, status=400)
+    
+    try:
+        resultado = importar_archivo(archivo, request.user, nombre=archivo.name, simular=request.POST.get('simular') == '1')
+    except ErrorImportacion as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse(resultado.como_dict())
+
+
+@login_required
+def microchip_view(request, codigo):
+    """
+    Ficha de la mascota con el microchip (datos de la mascota y contacto del tutor), en una consulta
+    por el índice único del registro. Las clínicas (permiso consultar_microchip) ven cualquier chip;
+    los tutores, solo los de sus mascotas.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    registro = consulta_microchips(request.user).filter(codigo=normalizar_microchip(codigo)).first()
+    if registro is None:
+        return JsonResponse({'error': 'Microchip no registrado'}, status=404)
+    return JsonResponse(ficha_microchip(registro))
+
+
+@login_required
+@csrf_protect
+def buscar_microchips_view(request):
+    """
+    Búsqueda de varios microchips a la vez (lectores que escanean en lote). Recibe un JSON
+    {"codigos": [...]} o el campo codigos (separados por comas o saltos de línea) y responde
+    un resultado por código, en el mismo orden, consultando todos juntos.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    if request.content_type == 'application/json':
+        try:
+            codigos = json.loads(request.body or b'{}').get('codigos')
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'JSON inválido'}, status=400)
+    else:
+        codigos = [codigo for codigo in re.split(r'[,;\n]', request.POST.get('codigos', '')) if codigo.strip()]
+    
+    if not isinstance(codigos, list) or not codigos:
+        return JsonResponse({'error': 'Indica los microchips a buscar en "codigos"'}, status=400)
+    if len(codigos) > MAX_MICROCHIPS_POR_CONSULTA:
+        return JsonResponse({'error': f'Máximo {MAX_MICROCHIPS_POR_CONSULTA} microchips por consulta'}, status=400)
+    
+    return JsonResponse({'resultados': buscar_microchips(request.user, codigos)})
+
+
+def servir_media_view(request, ruta):
+    """MEDIA_URL en desarrollo (DEBUG), solo para las carpetas públicas: los adjuntos pasan por descargar_adjunto"""
+    # La ruta se normaliza antes de revisar la carpeta, para que '..' no salga de ella
+    if not es_ruta_publica(ruta):
+        raise Http404('El archivo no existe')
+    return servir_archivo(request, default_storage, normalizar_ruta(ruta))
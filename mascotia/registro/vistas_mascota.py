@@ -0,0 +1,107 @@
+"""
+Caché de las vistas calculadas de cada mascota (perfil de la mascota).
+
+Cada mascota tiene un número de versión en caché y las vistas se guardan con una clave que
+incluye esa versión, así que invalidarlas todas es un solo incr: las entradas anteriores
+dejan de leerse y expiran solas. Los receptores de models.py incrementan la versión cuando
+cambian los eventos, pesos, historial, ficha, vacunaciones o adjuntos de la mascota; quien
+escribe con bulk_create o update() (importación, adjuntos) la incrementa por su cuenta.
+
+Si la versión no está en caché (primer uso o desalojo) se crea a partir del reloj, de modo
+que nunca coincide con una versión anterior y no se pueden leer datos viejos.
+
+El esquema requiere un caché compartido por todos los procesos: con la memoria local
+(locmem) cada worker tendría su propia versión y no vería las invalidaciones de los demás,
+por lo que revisar_cache_compartido() lo rechaza fuera de DEBUG.
+"""
+
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import EventoClinico, FichaClinica
+
+
+# Las claves incluyen la fecha del día, así que no tiene sentido guardarlas por más tiempo
+CACHE_TIMEOUT_VISTAS_MASCOTA = 60 * 60 * 24
+
+
+def revisar_cache_compartido(app_configs, **kwargs):
+    """Check del sistema: el caché por defecto no puede ser locmem fuera de DEBUG"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if settings.DEBUG or not backend.endswith('LocMemCache'):
+        return []
+    return [
+        checks.Error(
+            'El caché por defecto es de memoria local: las versiones de las vistas, series de peso '
+            'y perfiles no se compartirían entre procesos.',
+            hint='Configura un caché compartido (DJANGO_REDIS_URL o DJANGO_CACHE_DIR, ver settings/base.py).',
+            id='registro.E001',
+        )
+    ]
+
+
+def cache_key_version_mascota(mascota_id):
+    return f'registro:vistas_mascota:version:{mascota_id}'
+
+
+def cache_key_vista_mascota(mascota_id, version, vista, partes):
+    return ':'.join(['registro:vistas_mascota', vista, str(mascota_id), str(version), *map(str, partes)])
+
+
+def version_mascota(mascota_id):
+    """Versión actual de las vistas de la mascota (la crea si no existe)"""
+    key = cache_key_version_mascota(mascota_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        # Si otro proceso la creó primero, se usa la suya
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidar_vistas_mascota(mascota_id):
+    """Incrementa la versión de la mascota (al confirmarse la transacción en curso)"""
+    def incrementar():
+        try:
+            cache.incr(cache_key_version_mascota(mascota_id))
+        except ValueError:
+            # Sin versión en caché: la próxima lectura crea una nueva
+            pass
+    transaction.on_commit(incrementar)
+
+
+def invalidar_vistas_ficha(ficha_id):
+    """Como invalidar_vistas_mascota, a partir de la ficha clínica"""
+    mascota_id = FichaClinica.objects.filter(pk=ficha_id).values_list('mascota_id', flat=True).first()
+    if mascota_id is not None:
+        invalidar_vistas_mascota(mascota_id)
+
+
+def invalidar_vistas_evento(evento_id):
+    """Como invalidar_vistas_mascota, a partir de un evento clínico"""
+    mascota_id = (
+        EventoClinico.objects.filter(pk=evento_id)
+        .values_list('ficha_clinica__mascota_id', flat=True)
+        .first()
+    )
+    if mascota_id is not None:
+        invalidar_vistas_mascota(mascota_id)
+
+
+def vista_mascota(mascota_id, vista, partes, calcular):
+    """
+    Retorna el resultado de calcular() para la vista de la mascota, desde el caché si la
+    mascota no cambió. `partes` completa la clave con lo que además define el resultado
+    (fecha del día, mes del calendario...). El resultado debe poder serializarse con pickle.
+    """
+    key = cache_key_vista_mascota(mascota_id, version_mascota(mascota_id), vista, partes)
+    datos = cache.get(key)
+    if datos is None:
+        datos = calcular()
+        cache.set(key, datos, CACHE_TIMEOUT_VISTAS_MASCOTA)
+    return datos
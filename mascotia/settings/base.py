@@ -104,6 +104,54 @@ LOGOUT_REDIRECT_URL = 'login'
 
 
 
+# Caché compartido entre procesos: las vistas de mascota, las series de peso y los perfiles
+# se invalidan incrementando un número de versión en caché (ver registro/vistas_mascota.py),
+# que todos los workers deben ver. Con DJANGO_REDIS_URL se usa Redis (incr atómico, necesario
+# con varios servidores); si no, archivos en DJANGO_CACHE_DIR. La memoria local (locmem) no
+# sirve fuera de un único proceso de desarrollo.
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+            'KEY_PREFIX': 'mascotia',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_DIR', str(BASE_DIR / 'cache')),
+        }
+    }
+
+
+# Correo y recordatorios (ver registro/recordatorios.py)
+# Por defecto los correos se escriben en la consola; en producción se configura SMTP
+# (o filebased para guardarlos en archivos) con DJANGO_EMAIL_BACKEND
+
+EMAIL_BACKEND = os.environ.get('DJANGO_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DJANGO_DEFAULT_FROM_EMAIL', 'MascotIA <no-responder@mascotia.cl>')
+RECORDATORIOS_BACKEND = 'mascotia.registro.recordatorios.BackendCorreo'
+
+
+# Subida de archivos: los adjuntos de eventos se validan y escriben a disco mientras se reciben
+# (ver registro/adjuntos.py); el resto de los archivos usa los handlers por defecto
+
+FILE_UPLOAD_HANDLERS = [
+    'mascotia.registro.adjuntos.AdjuntoUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Descarga de adjuntos (ver registro/descargas.py): vacío para que Django envíe el archivo,
+# 'x-accel-redirect' (nginx, ubicación internal en ARCHIVOS_ENVIO_PREFIJO) o 'x-sendfile'
+ARCHIVOS_ENVIO = os.environ.get('DJANGO_ARCHIVOS_ENVIO', '')
+ARCHIVOS_ENVIO_PREFIJO = '/media-protegida/'
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
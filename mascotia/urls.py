@@ -1,7 +1,8 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -11,5 +12,8 @@ urlpatterns = [
 if settings.DEBUG:
     from django.contrib.staticfiles.urls import staticfiles_urlpatterns
     urlpatterns += staticfiles_urlpatterns()
-    # Servir archivos media en desarrollo
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    from mascotia.registro.views import servir_media_view
+    # Servir archivos media en desarrollo (con Range y ETag; los adjuntos solo por descargar_adjunto)
+    urlpatterns += [
+        re_path(r'^%s(?P<ruta>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), servir_media_view),
+    ]